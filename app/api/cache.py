@@ -0,0 +1,245 @@
+"""
+Cache das respostas de leitura, invalidado pela versão dos dados
+
+Cada ingestão incrementa um contador de versão; as chaves do cache incluem a
+versão, então respostas antigas deixam de ser usadas sem precisar apagá-las.
+O ETag é derivado de (dados, rota, parâmetros): um If-None-Match igual
+responde 304 sem calcular nem ler o corpo. Os dados são identificados pela
+versão (`data_tag`), que precisa significar o mesmo em todos os processos
+que respondem à mesma URL.
+
+Backends: Redis (compartilhado entre instâncias) e LRU em memória limitado por
+tamanho (testes e instância única).
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.api import codec, metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """Armazena corpos de resposta (bytes) e o contador de versão dos dados"""
+
+    name = "base"
+
+    def ping(self) -> bool:
+        """Verifica se o cache responde"""
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+    def version(self) -> int:
+        """Versão atual dos dados"""
+        raise NotImplementedError
+
+    def bump_version(self) -> int:
+        """Marca os dados como alterados e retorna a nova versão"""
+        raise NotImplementedError
+
+    def data_tag(self, version: int) -> str:
+        """Identificação dos dados no ETag; a versão basta se ela é compartilhada"""
+        return str(version)
+
+
+class MemoryCache(CacheBackend):
+    """
+    LRU em memória com limite de entradas e de bytes.
+
+    A versão é do processo: com vários workers, a mesma versão descreve dados
+    diferentes. O ETag usa `identity()` (dados iguais em todos os workers, ex.:
+    vendas publicadas no store compartilhado) ou, sem ela, só vale no processo.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 identity: Optional[Callable[[], str]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.identity = identity
+        self._token = uuid.uuid4().hex
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def version(self) -> int:
+        return self._version
+
+    def bump_version(self) -> int:
+        with self._lock:
+            self._version += 1
+            # Entradas de versões anteriores nunca mais serão lidas
+            self._entries.clear()
+            self._bytes = 0
+            return self._version
+
+    def data_tag(self, version: int) -> str:
+        if self.identity is not None:
+            return self.identity()
+        return f"{self._token}:{version}"
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache no Redis, com a versão em uma chave compartilhada (INCR).
+
+    Entradas expiram após `ttl` segundos; falhas do Redis são registradas e
+    tratadas como ausência de cache.
+    """
+
+    name = "redis"
+
+    VERSION_KEY = "sales:data_version"
+
+    def __init__(self, url: str, ttl: int = 300, prefix: str = "sales:response:"):
+        import redis
+
+        self._errors = redis.RedisError
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except self._errors:
+            return False
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self.prefix + key)
+        except self._errors as e:
+            logger.warning(f"Redis indisponível ao ler cache: {e}")
+            return None
+
+    def set(self, key: str, value: bytes):
+        try:
+            self.client.set(self.prefix + key, value, ex=self.ttl)
+        except self._errors as e:
+            logger.warning(f"Redis indisponível ao gravar cache: {e}")
+
+    def version(self) -> int:
+        try:
+            return int(self.client.get(self.VERSION_KEY) or 0)
+        except self._errors as e:
+            logger.warning(f"Redis indisponível ao ler versão: {e}")
+            return -1
+
+    def bump_version(self) -> int:
+        try:
+            return int(self.client.incr(self.VERSION_KEY))
+        except self._errors as e:
+            logger.warning(f"Redis indisponível ao incrementar versão: {e}")
+            return -1
+
+
+def create_cache(kind: str, redis_url: Optional[str] = None, ttl: int = 300, max_bytes: int = 64 * 1024 * 1024,
+                 identity: Optional[Callable[[], str]] = None) -> CacheBackend:
+    """
+    Backend de cache pelo nome ("redis" ou "memory"); sem Redis acessível, usa
+    memória. `identity`: ver MemoryCache.
+    """
+    if kind == "redis" and redis_url:
+        try:
+            cache = RedisCache(redis_url, ttl=ttl)
+            if cache.ping():
+                return cache
+            logger.warning(f"Redis em {redis_url} não respondeu; usando cache em memória")
+        except ImportError:
+            logger.warning("Pacote redis não instalado; usando cache em memória")
+    return MemoryCache(max_bytes=max_bytes, identity=identity)
+
+
+def cache_key(endpoint: str, params: dict) -> str:
+    """Chave estável a partir da rota e dos parâmetros já resolvidos"""
+    return endpoint + "?" + json.dumps(params, sort_keys=True, default=str, separators=(",", ":"))
+
+
+def make_etag(data_tag: str, key: str) -> str:
+    digest = hashlib.blake2b(f"{data_tag}:{key}".encode("utf-8"), digest_size=8).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+@metrics.timed("serialize.json")
+def render_json(content) -> bytes:
+    """Corpo JSON com o codec configurado (app.api.codec)"""
+    return codec.dumps(content)
+
+
+def cached_json(cache: CacheBackend, request: Request, endpoint: str, params: dict, compute: Callable[[], object]) -> Response:
+    """
+    Resposta JSON de `compute()` passando pelo cache.
+
+    Com If-None-Match igual ao ETag atual retorna 304 sem corpo; senão usa o
+    corpo em cache da versão atual ou calcula e grava.
+    """
+    version = cache.version()
+    if version < 0:
+        # Versão desconhecida (cache fora do ar): calcula sem ETag
+        return Response(render_json(compute()), media_type="application/json")
+
+    key = cache_key(endpoint, params)
+    etag = make_etag(cache.data_tag(version), key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        metrics.CACHE_REQUESTS.inc(endpoint, "not_modified")
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(f"{version}:{key}")
+    headers["X-Cache"] = "HIT" if body is not None else "MISS"
+    metrics.CACHE_REQUESTS.inc(endpoint, "hit" if body is not None else "miss")
+    if body is None:
+        body = render_json(compute())
+        cache.set(f"{version}:{key}", body)
+    return Response(body, media_type="application/json", headers=headers)
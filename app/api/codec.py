@@ -0,0 +1,222 @@
+"""
+Serialização JSON das respostas e dos lotes recebidos
+
+Por padrão usa o json da biblioteca padrão, com a mesma saída do JSONResponse
+do FastAPI. Com `configure("orjson")` (JSON_CODEC=orjson):
+
+- respostas são serializadas pelo orjson (mesmos bytes, exceto NaN e
+  infinito, que viram null em vez de erro);
+- páginas de /api/v1/sales e o NDJSON são montados direto das colunas do
+  store, sem um dict por venda: cada texto distinto é serializado uma vez e
+  os números saem do vetor inteiro numa única chamada;
+- lotes de /api/v1/sales/batch vão do corpo direto para colunas, com a
+  validação de tipos do SaleItem feita por coluna (`decode_sales`).
+"""
+
+import json
+import logging
+import threading
+import weakref
+from typing import List
+
+import numpy as np
+from fastapi.responses import Response
+
+from app.api.store import SalesStore, day_to_iso
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional: sem ele vale a serialização da biblioteca padrão
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ("json", "orjson")
+
+# Campos de cada venda (SaleItem), na ordem das respostas
+SALE_FIELDS = ("date", "product", "category", "amount", "quantity", "customer")
+TEXT_FIELDS = {"date": False, "product": False, "category": False, "customer": True}
+
+_fast = False
+
+
+def configure(kind: str) -> str:
+    """Escolhe o codec ("json" ou "orjson"); retorna o que ficou em uso"""
+    global _fast
+    if kind not in CODECS:
+        raise ValueError(f"Codec JSON desconhecido: {kind} (use {', '.join(CODECS)})")
+    if kind == "orjson" and orjson is None:
+        logger.warning("Pacote orjson não instalado; usando o json da biblioteca padrão")
+        kind = "json"
+    _fast = kind == "orjson"
+    return kind
+
+
+def fast() -> bool:
+    return _fast
+
+
+def dumps(content) -> bytes:
+    """JSON compacto em UTF-8 (mesma saída do JSONResponse do FastAPI)"""
+    if _fast:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(body: bytes):
+    if _fast:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class JsonResponse(Response):
+    """JSONResponse com o codec configurado"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# Respostas: vendas do store
+
+# JSON dos textos de cada Dictionary do store, já com a chave do campo, por código
+_fragments: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_fragments_lock = threading.Lock()
+
+# Linhas juntadas por vez (bytes.join aloca uma estrutura por pedaço)
+JOIN_ROWS = 4096
+
+
+def _numbers(values: np.ndarray, key: bytes) -> List[bytes]:
+    """`key` + JSON de cada número do vetor (uma única chamada ao orjson)"""
+    data = orjson.dumps(np.ascontiguousarray(values), option=orjson.OPT_SERIALIZE_NUMPY)[1:-1]
+    return (key + data.replace(b",", b"\n" + key)).split(b"\n")
+
+
+def _texts(codes: np.ndarray, dictionary, key: bytes) -> List[bytes]:
+    """`key` + JSON de cada texto codificado; cada texto do dicionário é serializado uma única vez"""
+    with _fragments_lock:
+        # Posição 0 = código -1 (nulo); os dicionários só crescem, então a tabela só é estendida
+        table = _fragments.setdefault(dictionary, {}).setdefault(key, [key + b"null"])
+        if len(table) <= len(dictionary):
+            table.extend(key + orjson.dumps(value) for value in dictionary.values[len(table) - 1:])
+    return [table[code] for code in (codes + 1).tolist()]
+
+
+def _dates(days: np.ndarray, key: bytes) -> List[bytes]:
+    first = int(days.min())
+    texts = day_to_iso(np.arange(first, int(days.max()) + 1)).tolist()
+    table = np.array([key + f'"{text}"'.encode() for text in texts], dtype=object)
+    return table[days - first].tolist()
+
+
+def _row_pieces(store: SalesStore, start: int, stop: int, separator: bytes) -> List[bytes]:
+    """Pedaços das linhas [start, stop) como objetos JSON, cada um seguido de `separator`"""
+    view = store.snapshot()
+    rows = slice(start, stop)
+    columns = [
+        _dates(view.column("day")[rows], b'{"date":'),
+        _texts(view.column("product")[rows], view.products, b',"product":'),
+        _texts(view.column("category")[rows], view.categories, b',"category":'),
+        _numbers(view.column("amount")[rows], b',"amount":'),
+        _numbers(view.column("quantity")[rows], b',"quantity":'),
+        _texts(view.column("customer")[rows], view.customers, b',"customer":'),
+    ]
+    n, width = stop - start, len(columns) + 1
+    pieces = [b"}" + separator] * (n * width)
+    for i, column in enumerate(columns):
+        pieces[i::width] = column
+    return pieces
+
+
+def _join(pieces: List[bytes], width: int = 7) -> bytes:
+    step = JOIN_ROWS * width
+    return b"".join([b"".join(pieces[i:i + step]) for i in range(0, len(pieces), step)])
+
+
+def encode_records(store, start: int, stop: int) -> bytes:
+    """Vendas [start, stop) como lista JSON no formato do SaleItem"""
+    if not _fast:
+        return dumps(store.records(start, stop))
+    if not isinstance(store, SalesStore):
+        return orjson.dumps(store.records(start, stop))
+    if stop <= start:
+        return b"[]"
+    pieces = _row_pieces(store, start, stop, b",")
+    pieces[0] = b"[" + pieces[0]
+    pieces[-1] = b"}]"
+    return _join(pieces)
+
+
+def encode_ndjson(store, start: int, stop: int) -> bytes:
+    """Vendas [start, stop) como NDJSON (uma venda por linha)"""
+    if not _fast:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in store.records(start, stop)).encode("utf-8")
+    if not isinstance(store, SalesStore):
+        return b"".join(orjson.dumps(row) + b"\n" for row in store.records(start, stop))
+    if stop <= start:
+        return b""
+    return _join(_row_pieces(store, start, stop, b"\n"))
+
+
+# Lotes recebidos
+
+def _check_texts(values: list, name: str, optional: bool):
+    """Textos como no SaleItem: números viram texto, nulo só em campo opcional"""
+    for i, value in enumerate(values):
+        if type(value) is str:
+            continue
+        if value is None and optional:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[i] = str(value)
+            continue
+        problem = "obrigatório" if value is None else "deve ser texto"
+        raise ValueError(f"Venda {i}: campo '{name}' {problem}")
+
+
+def _to_numbers(values: list, name: str, dtype, bounds=None) -> np.ndarray:
+    """
+    Números como no SaleItem (aceita texto numérico; float em campo inteiro é
+    truncado); `bounds` (np.iinfo) = limites da coluna no store.
+    """
+    convert = float if dtype is np.float64 else int
+    for i, value in enumerate(values):
+        if type(value) in (int, float):
+            continue
+        try:
+            if not isinstance(value, (str, bool)):
+                raise TypeError
+            values[i] = convert(value)
+        except (TypeError, ValueError):
+            problem = "obrigatório" if value is None else "deve ser numérico"
+            raise ValueError(f"Venda {i}: campo '{name}' {problem}") from None
+    try:
+        numbers = np.array(values, dtype=dtype)
+    except OverflowError:
+        raise ValueError(f"Campo '{name}' fora do intervalo") from None
+    # O store guarda em tipo menor: fora dos limites, o valor daria a volta na conversão
+    if bounds is not None and len(numbers) and (numbers.min() < bounds.min or numbers.max() > bounds.max):
+        raise ValueError(f"Campo '{name}' fora do intervalo")
+    return numbers
+
+
+def decode_sales(body: bytes) -> dict:
+    """
+    Lote JSON (lista de vendas no formato do SaleItem) direto para colunas,
+    como `records_to_columns`; ValueError com a primeira venda inválida.
+    """
+    try:
+        items = loads(body)
+    except ValueError as e:
+        raise ValueError(f"JSON inválido: {e}") from None
+    if not isinstance(items, list) or any(type(item) is not dict for item in items):
+        raise ValueError("O corpo deve ser uma lista de vendas (objetos JSON)")
+    columns = {name: [item.get(name) for item in items] for name in SALE_FIELDS}
+    for name, optional in TEXT_FIELDS.items():
+        _check_texts(columns[name], name, optional)
+    columns["amount"] = _to_numbers(columns["amount"], "amount", np.float64)
+    columns["quantity"] = _to_numbers(columns["quantity"], "quantity", np.int64,
+                                      np.iinfo(SalesStore.COLUMNS["quantity"]))
+    return columns
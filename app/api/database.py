@@ -0,0 +1,497 @@
+"""
+Armazenamento das vendas em banco relacional (PostgreSQL em produção, SQLite em testes)
+"""
+
+import csv
+import io
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import (
+    Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, Numeric, String, Table,
+    cast, create_engine, func, inspect, literal, or_, select,
+)
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.api.storage import SalesBackend
+from app.api.store import day_to_iso, parse_days, parse_quantities
+
+# Mesmo esquema criado por scripts/init_db.py (mais a tabela de clientes)
+metadata = MetaData()
+
+# No SQLite, datas e horas gravadas no formato de CURRENT_TIMESTAMP, para que
+# valores do servidor e parâmetros sejam comparáveis como texto
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+products = Table(
+    "products", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(100)),
+    Column("category", String(50)),
+    Column("price", Numeric(10, 2, asdecimal=False)),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+)
+
+customers = Table(
+    "customers", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("name", String(100), unique=True),
+)
+
+sales = Table(
+    "sales", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("product_id", Integer, ForeignKey("products.id")),
+    Column("quantity", Integer),
+    # Valor unitário como recebido; total_amount é arredondado em centavos.
+    # Nulo em vendas gravadas antes da coluna existir (valor = total / quantidade)
+    Column("amount", Float),
+    Column("total_amount", Numeric(12, 2, asdecimal=False)),
+    Column("sale_date", Date, index=True),
+    Column("customer_id", Integer),
+    # Indexado para a extração incremental por marca d'água
+    Column("created_at", Timestamp, server_default=func.current_timestamp(), index=True),
+)
+
+# Resumos por dia (partição = sale_date), gravados pelo pipeline do Airflow (data_pipeline/sales_etl.py)
+daily_summary = Table(
+    "sales_daily_summary", metadata,
+    Column("sale_date", Date, primary_key=True),
+    Column("revenue", Numeric(14, 2, asdecimal=False)),
+    Column("orders", Integer),
+    Column("quantity", Integer),
+    Column("customers", Integer),
+)
+
+category_daily_summary = Table(
+    "sales_category_daily_summary", metadata,
+    Column("sale_date", Date, primary_key=True),
+    Column("category", String(50), primary_key=True),
+    Column("revenue", Numeric(14, 2, asdecimal=False)),
+    Column("orders", Integer),
+    Column("quantity", Integer),
+    Column("customers", Integer),
+)
+
+product_daily_summary = Table(
+    "sales_product_daily_summary", metadata,
+    Column("sale_date", Date, primary_key=True),
+    Column("product_id", Integer, primary_key=True),
+    Column("product", String(100)),
+    Column("category", String(50)),
+    Column("revenue", Numeric(14, 2, asdecimal=False)),
+    Column("orders", Integer),
+    Column("quantity", Integer),
+)
+
+# Marca d'água de cada pipeline incremental: última venda (created_at, id) já processada
+etl_state = Table(
+    "etl_state", metadata,
+    Column("pipeline", String(50), primary_key=True),
+    Column("last_created_at", Timestamp),
+    Column("last_sale_id", Integer),
+    Column("updated_at", Timestamp, server_default=func.current_timestamp()),
+)
+
+# Colunas gravadas na inserção em lote, na ordem do COPY/executemany
+SALES_COPY_COLUMNS = ["product_id", "quantity", "amount", "total_amount", "sale_date", "customer_id"]
+
+# Configuração do pool de conexões (variáveis de ambiente)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Linhas por executemany/COPY
+INSERT_CHUNK_ROWS = 50_000
+
+
+def make_engine(url: str, pool_size: int = POOL_SIZE, max_overflow: int = MAX_OVERFLOW):
+    """
+    Cria o engine com pool configurado e pre-ping.
+
+    SQLite em memória usa uma única conexão compartilhada (StaticPool) para que
+    todas as sessões vejam os mesmos dados.
+    """
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+        return create_engine(
+            url, connect_args=connect_args, poolclass=QueuePool,
+            pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True,
+        )
+    return create_engine(
+        url, pool_size=pool_size, max_overflow=max_overflow,
+        pool_pre_ping=True, pool_recycle=POOL_RECYCLE,
+    )
+
+
+def add_missing_columns(engine):
+    """Acrescenta às tabelas já existentes as colunas novas do esquema (ex.: sales.amount)"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                    )
+
+
+def insert_sales_frame(conn, frame: pd.DataFrame):
+    """
+    Grava em lote um DataFrame com as colunas de SALES_COPY_COLUMNS.
+
+    PostgreSQL usa COPY FROM STDIN; os demais bancos usam executemany direto
+    no driver (um INSERT preparado por bloco).
+    """
+    if conn.dialect.name == "postgresql":
+        _copy(conn, frame)
+    else:
+        _executemany(conn, frame)
+
+
+def _executemany(conn, frame: pd.DataFrame):
+    """Inserção em lote via executemany direto no driver"""
+    placeholder = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+    statement = (
+        f"INSERT INTO sales ({', '.join(SALES_COPY_COLUMNS)}) "
+        f"VALUES ({', '.join([placeholder] * len(SALES_COPY_COLUMNS))})"
+    )
+    customer_id = frame["customer_id"]
+    rows = list(zip(
+        frame["product_id"].tolist(),
+        frame["quantity"].tolist(),
+        frame["amount"].tolist(),
+        frame["total_amount"].tolist(),
+        frame["sale_date"].tolist(),
+        customer_id.astype(object).where(customer_id.notna(), None).tolist(),
+    ))
+    for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+        conn.exec_driver_sql(statement, rows[start:start + INSERT_CHUNK_ROWS])
+
+
+def _copy(conn, frame: pd.DataFrame):
+    """Inserção em lote via COPY FROM STDIN (PostgreSQL/psycopg2)"""
+    cursor = conn.connection.cursor()
+    try:
+        for start in range(0, len(frame), INSERT_CHUNK_ROWS):
+            buffer = io.StringIO()
+            frame.iloc[start:start + INSERT_CHUNK_ROWS][SALES_COPY_COLUMNS].to_csv(
+                buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL, na_rep=""
+            )
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY sales ({', '.join(SALES_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+    finally:
+        cursor.close()
+
+
+class SqlBackend(SalesBackend):
+    """
+    Vendas gravadas em lote nas tabelas products/customers/sales e agregadas no banco.
+
+    Com `use_summaries`, totais, série diária e categorias vêm das tabelas de
+    resumo por dia do pipeline (data_pipeline/sales_etl.py) em vez de varrer
+    `sales`; ficam atrasados até a próxima execução do pipeline.
+    """
+
+    name = "sql"
+
+    def __init__(self, url: str, use_summaries: bool = False, **engine_options):
+        self.engine = make_engine(url, **engine_options)
+        self.use_summaries = use_summaries
+        metadata.create_all(self.engine)
+        add_missing_columns(self.engine)
+
+    def ping(self):
+        with self.engine.connect() as conn:
+            conn.execute(select(literal(1))).scalar()
+
+    def close(self):
+        self.engine.dispose()
+
+    # Escrita
+
+    def _resolve_ids(self, conn, table, key_columns: List[str], keys: pd.DataFrame, extra: Dict[str, np.ndarray] = None) -> np.ndarray:
+        """Ids das chaves distintas do lote, inserindo em lote as que ainda não existem"""
+        cols = [table.c[name] for name in key_columns]
+        existing = {}
+        for start in range(0, len(keys), 500):
+            part = keys.iloc[start:start + 500]
+            query = select(table.c.id, *cols).where(cols[0].in_(part[key_columns[0]].unique().tolist()))
+            for row in conn.execute(query):
+                existing[tuple(row[1:])] = row[0]
+
+        lookup = [tuple(values) for values in keys[key_columns].itertuples(index=False)]
+        missing = [i for i, key in enumerate(lookup) if key not in existing]
+        if missing:
+            rows = []
+            for i in missing:
+                row = dict(zip(key_columns, lookup[i]))
+                for name, values in (extra or {}).items():
+                    row[name] = values[i]
+                rows.append(row)
+            conn.execute(table.insert(), rows)
+            query = select(table.c.id, *cols).where(cols[0].in_(sorted({lookup[i][0] for i in missing})))
+            for row in conn.execute(query):
+                existing.setdefault(tuple(row[1:]), row[0])
+        return np.array([existing[key] for key in lookup], dtype=np.int64)
+
+    def append_columns(self, columns: dict) -> int:
+        day = parse_days(columns["date"])
+        n = len(day)
+        if n == 0:
+            return 0
+        amount = np.asarray(columns["amount"], dtype=np.float64)
+        # A coluna quantity é INTEGER (32 bits no PostgreSQL), como no store
+        quantity = parse_quantities(columns["quantity"]).astype(np.int64)
+        product = np.asarray(columns["product"], dtype=object)
+        category = np.asarray(columns["category"], dtype=object)
+        customer = columns.get("customer")
+        customer = np.full(n, None, dtype=object) if customer is None else np.asarray(customer, dtype=object)
+
+        with self.engine.begin() as conn:
+            # Produtos e clientes: uma consulta/inserção por valor distinto, não por venda
+            product_codes, product_keys = pd.factorize(pd.MultiIndex.from_arrays([product, category]))
+            product_keys = product_keys.to_frame(index=False, name=["name", "category"])
+            first_price = pd.Series(amount).groupby(product_codes).first().to_numpy()
+            product_ids = self._resolve_ids(conn, products, ["name", "category"], product_keys, {"price": first_price})[product_codes]
+
+            customer_codes, customer_names = pd.factorize(customer)
+            customer_ids = np.full(n, -1, dtype=np.int64)
+            if len(customer_names):
+                ids = self._resolve_ids(conn, customers, ["name"], pd.DataFrame({"name": customer_names}))
+                customer_ids[customer_codes >= 0] = ids[customer_codes[customer_codes >= 0]]
+
+            frame = pd.DataFrame({
+                "product_id": product_ids,
+                "quantity": quantity,
+                "amount": amount,
+                "total_amount": np.round(amount * quantity, 2),
+                "sale_date": day_to_iso(day),
+                "customer_id": pd.Series(customer_ids, dtype="Int64").mask(customer_ids < 0),
+            })
+            insert_sales_frame(conn, frame)
+        return n
+
+    # Leitura (agregação no banco)
+
+    def count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(sales)).scalar()
+
+    def kpis(self) -> dict:
+        if self.use_summaries:
+            query = select(
+                func.coalesce(func.sum(daily_summary.c.revenue), 0),
+                func.coalesce(func.sum(daily_summary.c.orders), 0),
+                func.coalesce(func.sum(daily_summary.c.quantity), 0),
+            )
+        else:
+            query = select(
+                func.coalesce(func.sum(sales.c.total_amount), 0),
+                func.count(sales.c.id),
+                func.coalesce(func.sum(sales.c.quantity), 0),
+            )
+        with self.engine.connect() as conn:
+            revenue, orders, quantity = conn.execute(query).one()
+        return {"total_revenue": float(revenue), "total_orders": int(orders), "total_quantity": int(quantity)}
+
+    def daily(self, start_day: int, end_day: int):
+        length = max(end_day - start_day + 1, 0)
+        revenue = np.zeros(length)
+        orders = np.zeros(length, dtype=np.int64)
+        if length == 0:
+            return revenue, orders
+        start, end = day_to_iso([start_day, end_day]).tolist()
+        between = (pd.Timestamp(start).date(), pd.Timestamp(end).date())
+        if self.use_summaries:
+            query = (
+                select(daily_summary.c.sale_date, daily_summary.c.revenue, daily_summary.c.orders)
+                .where(daily_summary.c.sale_date.between(*between))
+            )
+        else:
+            query = (
+                select(sales.c.sale_date, func.sum(sales.c.total_amount), func.count(sales.c.id))
+                .where(sales.c.sale_date.between(*between))
+                .group_by(sales.c.sale_date)
+            )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        if rows:
+            offset = parse_days([row[0] for row in rows], bounded=False) - start_day
+            revenue[offset] = [float(row[1]) for row in rows]
+            orders[offset] = [int(row[2]) for row in rows]
+        return revenue, orders
+
+    def day_bounds(self) -> Optional[Tuple[int, int]]:
+        query = select(func.min(sales.c.sale_date), func.max(sales.c.sale_date))
+        with self.engine.connect() as conn:
+            first, last = conn.execute(query).one()
+        if first is None:
+            return None
+        first, last = parse_days([first, last], bounded=False).tolist()
+        return first, last
+
+    def by_category(self) -> List[dict]:
+        if self.use_summaries:
+            # Clientes distintos não se somam entre dias: indisponível nos resumos
+            summary = category_daily_summary
+            query = (
+                select(summary.c.category, func.sum(summary.c.revenue), func.sum(summary.c.quantity))
+                .group_by(summary.c.category)
+                .order_by(func.min(summary.c.sale_date), summary.c.category)
+            )
+            with self.engine.connect() as conn:
+                return [
+                    {"category": category, "revenue": float(revenue), "quantity": int(quantity), "customers": None}
+                    for category, revenue, quantity in conn.execute(query)
+                ]
+        query = (
+            select(
+                products.c.category, func.sum(sales.c.total_amount), func.sum(sales.c.quantity),
+                func.count(func.distinct(sales.c.customer_id)),
+            )
+            .select_from(sales.join(products, sales.c.product_id == products.c.id))
+            .group_by(products.c.category)
+            .order_by(func.min(sales.c.id))
+        )
+        with self.engine.connect() as conn:
+            return [
+                {"category": category, "revenue": float(revenue), "quantity": int(quantity), "customers": int(customers_count)}
+                for category, revenue, quantity, customers_count in conn.execute(query)
+            ]
+
+    def activity(self, start_day: int, end_day: int) -> dict:
+        if end_day < start_day:
+            return {"revenue": 0.0, "orders": 0, "customers": 0}
+        start, end = pd.to_datetime(day_to_iso([start_day, end_day])).date
+        query = select(
+            func.coalesce(func.sum(sales.c.total_amount), 0),
+            func.count(sales.c.id),
+            func.count(func.distinct(sales.c.customer_id)),
+        ).where(sales.c.sale_date.between(start, end))
+        with self.engine.connect() as conn:
+            revenue, orders, customers_count = conn.execute(query).one()
+        return {"revenue": float(revenue), "orders": int(orders), "customers": int(customers_count)}
+
+    def ticket_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Optional[float]]:
+        with self.engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                query = select(
+                    *[func.percentile_cont(p / 100).within_group(sales.c.total_amount) for p in percentiles]
+                )
+                values = list(conn.execute(query).one())
+            else:
+                # Sem percentile_cont (SQLite): uma única ordenação numerada (função de
+                # janela) traz os dois valores vizinhos da posição q·(n - 1) de cada
+                # percentil, interpolados como no PERCENTILE_CONT
+                ordered = select(
+                    sales.c.total_amount.label("value"),
+                    (func.row_number().over(order_by=sales.c.total_amount) - 1).label("position"),
+                    func.count().over().label("total"),
+                ).subquery()
+                wanted = []
+                for p in percentiles:
+                    lower = cast(p / 100 * (ordered.c.total - 1), Integer)
+                    wanted += [ordered.c.position == lower, ordered.c.position == lower + 1]
+                rows = conn.execute(
+                    select(ordered.c.position, ordered.c.value, ordered.c.total).where(or_(*wanted))
+                ).all()
+                found = {int(row.position): float(row.value) for row in rows}
+                total = int(rows[0].total) if rows else 0
+                values = []
+                for p in percentiles:
+                    if not total:
+                        values.append(None)
+                        continue
+                    position = p / 100 * (total - 1)
+                    lower = int(position)
+                    upper = found.get(lower + 1, found[lower])
+                    values.append(found[lower] + (upper - found[lower]) * (position - lower))
+        return {f"p{p}": None if value is None else round(float(value), 2) for p, value in zip(percentiles, values)}
+
+    def top(self, by: str, metric: str, n: int, start_day: Optional[int] = None,
+            end_day: Optional[int] = None) -> List[dict]:
+        source = sales.join(products, sales.c.product_id == products.c.id)
+        if by == "customer":
+            source = source.join(customers, sales.c.customer_id == customers.c.id)
+        key = {"product": products.c.name, "category": products.c.category, "customer": customers.c.name}[by]
+        revenue = func.sum(sales.c.total_amount)
+        quantity = func.sum(sales.c.quantity)
+        query = (
+            select(key, revenue, quantity, func.count(sales.c.id))
+            .select_from(source)
+            .group_by(key)
+            .order_by((revenue if metric == "revenue" else quantity).desc(), key)
+            .limit(n)
+        )
+        if start_day is not None:
+            query = query.where(sales.c.sale_date >= pd.to_datetime(day_to_iso([start_day])).date[0])
+        if end_day is not None:
+            query = query.where(sales.c.sale_date <= pd.to_datetime(day_to_iso([end_day])).date[0])
+        with self.engine.connect() as conn:
+            return [
+                {by: name, "revenue": round(float(total), 2), "quantity": int(items), "orders": int(orders)}
+                for name, total, items, orders in conn.execute(query)
+            ]
+
+    def detail(self) -> dict:
+        # Vendas antigas sem valor unitário: total / quantidade
+        unit = func.coalesce(sales.c.amount, sales.c.total_amount / func.nullif(sales.c.quantity, 0))
+        query = select(
+            func.coalesce(func.avg(unit), 0),
+            func.coalesce(func.sum(sales.c.quantity), 0),
+            func.count(func.distinct(sales.c.product_id)),
+        )
+        with self.engine.connect() as conn:
+            average, items, products_count = conn.execute(query).one()
+        return {"average_amount": float(average), "total_items": int(items), "unique_products": int(products_count)}
+
+    def iter_columns(self, chunk_rows: int = INSERT_CHUNK_ROWS) -> Iterator[dict]:
+        """Lê todas as vendas em blocos de colunas (para carregar o store na inicialização)"""
+        query = (
+            select(
+                sales.c.sale_date, products.c.name, products.c.category,
+                sales.c.amount, sales.c.total_amount, sales.c.quantity, customers.c.name,
+            )
+            .select_from(
+                sales.join(products, sales.c.product_id == products.c.id)
+                .outerjoin(customers, sales.c.customer_id == customers.c.id)
+            )
+            .order_by(sales.c.id)
+        )
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            while True:
+                rows = result.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                date, product, category, amount, total, quantity, customer = zip(*rows)
+                quantity = np.array(quantity, dtype=np.int64)
+                total = np.array(total, dtype=np.float64)
+                amount = np.array(amount, dtype=np.float64)
+                # Vendas antigas sem valor unitário (nulo = NaN): total / quantidade
+                missing = np.isnan(amount)
+                if missing.any():
+                    amount[missing] = np.divide(total, quantity, out=total.copy(), where=quantity != 0)[missing]
+                yield {
+                    "date": np.array(date, dtype="datetime64[D]"),
+                    "product": product,
+                    "category": category,
+                    "amount": amount,
+                    "quantity": quantity,
+                    "customer": customer,
+                }
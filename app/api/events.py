@@ -0,0 +1,198 @@
+"""
+Eventos de atualização das vendas para o dashboard (Server-Sent Events)
+
+Cada lote gravado é registrado com `record` (dias e categorias do lote). Uma
+thread publica no máximo um evento `sales` a cada `interval` segundos,
+juntando os lotes do intervalo num delta compacto:
+
+    {"rows": 100,
+     "days": [{"date": "2024-03-01", "revenue": 20.0, "orders": 1}],   acréscimo dos lotes
+     "categories": [{"category": ..., "revenue": ..., ...}],            totais atuais
+     "kpis": {"7": {...}, "30": {...}}, "detail": {...}}                valores atuais
+
+Quem assina GET /api/v1/events aplica o delta ao que já carregou, sem
+refazer as consultas. Os eventos recentes ficam num histórico: ao reconectar
+com Last-Event-ID o cliente recebe os que perdeu, ou um evento `reset`
+(recarregar tudo) se o histórico não os tem mais. Sem assinantes, `record`
+não faz nada.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.api import metrics
+from app.api.store import day_to_iso
+
+# Intervalo entre comentários enviados em conexões sem eventos (mantém proxies abertos)
+HEARTBEAT_SECONDS = 15
+
+# Espera sugerida ao cliente antes de reconectar (campo retry do SSE, em ms)
+RETRY_MS = 2000
+
+
+def format_event(event: str, data: dict, event_id: Optional[str] = None) -> bytes:
+    """Mensagem SSE (id, event e data em uma linha JSON)"""
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", "data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":"))]
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class EventBroker:
+    """
+    Junta os lotes gravados e distribui deltas aos assinantes SSE.
+
+    `summarize(categorias)` é chamado pela thread de publicação e devolve os
+    valores atuais do delta (kpis, categories, detail).
+    """
+
+    def __init__(self, summarize: Callable[[set], dict], interval: float = 0.25,
+                 history: int = 256, queue_size: int = 64):
+        self.summarize = summarize
+        self.interval = interval
+        self.queue_size = queue_size
+        # Prefixo dos ids: ids de outro processo (ou de antes de reiniciar) não são reaproveitados
+        self.instance = uuid.uuid4().hex[:8]
+        self._history = deque(maxlen=history)
+        self._seq = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._pending_days: Dict[int, list] = {}
+        self._pending_categories = set()
+        self._pending_rows = 0
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    # Registro dos lotes (threads de gravação)
+
+    def record(self, day, category, revenue):
+        """Acumula um lote gravado: dias (números de dias), categorias e receita por venda"""
+        if not self._subscribers or len(day) == 0:
+            return
+        days, inverse = np.unique(np.asarray(day), return_inverse=True)
+        day_revenue = np.bincount(inverse, weights=np.asarray(revenue, dtype=np.float64))
+        day_orders = np.bincount(inverse)
+        categories = set(pd.unique(pd.Series(category, dtype=object)).tolist()) - {None}
+        with self._lock:
+            for value, revenue_sum, orders in zip(days.tolist(), day_revenue.tolist(), day_orders.tolist()):
+                totals = self._pending_days.setdefault(value, [0.0, 0])
+                totals[0] += revenue_sum
+                totals[1] += orders
+            self._pending_categories |= categories
+            self._pending_rows += len(day)
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            # Junta os lotes que chegarem durante o intervalo num único evento
+            time.sleep(self.interval)
+            self._wake.clear()
+            with self._lock:
+                days, self._pending_days = self._pending_days, {}
+                categories, self._pending_categories = self._pending_categories, set()
+                rows, self._pending_rows = self._pending_rows, 0
+            if not rows:
+                continue
+            ordered = sorted(days)
+            dates = day_to_iso(ordered).tolist() if ordered else []
+            delta = {
+                "rows": rows,
+                "days": [
+                    {"date": date, "revenue": round(days[day][0], 2), "orders": days[day][1]}
+                    for date, day in zip(dates, ordered)
+                ],
+            }
+            try:
+                delta.update(self.summarize(categories))
+            except Exception:
+                # Sem os valores atuais o cliente não consegue corrigir o que tem: recarrega
+                self.publish("reset", {"reason": "summary_failed"})
+                continue
+            self.publish("sales", delta)
+
+    # Publicação e assinatura
+
+    def publish(self, event: str, data: dict):
+        """Envia um evento a todos os assinantes e guarda no histórico (seguro entre threads)"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            message = format_event(event, data, f"{self.instance}-{seq}")
+            self._history.append((seq, message))
+            subscribers = list(self._subscribers)
+        metrics.EVENTS_PUBLISHED.inc(event)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, seq, message)
+            except RuntimeError:
+                # Loop encerrado: a conexão já terminou
+                pass
+
+    def _offer(self, queue: asyncio.Queue, seq: int, message: bytes):
+        if queue.full():
+            # Cliente lento: descarta o atrasado e pede para recarregar
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait((seq, format_event("reset", {"reason": "slow_consumer"})))
+            return
+        queue.put_nowait((seq, message))
+
+    def _missed(self, last_event_id: Optional[str]):
+        """(mensagens desde last_event_id, último seq enviado); None pede reset"""
+        with self._lock:
+            current = self._seq
+            if not last_event_id:
+                return [], current
+            instance, _, seq = last_event_id.partition("-")
+            if instance != self.instance or not seq.isdigit() or int(seq) > current:
+                return None, current
+            seq = int(seq)
+            oldest = self._history[0][0] if self._history else current + 1
+            if seq < oldest - 1:
+                return None, current
+            return [message for number, message in self._history if number > seq], current
+
+    async def stream(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Corpo da resposta SSE de um assinante"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        subscriber = (loop, queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="events", daemon=True)
+                self._thread.start()
+        metrics.EVENT_SUBSCRIBERS.inc()
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            missed, sent = self._missed(last_event_id)
+            if missed is None:
+                yield format_event("reset", {"reason": "history"})
+            else:
+                for message in missed:
+                    yield message
+            while True:
+                try:
+                    seq, message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if seq > sent:
+                    sent = seq
+                    yield message
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+            metrics.EVENT_SUBSCRIBERS.dec()
@@ -0,0 +1,405 @@
+"""
+Importações em segundo plano de arquivos grandes (CSV, NDJSON, Parquet, Excel)
+
+POST /api/v1/imports grava o corpo num arquivo do diretório de importações e
+devolve o id do job na hora. Os jobs rodam um por vez, na ordem de chegada:
+
+1. O arquivo é dividido em blocos de ~`chunk_bytes`: faixas de bytes que
+   terminam numa quebra de linha fora de aspas (CSV, NDJSON) ou grupos de
+   row groups (Parquet). Planilhas Excel são antes convertidas para CSV num
+   processo do pool, lendo linha a linha.
+2. Os blocos são lidos e validados num pool de processos, com a mesma
+   validação de POST /sales/bulk. No máximo `window` blocos ficam em
+   andamento, então a memória não depende do tamanho do arquivo.
+3. Uma única thread grava os blocos validados, na ordem do arquivo.
+
+O estado de cada job (linhas, rejeitadas, vazão, ETA) fica em memória e num
+arquivo `<id>.json` no mesmo diretório, lido por qualquer worker do uvicorn.
+Os blocos gravados antes de uma falha continuam gravados.
+"""
+
+import csv
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.api import ingest, metrics
+
+EXCEL_MEDIA_TYPES = ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",)
+
+# Extensão do arquivo recebido por formato (o openpyxl exige .xlsx)
+EXTENSIONS = {"csv": "csv", "ndjson": "ndjson", "parquet": "parquet", "excel": "xlsx"}
+
+# Bytes do arquivo por bloco lido e validado num processo
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# Bytes lidos por vez ao procurar os limites dos blocos
+SCAN_BYTES = 8 * 1024 * 1024
+
+# Estado de jobs terminados mantido no diretório (segundos)
+STATUS_SECONDS = 24 * 3600
+
+# Colunas de texto lidas sem conversão de tipo
+TEXT_COLUMNS = ("date", "product", "category", "customer")
+
+QUOTE, NEWLINE = ord('"'), ord("\n")
+
+
+def file_kind(content_type: str) -> Optional[str]:
+    """Formato do arquivo pelo Content-Type: csv, ndjson, parquet, excel ou None"""
+    media_type = ingest.base_media_type(content_type)
+    for kind, media_types in (
+        ("csv", ingest.CSV_MEDIA_TYPES),
+        ("ndjson", ingest.NDJSON_MEDIA_TYPES),
+        ("parquet", ingest.PARQUET_MEDIA_TYPES),
+        ("excel", EXCEL_MEDIA_TYPES),
+    ):
+        if media_type in media_types:
+            return kind
+    return None
+
+
+# Divisão em blocos
+
+def split_lines(path: str, start: int, chunk_bytes: int, quoted: bool = True) -> List[Tuple[int, int]]:
+    """
+    Faixas [início, fim) de ~chunk_bytes a partir de `start`, cada uma
+    terminando numa quebra de linha. Com `quoted` (CSV), só valem quebras com
+    um número par de aspas antes delas: campos entre aspas podem ter quebras.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    begin, position, parity = start, start, 0
+    with open(path, "rb") as file:
+        file.seek(start)
+        while position < size:
+            block = np.frombuffer(file.read(SCAN_BYTES), dtype=np.uint8)
+            ends = np.flatnonzero(block == NEWLINE)
+            if quoted:
+                quotes = np.cumsum(block == QUOTE) + parity
+                ends = ends[quotes[ends] % 2 == 0]
+                parity = int(quotes[-1] % 2)
+            ends = ends + position + 1
+            while True:
+                cut = int(np.searchsorted(ends, begin + chunk_bytes))
+                if cut == len(ends):
+                    break
+                ranges.append((begin, int(ends[cut])))
+                begin = int(ends[cut])
+            position += len(block)
+    if begin < size:
+        ranges.append((begin, size))
+    return ranges
+
+
+def csv_header(path: str) -> Tuple[List[str], int]:
+    """(nomes das colunas, bytes da linha de cabeçalho)"""
+    with open(path, "rb") as file:
+        line = file.readline()
+    names = next(csv.reader([line.decode("utf-8-sig")]), [])
+    return [name.strip() for name in names], len(line)
+
+
+def plan(path: str, kind: str, chunk_bytes: int = CHUNK_BYTES) -> List[tuple]:
+    """Blocos do arquivo: (tarefa de parse_chunk, bytes do bloco)"""
+    if kind == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Formato Parquet indisponível (pyarrow não instalado)")
+        metadata = pq.ParquetFile(path).metadata
+        tasks, groups, size = [], [], 0
+        for i in range(metadata.num_row_groups):
+            groups.append(i)
+            size += metadata.row_group(i).total_byte_size
+            if size >= chunk_bytes or i == metadata.num_row_groups - 1:
+                tasks.append((("parquet", path, groups), size))
+                groups, size = [], 0
+        return tasks
+    if kind == "csv":
+        header, start = csv_header(path)
+        return [(("csv", path, (lo, hi), header), hi - lo) for lo, hi in split_lines(path, start, chunk_bytes)]
+    return [(("ndjson", path, (lo, hi), None), hi - lo) for lo, hi in split_lines(path, 0, chunk_bytes, quoted=False)]
+
+
+# Leitura e validação (rodam nos processos do pool)
+
+def parse_chunk(task: tuple, mapping: Dict[str, str]):
+    """Lê e valida um bloco: (colunas válidas, linhas, rejeitadas, erros com linha relativa ao bloco)"""
+    kind, path = task[0], task[1]
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+        df = pq.ParquetFile(path).read_row_groups(task[2]).to_pandas()
+    else:
+        lo, hi = task[2]
+        with open(path, "rb") as file:
+            file.seek(lo)
+            data = io.BytesIO(file.read(hi - lo))
+        if kind == "csv":
+            header = task[3]
+            text = {mapping.get(name, name) for name in TEXT_COLUMNS}
+            df = pd.read_csv(data, header=None, names=header, dtype={name: object for name in header if name in text})
+        else:
+            df = pd.read_json(data, lines=True, dtype=False, convert_dates=False)
+    df = df.rename(columns={source: target for target, source in mapping.items() if source != target})
+    columns, rejected, errors = ingest.validate_chunk(df)
+    return columns, len(df), rejected, errors
+
+
+def excel_to_csv(path: str, target: str) -> str:
+    """Converte a primeira planilha para CSV lendo linha a linha (memória constante)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Formato Excel indisponível (openpyxl não instalado)")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        with open(target, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            for row in workbook.active.iter_rows(values_only=True):
+                writer.writerow([
+                    value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+                    for value in row
+                ])
+    finally:
+        workbook.close()
+    return target
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ImportJob:
+    """Estado de uma importação"""
+
+    def __init__(self, job_id: str, path: str, kind: str, content_type: str, mapping: Dict[str, str]):
+        self.id = job_id
+        self.path = path
+        self.kind = kind
+        self.content_type = content_type
+        self.mapping = mapping
+        self.status = "uploading"
+        self.error = None
+        self.bytes = 0
+        self.bytes_processed = 0
+        self.rows = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors: List[dict] = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        rate = self.bytes_processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.status == "running" and rate > 0:
+            eta = round((self.bytes - self.bytes_processed) / rate, 1)
+        elif self.status == "done":
+            eta = 0.0
+
+        def stamp(value):
+            return datetime.datetime.fromtimestamp(value).isoformat() if value else None
+
+        return {
+            "id": self.id,
+            "status": self.status,
+            "content_type": self.content_type,
+            "bytes": self.bytes,
+            "bytes_processed": self.bytes_processed,
+            "progress": round(self.bytes_processed / self.bytes, 4) if self.bytes else 0.0,
+            "rows": self.rows,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed) if elapsed > 0 else None,
+            "eta_seconds": eta,
+            "created_at": stamp(self.created_at),
+            "started_at": stamp(self.started_at),
+            "finished_at": stamp(self.finished_at),
+            "error": self.error,
+            "pid": os.getpid(),
+        }
+
+
+class ImportQueue:
+    """
+    Fila de importações: leitura e validação em `workers` processos (0 = na
+    própria thread de gravação) e gravação em ordem por `ingest(colunas)`.
+    """
+
+    def __init__(self, ingest_columns: Callable[[dict], int], directory: str, workers: Optional[int] = None,
+                 chunk_bytes: int = CHUNK_BYTES, window: Optional[int] = None, history: int = 100):
+        os.makedirs(directory, exist_ok=True)
+        self.ingest_columns = ingest_columns
+        self.directory = directory
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.chunk_bytes = chunk_bytes
+        self.window = window or max(2 * self.workers, 2)
+        self.history = history
+        self._jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+        self._queue: "queue.Queue[ImportJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    # Envio
+
+    def create(self, content_type: str, mapping: Optional[Dict[str, str]] = None) -> ImportJob:
+        """Novo job aguardando o arquivo em `job.path` (ValueError para formato não suportado)"""
+        kind = file_kind(content_type)
+        if kind is None:
+            raise ValueError(f"Content-Type não suportado: {content_type!r}")
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{job_id}.upload.{EXTENSIONS[kind]}")
+        job = ImportJob(job_id, path, kind, content_type, mapping or {})
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.history:
+                self._jobs.popitem(last=False)
+        return job
+
+    def enqueue(self, job: ImportJob):
+        """Arquivo recebido: coloca o job na fila"""
+        job.bytes = os.path.getsize(job.path)
+        job.status = "queued"
+        self._save(job)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="imports", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+
+    def discard(self, job: ImportJob):
+        """Upload interrompido: apaga o arquivo e esquece o job"""
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        self._remove(job.path)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Estado do job (deste processo ou, pelo arquivo de estado, de outro worker)"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{job_id}.json")) as file:
+                status = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if status["status"] in ("queued", "running") and not _pid_alive(status["pid"]):
+            status.update(status="failed", error="Processo da API encerrado durante a importação", eta_seconds=None)
+        return status
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # Processamento (thread de gravação)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+                job.status = "done"
+            except Exception as e:
+                job.status, job.error = "failed", str(e)
+            finally:
+                job.finished_at = time.time()
+                metrics.IMPORT_JOBS.inc(job.status)
+                self._save(job)
+                self._remove(job.path)
+                self._remove(job.path + ".csv")
+                self._prune()
+
+    def _submit(self, func, *args):
+        """Roda no pool de processos, ou na hora sem pool"""
+        if not self.workers:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if self._pool is None:
+            # spawn: os processos não herdam as threads e locks do servidor
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool.submit(func, *args)
+
+    def _process(self, job: ImportJob):
+        job.status, job.started_at = "running", time.time()
+        self._save(job)
+        path, kind = job.path, job.kind
+        if kind == "excel":
+            path, kind = self._submit(excel_to_csv, path, path + ".csv").result(), "csv"
+            # Progresso e ETA passam a contar os bytes do CSV convertido
+            job.bytes = os.path.getsize(path)
+        tasks = deque(plan(path, kind, self.chunk_bytes))
+        pending = deque()
+        try:
+            while tasks or pending:
+                while tasks and len(pending) < self.window:
+                    task, size = tasks.popleft()
+                    pending.append((self._submit(parse_chunk, task, job.mapping), size))
+                future, size = pending.popleft()
+                columns, rows, rejected, errors = future.result()
+                if rows - rejected:
+                    self.ingest_columns(columns)
+                for error in errors[:ingest.MAX_SAMPLE_ERRORS - len(job.errors)]:
+                    job.errors.append({"row": job.rows + error["row"], "error": error["error"]})
+                job.rows += rows
+                job.accepted += rows - rejected
+                job.rejected += rejected
+                job.bytes_processed += size
+                self._save(job)
+        finally:
+            for future, _ in pending:
+                future.cancel()
+        job.bytes_processed = job.bytes
+
+    # Arquivos de estado
+
+    def _save(self, job: ImportJob):
+        path = os.path.join(self.directory, f"{job.id}.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(job.to_dict(), file)
+        os.replace(path + ".tmp", path)
+
+    def _prune(self):
+        """Apaga estados de jobs antigos"""
+        limit = time.time() - STATUS_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json") and os.path.getmtime(path) < limit:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
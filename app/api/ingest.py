@@ -0,0 +1,145 @@
+"""
+Ingestão em massa: leitura em blocos e validação vetorizada por coluna
+"""
+
+from typing import BinaryIO, Iterator, List
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from app.api import metrics
+from app.api.store import coerce_days
+
+CSV_MEDIA_TYPES = ("text/csv", "application/csv")
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
+PARQUET_MEDIA_TYPES = ("application/vnd.apache.parquet", "application/x-parquet", "application/parquet")
+
+REQUIRED_COLUMNS = ["date", "product", "category", "amount", "quantity"]
+
+# Linhas lidas e validadas por bloco
+CHUNK_ROWS = 250_000
+
+# Quantidade máxima de erros de exemplo devolvidos no resumo
+MAX_SAMPLE_ERRORS = 20
+
+
+def base_media_type(content_type: str) -> str:
+    """Tipo de mídia sem parâmetros (ex.: 'text/csv; charset=utf-8' -> 'text/csv')"""
+    return content_type.split(";")[0].strip().lower()
+
+
+def is_supported(content_type: str) -> bool:
+    """Indica se o Content-Type é aceito pela ingestão em massa"""
+    return base_media_type(content_type) in CSV_MEDIA_TYPES + NDJSON_MEDIA_TYPES + PARQUET_MEDIA_TYPES
+
+
+def read_chunks(body: BinaryIO, content_type: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Lê o corpo da requisição (CSV, NDJSON ou Parquet) em blocos de DataFrame"""
+    kind = base_media_type(content_type)
+    if kind in CSV_MEDIA_TYPES:
+        text = {name: object for name in ("date", "product", "category", "customer")}
+        yield from pd.read_csv(body, chunksize=chunk_rows, dtype=text)
+    elif kind in NDJSON_MEDIA_TYPES:
+        yield from pd.read_json(body, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False)
+    elif kind in PARQUET_MEDIA_TYPES:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Formato Parquet indisponível (pyarrow não instalado)")
+        for batch in pq.ParquetFile(body).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Content-Type não suportado: {content_type!r}")
+
+
+def _text_column(series: pd.Series) -> pd.Categorical:
+    """
+    Texto sem espaços nas pontas, já codificado como Categorical; nulos e vazios viram nulos.
+
+    Só os valores distintos são limpos, e o store reaproveita a codificação.
+    """
+    codes, uniques = pd.factorize(series)
+    cleaned = [str(value).strip() or None for value in np.asarray(uniques, dtype=object)]
+    remap, categories = pd.factorize(np.array(cleaned + [None], dtype=object))
+    return pd.Categorical.from_codes(remap[codes], categories=categories)
+
+
+@metrics.timed("validate.bulk")
+def validate_chunk(df: pd.DataFrame, row_offset: int = 0):
+    """
+    Valida um bloco inteiro de uma vez, coluna a coluna.
+
+    Retorna (colunas válidas, quantidade rejeitada, erros de exemplo). As
+    colunas válidas estão no formato de SalesStore.append_columns.
+    """
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {missing}")
+
+    n = len(df)
+    days, valid_date = coerce_days(df["date"].to_numpy())
+    amount = pd.to_numeric(df["amount"], errors="coerce").to_numpy(dtype=np.float64)
+    quantity = pd.to_numeric(df["quantity"], errors="coerce").to_numpy(dtype=np.float64)
+    product = _text_column(df["product"])
+    category = _text_column(df["category"])
+    if "customer" in df.columns:
+        customer = _text_column(df["customer"])
+    else:
+        customer = _text_column(pd.Series([None] * n, dtype=object))
+
+    checks = [
+        (valid_date, "data inválida ou fora do intervalo aceito"),
+        (np.isfinite(amount), "amount não numérico"),
+        (~(amount < 0), "amount negativo"),
+        (np.isfinite(quantity) & (quantity == np.round(quantity)), "quantity não inteiro"),
+        (~(quantity < 0), "quantity negativo"),
+        (~(quantity > np.iinfo(np.int32).max), "quantity fora do intervalo"),
+        (pd.notna(product), "product vazio"),
+        (pd.notna(category), "category vazio"),
+    ]
+    valid = np.ones(n, dtype=bool)
+    errors: List[dict] = []
+    for ok, message in checks:
+        failed = ~ok & valid
+        if len(errors) < MAX_SAMPLE_ERRORS:
+            for row in np.flatnonzero(failed)[:MAX_SAMPLE_ERRORS - len(errors)]:
+                errors.append({"row": int(row_offset + row), "error": message})
+        valid &= ok
+    errors.sort(key=lambda error: error["row"])
+
+    columns = {
+        "date": days[valid].astype("datetime64[D]"),
+        "product": product[valid],
+        "category": category[valid],
+        "amount": amount[valid],
+        "quantity": quantity[valid].astype(np.int32),
+        "customer": customer[valid],
+    }
+    return columns, int(n - valid.sum()), errors
+
+
+def parse_bulk(body: BinaryIO, content_type: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    Lê e valida o corpo inteiro em blocos.
+
+    Retorna (colunas válidas concatenadas, resumo com contagens e erros de exemplo).
+    """
+    parts = []
+    rows = rejected = 0
+    errors: List[dict] = []
+    for df in read_chunks(body, content_type, chunk_rows):
+        columns, chunk_rejected, chunk_errors = validate_chunk(df, row_offset=rows)
+        parts.append(columns)
+        rows += len(df)
+        rejected += chunk_rejected
+        errors.extend(chunk_errors[:MAX_SAMPLE_ERRORS - len(errors)])
+
+    if parts:
+        columns = {}
+        for name, first in parts[0].items():
+            values = [part[name] for part in parts]
+            columns[name] = union_categoricals(values) if isinstance(first, pd.Categorical) else np.concatenate(values)
+    else:
+        columns = None
+    summary = {"rows": rows, "accepted": rows - rejected, "rejected": rejected, "errors": errors}
+    return columns, summary
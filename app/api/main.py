@@ -2,13 +2,36 @@
 API Simples para aprendizado
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
-import random
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import asyncio
+import json
 import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.api.store import SalesStore, day_number, day_to_iso, parse_days, records_to_columns
+from app.api.rollups import SalesRollups
+from app.api.sketches import TOP_METRICS
+from app.api.storage import TOP_DIMENSIONS, MemoryBackend
+from app.api.wal import Journal
+from app.api import ingest as bulk
+from app.api import streaming
+from app.api.cache import cached_json, create_cache
+from app.api import codec
+from app.api import timeseries
+from app.api import metrics
+from app.api.events import EventBroker
+from app.api import imports
+from app.api import query
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +41,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Sales Analytics API",
     description="API para dados de vendas",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=codec.JsonResponse,
 )
 
 # Configurar CORS
@@ -29,6 +53,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Armazenamento: "memory" (padrão), "sql" (grava em lote e agrega no banco de DATABASE_URL)
+# ou "partitioned" (partições mensais Parquet em PARTITION_DIR, lidas sob demanda)
+SALES_BACKEND = os.getenv("SALES_BACKEND", "memory")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sales.db")
+# No modo sql, ler totais e séries das tabelas de resumo do pipeline (atualizadas pelo Airflow)
+SQL_READ_SUMMARIES = os.getenv("SQL_READ_SUMMARIES", "false").lower() in ("1", "true", "yes")
+# No modo partitioned: diretório, threads de leitura e memória para colunas de partições lidas
+PARTITION_DIR = os.getenv("PARTITION_DIR", "./data/partitions")
+PARTITION_THREADS = int(os.getenv("PARTITION_THREADS", "0")) or None
+PARTITION_CACHE_BYTES = int(os.getenv("PARTITION_CACHE_BYTES", str(256 * 1024 * 1024)))
+
+# Diretório das colunas em arquivos mapeados em memória, compartilhadas entre workers
+# (uvicorn --workers N); vazio = store só na memória deste processo
+SHARED_STORE_DIR = os.getenv("SHARED_STORE_DIR") or None
+
+# Diretório do WAL e dos snapshots do store em memória (SALES_BACKEND=memory, também com
+# SHARED_STORE_DIR); vazio = vendas perdidas ao reiniciar
+DATA_DIR = os.getenv("DATA_DIR") or None
+# fsync de cada lote antes de responder (false: mais rápido, mas os últimos lotes podem se perder numa queda da máquina)
+WAL_SYNC = os.getenv("WAL_SYNC", "true").lower() in ("1", "true", "yes")
+# Tamanho do segmento do WAL que dispara um snapshot novo
+SNAPSHOT_WAL_BYTES = int(os.getenv("SNAPSHOT_WAL_BYTES", str(64 * 1024 * 1024)))
+
+# Maior intervalo aceito por /api/v1/sales/daily (10 anos)
+MAX_DAILY_RANGE = 3660
+
+# Janela padrão (dias) dos KPIs de período: clientes ativos e crescimento sobre a janela anterior
+KPI_WINDOW_DAYS = 30
+
+# Maior intervalo aceito pelas séries agregadas (/sales/timeseries e /dashboard) e pontos por série
+MAX_SERIES_RANGE = 36600
+MAX_SERIES_POINTS = 10_000
+
+# Maior ranking de /api/v1/sales/top
+MAX_TOP_N = 1000
+
+# Linhas por resposta de /api/v1/query e duração a partir da qual a consulta é registrada no log com o plano
+DEFAULT_QUERY_ROWS = 1000
+MAX_QUERY_ROWS = 10_000
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+# Paginação de /api/v1/sales
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10_000
+
+# Corpo da ingestão em massa fica em memória até este tamanho; acima vai para disco
+BULK_SPOOL_BYTES = 64 * 1024 * 1024
+
+# Importações em segundo plano (/api/v1/imports): diretório dos arquivos recebidos e do
+# estado dos jobs (compartilhado entre workers) e processos de leitura (0 = sem processos)
+IMPORT_DIR = os.getenv("IMPORT_DIR") or os.path.join(tempfile.gettempdir(), "sales_imports")
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Cache das rotas de leitura: "redis" (REDIS_URL) ou "memory" (LRU limitado por CACHE_MAX_BYTES)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Eventos de /api/v1/events: intervalo mínimo entre deltas e janelas (dias) dos KPIs enviados
+# (as janelas dos períodos do dashboard)
+EVENT_INTERVAL_SECONDS = float(os.getenv("EVENT_INTERVAL_SECONDS", "0.25"))
+EVENT_KPI_WINDOWS = [int(days) for days in os.getenv("EVENT_KPI_WINDOWS", "7,15,30,90,365").split(",") if days.strip()]
+
+# Serialização JSON: "json" (biblioteca padrão) ou "orjson" (respostas de /sales montadas das
+# colunas e lotes de /sales/batch lidos direto para colunas; requer o pacote orjson)
+JSON_CODEC = os.getenv("JSON_CODEC", "json")
+
+# Métricas Prometheus em /metrics (latência por rota, ingestão, memória, cache e trechos internos)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
 # Modelos de dados
 class SaleItem(BaseModel):
     date: str
@@ -43,10 +138,16 @@ class KPIResponse(BaseModel):
     total_orders: int
     average_ticket: float
     active_customers: int
-    revenue_growth: float
+    revenue_growth: Optional[float]
+    orders_growth: Optional[float] = None
+    average_ticket_growth: Optional[float] = None
+    active_customers_growth: Optional[float] = None
+    period_days: int
+    period_end: Optional[str] = None
+    ticket_percentiles: Dict[str, Optional[float]] = {}
 
 # Dados de exemplo (simulando banco de dados)
-SALES_DATA = [
+SAMPLE_SALES = [
     {"date": "2024-01-01", "product": "Notebook", "category": "Eletrônicos", "amount": 3500.00, "quantity": 2, "customer": "João"},
     {"date": "2024-01-01", "product": "Mouse", "category": "Eletrônicos", "amount": 150.00, "quantity": 5, "customer": "Maria"},
     {"date": "2024-01-02", "product": "Teclado", "category": "Eletrônicos", "amount": 250.00, "quantity": 3, "customer": "José"},
@@ -54,6 +155,203 @@ SALES_DATA = [
     {"date": "2024-01-03", "product": "Cadeira", "category": "Móveis", "amount": 800.00, "quantity": 2, "customer": "Carlos"},
 ]
 
+def create_store() -> SalesStore:
+    """Store colunar: compartilhado em SHARED_STORE_DIR ou na memória do processo"""
+    if SHARED_STORE_DIR:
+        # fcntl só existe em sistemas POSIX
+        from app.api.shared_store import SharedSalesStore
+        logger.info(f"Store compartilhado entre workers em {SHARED_STORE_DIR}")
+        return SharedSalesStore(SHARED_STORE_DIR)
+    return SalesStore()
+
+
+def create_journal() -> Optional[Journal]:
+    """WAL e snapshots em DATA_DIR para o store em memória (do processo ou compartilhado)"""
+    if not DATA_DIR:
+        if SALES_BACKEND == "memory":
+            logger.warning("DATA_DIR não configurado: as vendas do store em memória se perdem ao reiniciar")
+        return None
+    if SALES_BACKEND != "memory":
+        # Os backends sql e partitioned já persistem as vendas; um DATA_DIR aqui é engano de configuração
+        raise RuntimeError(f"DATA_DIR só vale para SALES_BACKEND=memory (configurado: {SALES_BACKEND})")
+    return Journal(DATA_DIR, sync=WAL_SYNC, snapshot_bytes=SNAPSHOT_WAL_BYTES)
+
+
+def recover_store() -> Tuple[SalesStore, Optional[SalesRollups]]:
+    """Store e agregados recuperados do DATA_DIR; agregados None = calcular a partir do store"""
+    if JOURNAL is None:
+        return create_store(), None
+    if SHARED_STORE_DIR:
+        store = create_store()
+        with store.lock():
+            # Só o primeiro worker com o store compartilhado vazio recupera; os demais retomam o WAL
+            store.refresh()
+            rollups = JOURNAL.recover_shared(store)
+    else:
+        store, rollups = JOURNAL.recover()
+    if rollups is not None:
+        logger.info(
+            f"Store recuperado de {DATA_DIR} em {JOURNAL.recovery_seconds:.2f}s: "
+            f"{JOURNAL.snapshot_rows} vendas do snapshot, {JOURNAL.replayed_rows} do WAL"
+        )
+    return store, rollups
+
+
+# Armazenamento colunar em memória e agregados incrementais
+JOURNAL = create_journal()
+STORE, ROLLUPS = recover_store()
+# Agregados recuperados do snapshot e do WAL não precisam ser recalculados
+ROLLUPS_RECOVERED = ROLLUPS is not None
+if ROLLUPS is None:
+    ROLLUPS = SalesRollups()
+MEMORY = MemoryBackend(STORE, ROLLUPS, journal=JOURNAL)
+if JOURNAL is not None:
+    JOURNAL.attach(MEMORY)
+
+
+def create_backend():
+    """Backend configurado em SALES_BACKEND"""
+    if SALES_BACKEND == "sql":
+        # SQLAlchemy só é necessário neste modo
+        from app.api.database import SqlBackend
+        logger.info("Usando backend SQL para persistência e agregações")
+        return SqlBackend(DATABASE_URL, use_summaries=SQL_READ_SUMMARIES)
+    if SALES_BACKEND == "partitioned":
+        # pyarrow só é necessário neste modo
+        from app.api.partitions import PartitionedBackend
+        logger.info(f"Usando partições Parquet em {PARTITION_DIR}")
+        return PartitionedBackend(PARTITION_DIR, threads=PARTITION_THREADS, cache_bytes=PARTITION_CACHE_BYTES)
+    return MEMORY
+
+
+BACKEND = create_backend()
+
+
+def shared_data_identity() -> str:
+    """Vendas do store compartilhado já publicadas para as leituras deste worker (igual em todos os workers)"""
+    return f"{STORE.store_id}:{len(MEMORY.snapshot().store)}"
+
+
+# Cache em memória com store compartilhado: o ETag identifica os dados, não a versão deste worker
+CACHE = create_cache(
+    CACHE_BACKEND, REDIS_URL, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES,
+    identity=shared_data_identity if SHARED_STORE_DIR and BACKEND.uses_memory_store else None,
+)
+logger.info(f"Cache de respostas: {CACHE.name}")
+# Deltas para o dashboard (summarize_changes é definida junto das agregações)
+EVENTS = EventBroker(lambda categories: summarize_changes(categories), interval=EVENT_INTERVAL_SECONDS)
+
+metrics.configure(METRICS_ENABLED)
+logger.info(f"Serialização JSON: {codec.configure(JSON_CODEC)}")
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+def apply_shared_changes() -> bool:
+    """Aplica as vendas gravadas por outros workers (store compartilhado); True se havia novidades"""
+    changes = MEMORY.refresh()
+    if not changes:
+        return False
+    # Respostas em cache deste worker foram calculadas sem essas vendas
+    CACHE.bump_version()
+    if EVENTS.subscribers:
+        start, stop = changes
+        snapshot = STORE.snapshot()
+        EVENTS.record(
+            snapshot.column("day")[start:stop],
+            snapshot.categories.decode(snapshot.column("category")[start:stop]),
+            snapshot.column("amount")[start:stop] * snapshot.column("quantity")[start:stop],
+        )
+    return True
+
+
+if SHARED_STORE_DIR:
+    @app.middleware("http")
+    async def refresh_shared_store(request: Request, call_next):
+        """Antes de cada requisição, aplica as vendas gravadas por outros workers"""
+        if STORE.changed():
+            await run_in_threadpool(apply_shared_changes)
+        return await call_next(request)
+
+    @app.on_event("startup")
+    async def watch_shared_store():
+        """Acompanha o store também sem requisições, para os assinantes de /api/v1/events deste worker"""
+        async def watch():
+            while True:
+                await asyncio.sleep(EVENT_INTERVAL_SECONDS)
+                if STORE.changed():
+                    await run_in_threadpool(apply_shared_changes)
+        app.state.shared_store_watcher = asyncio.create_task(watch())
+
+
+def ingest(records, source: str = "batch") -> int:
+    """Adiciona vendas (dicts) ao armazenamento"""
+    return ingest_columns(records_to_columns(records), source)
+
+
+def ingest_columns(columns: dict, source: str = "batch") -> int:
+    """Grava um lote em colunas no backend configurado e no store em memória (com agregados)"""
+    started = time.perf_counter()
+    try:
+        if BACKEND is not MEMORY:
+            count = BACKEND.append_columns(columns)
+        if BACKEND.uses_memory_store:
+            count = MEMORY.append_columns(columns)
+        metrics.record_ingest(source, count, time.perf_counter() - started)
+        record_changes(columns)
+        return count
+    finally:
+        # Invalida as respostas em cache (também se o lote falhou no meio)
+        CACHE.bump_version()
+
+
+def record_changes(columns: dict):
+    """Registra o lote gravado para os assinantes de /api/v1/events"""
+    if EVENTS.subscribers:
+        revenue = np.asarray(columns["amount"], dtype=np.float64) * np.asarray(columns["quantity"], dtype=np.float64)
+        EVENTS.record(parse_days(columns["date"]), columns["category"], revenue)
+
+
+# Fila das importações em segundo plano (um job por vez, gravado em blocos)
+IMPORTS = imports.ImportQueue(lambda columns: ingest_columns(columns, "import"), IMPORT_DIR, workers=IMPORT_WORKERS)
+
+
+@app.on_event("shutdown")
+def stop_imports():
+    IMPORTS.close()
+    if JOURNAL is not None:
+        # Depois das importações: o snapshot final já inclui os últimos blocos
+        JOURNAL.close()
+
+
+def rebuild_rollups() -> List[str]:
+    """Reconstrói os agregados e confere contra uma varredura completa"""
+    differences = MEMORY.rebuild()
+    if differences:
+        logger.error(f"Agregados inconsistentes após reconstrução: {differences}")
+    else:
+        logger.info(f"Agregados reconstruídos e conferidos ({len(STORE)} vendas)")
+    return differences
+
+
+def stored_rows() -> int:
+    """Vendas armazenadas (no store em memória ou só no backend)"""
+    return len(STORE) if BACKEND.uses_memory_store else BACKEND.count()
+
+
+with MEMORY.exclusive():
+    # Com store compartilhado, só o primeiro worker a iniciar carrega os dados
+    if not len(STORE) and BACKEND is not MEMORY and BACKEND.uses_memory_store:
+        # Carrega o store em memória a partir do banco, em blocos de colunas
+        for columns in BACKEND.iter_columns():
+            STORE.append_columns(**columns)
+    if not stored_rows():
+        ingest(SAMPLE_SALES, source="sample")
+if not ROLLUPS_RECOVERED or not len(STORE):
+    rebuild_rollups()
+# Store recuperado do DATA_DIR: agregados vêm do snapshot e do WAL (POST /api/v1/rollups/rebuild confere)
+# Dados recarregados: respostas em cache de execuções anteriores (Redis) não valem mais
+CACHE.bump_version()
+
 @app.get("/")
 def root():
     """Rota inicial"""
@@ -62,121 +360,578 @@ def root():
         "version": "1.0.0",
         "endpoints": [
             "/health",
+            "/metrics",
             "/api/v1/kpis",
             "/api/v1/sales",
             "/api/v1/sales/daily",
             "/api/v1/sales/by-category",
-            "/api/v1/sales/batch"
+            "/api/v1/sales/top",
+            "/api/v1/sales/timeseries",
+            "/api/v1/query",
+            "/api/v1/dashboard",
+            "/api/v1/sales/batch",
+            "/api/v1/sales/bulk",
+            "/api/v1/imports",
+            "/api/v1/events"
         ]
     }
 
+def check_dependency(name: str, backend: str, ping) -> dict:
+    """Chama `ping` medindo a latência; registra o resultado nas métricas"""
+    started = time.perf_counter()
+    error = None
+    try:
+        up = ping() is not False
+    except Exception as e:
+        up, error = False, str(e)
+    latency = time.perf_counter() - started
+    metrics.DEPENDENCY_UP.set(1 if up else 0, name)
+    metrics.DEPENDENCY_SECONDS.set(latency, name)
+    result = {"backend": backend, "status": "up" if up else "down", "latency_ms": round(latency * 1000, 3)}
+    if error:
+        result["error"] = error
+    return result
+
 @app.get("/health")
 def health_check():
-    """Verificar se a API está funcionando"""
-    return {
-        "status": "healthy",
+    """
+    Verificar se a API está funcionando.
+    
+    Consulta o armazenamento e o cache e informa a latência medida de cada um.
+    Sem armazenamento responde 503; com o cache fora do ar fica "degraded"
+    (as leituras continuam, sem cache).
+    """
+    services = {
+        "storage": check_dependency("storage", BACKEND.name, BACKEND.ping),
+        "cache": check_dependency("cache", CACHE.name, CACHE.ping),
+    }
+    storage_up = services["storage"]["status"] == "up"
+    if not storage_up:
+        status = "unhealthy"
+    elif services["cache"]["status"] != "up":
+        status = "degraded"
+    else:
+        status = "healthy"
+    body = {
+        "status": status,
         "timestamp": datetime.now().isoformat(),
-        "services": {
-            "database": "connected",
-            "redis": "connected"
-        }
+        "rows": stored_rows(),
+        "services": services,
     }
+    return body if storage_up else codec.JsonResponse(body, status_code=503)
+
+@app.get("/metrics")
+def get_metrics():
+    """Métricas no formato texto do Prometheus"""
+    metrics.STORE_ROWS.set(len(STORE))
+    metrics.MEMORY_BYTES.set(STORE.nbytes, "store")
+    metrics.MEMORY_BYTES.set(ROLLUPS.nbytes, "rollups")
+    metrics.MEMORY_BYTES.set(ROLLUPS.sketches.nbytes, "sketches")
+    if hasattr(CACHE, "nbytes"):
+        metrics.MEMORY_BYTES.set(CACHE.nbytes, "cache")
+    if BACKEND is not MEMORY:
+        metrics.MEMORY_BYTES.set(BACKEND.nbytes, "backend")
+    metrics.update_cache_ratios()
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/api/v1/kpis", response_model=KPIResponse)
-def get_kpis():
-    """Retorna KPIs principais"""
-    logger.info("Buscando KPIs...")
+def get_kpis(request: Request, days: int = Query(KPI_WINDOW_DAYS, ge=1, le=MAX_DAILY_RANGE, description="Janela dos KPIs de período")):
+    """
+    Retorna KPIs principais (com cache e ETag).
+    
+    Totais são de todo o período. Clientes ativos e crescimentos (%) são da
+    janela de `days` dias que termina no último dia com vendas, comparada com
+    a janela anterior de mesmo tamanho (None quando a anterior não tem vendas).
+    """
+    return cached_json(CACHE, request, "kpis", {"days": days}, lambda: compute_kpis(days))
+
+def growth(current: float, previous: float) -> Optional[float]:
+    """Variação percentual; None sem base de comparação"""
+    return round((current / previous - 1) * 100, 1) if previous else None
+
+@metrics.timed("aggregate.kpis")
+def compute_kpis(days: int = KPI_WINDOW_DAYS):
+    logger.info("Calculando KPIs...")
     
-    total_revenue = sum(item["amount"] * item["quantity"] for item in SALES_DATA)
-    total_orders = len(SALES_DATA)
+    totals = BACKEND.kpis()
+    total_revenue = totals["total_revenue"]
+    total_orders = totals["total_orders"]
+    
+    bounds = BACKEND.day_bounds()
+    last = bounds[1] if bounds else day_number(datetime.now().date())
+    current = BACKEND.activity(last - days + 1, last)
+    previous = BACKEND.activity(last - 2 * days + 1, last - days)
+    current_ticket = current["revenue"] / current["orders"] if current["orders"] else 0.0
+    previous_ticket = previous["revenue"] / previous["orders"] if previous["orders"] else 0.0
     
     return {
         "total_revenue": round(total_revenue, 2),
         "total_orders": total_orders,
         "average_ticket": round(total_revenue / total_orders, 2) if total_orders else 0,
-        "active_customers": 150,
-        "revenue_growth": 12.5
+        "active_customers": current["customers"],
+        "revenue_growth": growth(current["revenue"], previous["revenue"]),
+        "orders_growth": growth(current["orders"], previous["orders"]),
+        "average_ticket_growth": growth(current_ticket, previous_ticket),
+        "active_customers_growth": growth(current["customers"], previous["customers"]),
+        "period_days": days,
+        "period_end": day_to_iso([last])[0] if bounds else None,
+        "ticket_percentiles": BACKEND.ticket_percentiles(),
     }
 
 @app.get("/api/v1/sales", response_model=List[SaleItem])
-def get_all_sales():
-    """Retorna todas as vendas"""
-    return SALES_DATA
+def get_all_sales(
+    request: Request,
+    cursor: int = Query(0, ge=0, description="Posição da primeira venda (valor de X-Next-Cursor)"),
+    limit: Optional[int] = Query(None, ge=1, description="Máximo de vendas retornadas"),
+):
+    """
+    Retorna as vendas a partir de `cursor`.
+    
+    JSON é paginado (padrão 1000, máximo 10000 por página) e a próxima página
+    vem no cabeçalho X-Next-Cursor. Com `Accept: application/x-ndjson` ou
+    `application/vnd.apache.arrow.stream` as vendas são transmitidas em blocos
+    (sem limite, a menos que `limit` seja informado).
+    """
+    # Vendas são só adicionadas, então a posição é uma chave estável para o cursor;
+    # o snapshot mantém a resposta inteira (inclusive o streaming) no mesmo estado.
+    # No store em memória, o snapshot publicado pelo backend (o mesmo de /kpis):
+    # só lotes já aplicados aos agregados e gravados no WAL
+    snapshot = MEMORY.snapshot().store if BACKEND.uses_memory_store else BACKEND.snapshot()
+    total = len(snapshot)
+    accept = request.headers.get("accept", "")
+    
+    if streaming.NDJSON_MEDIA_TYPE in accept or streaming.ARROW_MEDIA_TYPE in accept:
+        stop = total if limit is None else min(cursor + limit, total)
+        if streaming.ARROW_MEDIA_TYPE in accept:
+            if streaming.pa is None:
+                raise HTTPException(status_code=406, detail="Formato Arrow indisponível (pyarrow não instalado)")
+            body, media_type = streaming.iter_arrow(snapshot, cursor, stop), streaming.ARROW_MEDIA_TYPE
+        else:
+            body, media_type = streaming.iter_ndjson(snapshot, cursor, stop), streaming.NDJSON_MEDIA_TYPE
+        return StreamingResponse(body, media_type=media_type, headers={"X-Total-Count": str(total)})
+    
+    stop = min(cursor + min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE), total)
+    headers = {"X-Total-Count": str(total)}
+    if stop < total:
+        headers["X-Next-Cursor"] = str(stop)
+        headers["Link"] = f'<{request.url.include_query_params(cursor=stop)}>; rel="next"'
+    # Corpo pronto: evita validar cada linha com o response_model
+    with metrics.section("serialize.records"):
+        return Response(codec.encode_records(snapshot, cursor, stop), media_type="application/json", headers=headers)
 
 @app.get("/api/v1/sales/daily")
-def get_daily_sales(days: int = 7):
+def get_daily_sales(request: Request, days: int = 7, start: Optional[date] = None, end: Optional[date] = None):
     """
-    Retorna vendas diárias dos últimos N dias
+    Retorna vendas diárias no intervalo [start, end].
+    
+    Sem start/end, retorna os últimos N dias até hoje. Dias sem vendas vêm zerados.
     """
+    start, end = resolve_range(days, start, end)
+    return cached_json(
+        CACHE, request, "sales/daily", {"start": start, "end": end},
+        lambda: compute_daily_sales(start, end),
+    )
+
+def resolve_range(days: int, start: Optional[date], end: Optional[date], max_range: int = MAX_DAILY_RANGE):
+    """Intervalo [start, end] a partir dos parâmetros (padrão: últimos `days` dias até hoje)"""
+    end = end or datetime.now().date()
+    start = start or end - timedelta(days=days - 1)
+    return check_range(start, end, max_range)
+
+def check_range(start: date, end: date, max_range: int):
+    if start > end:
+        raise HTTPException(status_code=400, detail="start deve ser anterior ou igual a end")
+    if (end - start).days >= max_range:
+        raise HTTPException(status_code=400, detail=f"Intervalo máximo de {max_range} dias")
+    return start, end
+
+def data_range(start: Optional[date] = None, end: Optional[date] = None):
+    """Completa start/end ausentes com o primeiro/último dia com vendas (ou hoje, sem vendas)"""
+    if start is None or end is None:
+        bounds = BACKEND.day_bounds()
+        first, last = (day_to_iso(bounds).astype("datetime64[D]").tolist() if bounds else [datetime.now().date()] * 2)
+        start, end = start or first, end or last
+    return check_range(start, end, MAX_SERIES_RANGE)
+
+def check_series_options(granularity: str, method: str):
+    if granularity == "hour":
+        raise HTTPException(status_code=400, detail="Granularidade por hora indisponível: as vendas são registradas por data")
+    if granularity not in timeseries.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity deve ser um de {list(timeseries.GRANULARITIES)}")
+    if method not in timeseries.DOWNSAMPLING:
+        raise HTTPException(status_code=400, detail=f"downsample deve ser um de {list(timeseries.DOWNSAMPLING)}")
+
+@metrics.timed("aggregate.series")
+def compute_series(start: date, end: date, granularity: str, max_points: Optional[int], method: str = "sum"):
+    start_day = day_number(start)
+    revenue, orders = BACKEND.daily(start_day, day_number(end))
+    series = timeseries.build_series(start_day, revenue, orders, granularity, max_points, method)
+    return {"start": start.isoformat(), "end": end.isoformat(), **series}
+
+@metrics.timed("aggregate.daily")
+def compute_daily_sales(start: date, end: date):
     try:
-        end_date = datetime.now()
-        dates = [(end_date - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
-        dates.reverse()
+        start_day = day_number(start)
+        end_day = day_number(end)
+        revenues, order_counts = BACKEND.daily(start_day, end_day)
+        dates = day_to_iso(range(start_day, end_day + 1))
         
-        daily_data = []
-        for date in dates:
-            day_sales = [s for s in SALES_DATA if s["date"] == date]
-            
-            if day_sales:
-                revenue = sum(s["amount"] * s["quantity"] for s in day_sales)
-                orders = len(day_sales)
-            else:
-                revenue = random.uniform(1000, 5000)
-                orders = random.randint(5, 20)
-            
-            daily_data.append({
-                "date": date,
-                "revenue": round(revenue, 2),
-                "orders": orders
-            })
-        
-        return daily_data
+        return [
+            {"date": day, "revenue": round(float(revenue), 2), "orders": int(orders)}
+            for day, revenue, orders in zip(dates.tolist(), revenues, order_counts)
+        ]
         
     except Exception as e:
         logger.error(f"Erro ao buscar vendas diárias: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/sales/by-category")
-def sales_by_category():
+def sales_by_category(request: Request):
     """Vendas agrupadas por categoria"""
-    categories = {}
+    return cached_json(CACHE, request, "sales/by-category", {}, compute_by_category)
+
+@metrics.timed("aggregate.by_category")
+def compute_by_category():
+    return BACKEND.by_category()
+
+@app.get("/api/v1/sales/top")
+def get_top_sales(
+    request: Request,
+    by: str = Query("product", description="product, customer ou category"),
+    metric: str = Query("revenue", description="revenue ou quantity"),
+    n: int = Query(10, ge=1, le=MAX_TOP_N, description="Tamanho do ranking"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    mode: str = Query("exact", description="exact ou approx (clientes de todo o período, pelo sketch)"),
+):
+    """
+    Os `n` maiores produtos, clientes ou categorias por receita ou quantidade.
     
-    for sale in SALES_DATA:
-        cat = sale["category"]
-        if cat not in categories:
-            categories[cat] = {
-                "category": cat,
-                "revenue": 0,
-                "quantity": 0
-            }
-        categories[cat]["revenue"] += sale["amount"] * sale["quantity"]
-        categories[cat]["quantity"] += sale["quantity"]
+    Sem start/end considera todo o período. O modo exato soma as vendas por
+    chave (produtos e categorias de todo o período saem dos agregados). Com
+    `mode=approx`, clientes de todo o período vêm do Space-Saving mantido na
+    ingestão, em memória fixa: cada item traz o erro máximo da estimativa e
+    `guaranteed` indica se o ranking é com certeza o exato. Nos demais casos
+    approx responde o exato (`approximate: false`).
+    """
+    if by not in TOP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"by deve ser um de {list(TOP_DIMENSIONS)}")
+    if metric not in TOP_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric deve ser um de {list(TOP_METRICS)}")
+    if mode not in ("exact", "approx"):
+        raise HTTPException(status_code=400, detail="mode deve ser exact ou approx")
+    if start is not None or end is not None:
+        start, end = data_range(start, end)
+    params = {"by": by, "metric": metric, "n": n, "start": start, "end": end, "mode": mode}
+    return cached_json(CACHE, request, "sales/top", params, lambda: compute_top(by, metric, n, start, end, mode))
+
+@metrics.timed("aggregate.top")
+def compute_top(by: str, metric: str, n: int, start: Optional[date], end: Optional[date], mode: str = "exact"):
+    result = {"by": by, "metric": metric, "n": n,
+              "start": start.isoformat() if start else None, "end": end.isoformat() if end else None}
+    if mode == "approx" and by == "customer" and start is None:
+        # Com o store em memória (memory e sql) o sketch fica nos agregados dele
+        source = MEMORY if BACKEND.uses_memory_store else BACKEND
+        approximate = source.top_customers(metric, n)
+        if approximate is not None:
+            return {**result, "approximate": True, **approximate}
+    items = BACKEND.top(by, metric, n, day_number(start) if start else None, day_number(end) if end else None)
+    return {**result, "approximate": False, "guaranteed": True, "items": items}
+
+@app.get("/api/v1/query")
+def get_query(
+    request: Request,
+    dimensions: Optional[str] = Query(None, description="Separadas por vírgula: day, week ou month, product, category, customer"),
+    measures: Optional[str] = Query(None, description="Separadas por vírgula: revenue, quantity, orders, average_ticket (padrão: revenue,orders)"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    product: Optional[List[str]] = Query(None, description="Só estes produtos (repita o parâmetro para vários)"),
+    category: Optional[List[str]] = Query(None, description="Só estas categorias"),
+    customer: Optional[List[str]] = Query(None, description="Só estes clientes"),
+    order_by: Optional[str] = Query(None, description="Dimensões ou medidas separadas por vírgula; prefixo - para decrescente"),
+    limit: int = Query(DEFAULT_QUERY_ROWS, ge=1, le=MAX_QUERY_ROWS, description="Máximo de grupos retornados"),
+    explain: bool = Query(False, description="Inclui o caminho escolhido pelo planejador e os tempos (sem cache)"),
+):
+    """
+    Receita, quantidade, pedidos e ticket médio agrupados pelas dimensões
+    escolhidas, com filtros e ordenação.
     
-    return list(categories.values())
+    O planejador responde pelos agregados quando as dimensões e filtros
+    permitem (séries e intervalos sem quantidade, produtos ou categorias de
+    todo o período) e, nos demais casos, varre só as vendas do intervalo
+    filtrando pelos códigos de dicionário. Sem order_by, os grupos vêm na
+    ordem das dimensões. Com `explain` a resposta traz o caminho, o motivo,
+    as vendas lidas e o tempo de cada etapa.
+    """
+    if start is not None or end is not None:
+        start, end = data_range(start, end)
+    try:
+        spec = query.build_spec(
+            dimensions, measures, day_number(start) if start else None, day_number(end) if end else None,
+            {"product": product, "category": category, "customer": customer}, order_by, limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if explain:
+        # Tempos medidos agora: não passa pelo cache
+        return compute_query(spec, start, end, explain=True)
+    params = {"spec": spec._asdict(), "start": start, "end": end}
+    return cached_json(CACHE, request, "query", params, lambda: compute_query(spec, start, end))
+
+@metrics.timed("aggregate.query")
+def compute_query(spec: query.QuerySpec, start: Optional[date], end: Optional[date], explain: bool = False):
+    # Com o store em memória (memory e sql) a consulta é respondida por ele
+    source = MEMORY if BACKEND.uses_memory_store else BACKEND
+    result = query.run(source.query, spec)
+    plan = result.pop("explain")
+    metrics.QUERY_PLANS.inc(plan["source"])
+    if plan["total_ms"] >= SLOW_QUERY_MS:
+        logger.warning(f"Consulta lenta ({plan['total_ms']:.0f} ms): {spec._asdict()} plano {plan}")
+    response = {
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "filters": {name: list(values) for name, values in spec.filters.items()},
+        "order_by": [("-" if descending else "") + key for key, descending in spec.order_by],
+        "limit": spec.limit,
+        **result,
+    }
+    if explain:
+        response["explain"] = plan
+    return response
+
+@app.get("/api/v1/sales/timeseries")
+def get_sales_timeseries(
+    request: Request,
+    granularity: str = Query("day", description="day, week ou month"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    max_points: Optional[int] = Query(None, ge=2, le=MAX_SERIES_POINTS, description="Máximo de pontos retornados"),
+    downsample: str = Query("sum", description="sum (soma períodos vizinhos) ou lttb"),
+):
+    """
+    Receita e pedidos por dia, semana (início na segunda) ou mês em [start, end].
+    
+    Sem start/end usa o período completo com vendas. Com `max_points`, séries
+    maiores são reduzidas no servidor somando períodos vizinhos ou por LTTB.
+    """
+    check_series_options(granularity, downsample)
+    start, end = data_range(start, end)
+    params = {"granularity": granularity, "start": start, "end": end, "max_points": max_points, "downsample": downsample}
+    return cached_json(
+        CACHE, request, "sales/timeseries", params,
+        lambda: compute_series(start, end, granularity, max_points, downsample),
+    )
+
+@app.get("/api/v1/dashboard")
+def get_dashboard(
+    request: Request,
+    days: int = 7,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    all_time: bool = Query(False, description="Série de todo o período com vendas (ignora days/start/end)"),
+    granularity: str = Query("day", description="day, week ou month"),
+    max_points: Optional[int] = Query(None, ge=2, le=MAX_SERIES_POINTS),
+):
+    """
+    Tudo que o dashboard precisa em uma única requisição (com cache e ETag).
+    
+    Traz os KPIs, a série de [start, end] (mesmos parâmetros de
+    /api/v1/sales/daily, ou todo o período com `all_time`) agregada por
+    `granularity`, as vendas por categoria e as estatísticas da análise
+    detalhada.
+    """
+    check_series_options(granularity, "sum")
+    start, end = data_range() if all_time else resolve_range(days, start, end, MAX_SERIES_RANGE)
+    # KPIs de período na janela escolhida (todo o período usa a janela padrão)
+    kpi_days = KPI_WINDOW_DAYS if all_time else min((end - start).days + 1, MAX_DAILY_RANGE)
+    params = {"start": start, "end": end, "granularity": granularity, "max_points": max_points, "kpi_days": kpi_days}
+    return cached_json(
+        CACHE, request, "dashboard", params,
+        lambda: compute_dashboard(start, end, granularity, max_points, kpi_days),
+    )
 
-@app.post("/api/v1/sales/batch", response_model=dict)
-async def import_sales_batch(sales: List[SaleItem]):
+@metrics.timed("aggregate.dashboard")
+def compute_dashboard(start: date, end: date, granularity: str = "day", max_points: Optional[int] = None,
+                      kpi_days: int = KPI_WINDOW_DAYS):
+    return {
+        "kpis": compute_kpis(kpi_days),
+        "series": compute_series(start, end, granularity, max_points),
+        "by_category": compute_by_category(),
+        "detail": compute_detail(),
+    }
+
+def compute_detail():
+    detail = BACKEND.detail()
+    return {
+        "average_amount": round(detail["average_amount"], 2),
+        "total_items": detail["total_items"],
+        "unique_products": detail["unique_products"],
+    }
+
+@metrics.timed("aggregate.events")
+def summarize_changes(categories: set) -> dict:
+    """Valores atuais enviados em cada delta de /api/v1/events (mesmo formato do /dashboard)"""
+    return {
+        "kpis": {str(days): compute_kpis(days) for days in EVENT_KPI_WINDOWS},
+        "categories": [row for row in compute_by_category() if row["category"] in categories],
+        "detail": compute_detail(),
+    }
+
+@app.get("/api/v1/events")
+async def sales_events(request: Request):
     """
-    Importa múltiplas vendas em lote.
+    Deltas das vendas em Server-Sent Events (text/event-stream).
+    
+    Após cada importação (juntando lotes de até EVENT_INTERVAL_SECONDS) envia
+    um evento `sales` com o acréscimo por dia, os totais atuais das
+    categorias alteradas, os KPIs de cada janela de EVENT_KPI_WINDOWS e as
+    estatísticas detalhadas. Com Last-Event-ID reenvia os eventos perdidos ou
+    um evento `reset` (recarregar tudo).
     """
+    return StreamingResponse(
+        EVENTS.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/v1/rollups/rebuild")
+def rebuild_rollups_endpoint():
+    """Reconstrói os agregados e confere contra uma varredura completa"""
+    differences = rebuild_rollups()
+    CACHE.bump_version()
+    return {"consistent": not differences, "differences": differences, "rows": len(STORE)}
+
+async def save_sales_batch(ingest_batch, *args) -> dict:
+    """Grava o lote com `ingest_batch(*args)` fora do event loop; 422 para dados inválidos"""
     try:
-        # Adicionar à lista em memória (simulando banco de dados)
-        for item in sales:
-            nova_venda = item.dict()
-            SALES_DATA.append(nova_venda)
-            logger.info(f"Venda adicionada: {nova_venda}")
-        
-        logger.info(f"Total de {len(sales)} vendas importadas com sucesso.")
-        return {"message": "Dados importados com sucesso", "count": len(sales)}
-        
-        # Em produção, substitua o loop acima por inserção no banco real:
-        # db = SessionLocal()
-        # for item in sales:
-        #     sale = Sale(**item.dict())
-        #     db.add(sale)
-        # db.commit()
-        # db.close()
-        
+        # Adicionar ao armazenamento colunar em uma única operação, fora do event loop
+        # (as leituras continuam sendo atendidas enquanto o lote é gravado)
+        count = await run_in_threadpool(ingest_batch, *args)
+        logger.info(f"Total de {count} vendas importadas com sucesso.")
+        return {"message": "Dados importados com sucesso", "count": count}
+    except ValueError as e:
+        logger.error(f"Dados inválidos na importação em lote: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Erro na importação em lote: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+if codec.fast():
+    def ingest_json_batch(body: bytes) -> int:
+        return ingest_columns(codec.decode_sales(body))
+
+    @app.post(
+        "/api/v1/sales/batch",
+        response_model=dict,
+        openapi_extra={"requestBody": {"required": True, "content": {"application/json": {
+            "schema": {"type": "array", "items": {"$ref": "#/components/schemas/SaleItem"}}
+        }}}},
+    )
+    async def import_sales_batch(request: Request):
+        """
+        Importa múltiplas vendas em lote.
+        
+        Com JSON_CODEC=orjson o corpo vai direto para colunas (sem um SaleItem
+        por venda); vendas inválidas respondem 422 com a primeira encontrada.
+        """
+        return await save_sales_batch(ingest_json_batch, await request.body())
+else:
+    @app.post("/api/v1/sales/batch", response_model=dict)
+    async def import_sales_batch(sales: List[SaleItem]):
+        """
+        Importa múltiplas vendas em lote.
+        """
+        return await save_sales_batch(ingest, [item.dict() for item in sales])
+
+@app.post("/api/v1/sales/bulk")
+async def import_sales_bulk(request: Request):
+    """
+    Importação em massa a partir de CSV, NDJSON ou Parquet (pelo Content-Type).
+    
+    O corpo é lido em blocos e validado por coluna; linhas inválidas são
+    descartadas e o resumo traz as contagens e alguns erros de exemplo.
+    """
+    content_type = request.headers.get("content-type", "")
+    if not bulk.is_supported(content_type):
+        raise HTTPException(
+            status_code=415,
+            detail="Use Content-Type text/csv, application/x-ndjson ou application/vnd.apache.parquet"
+        )
+    
+    started = time.perf_counter()
+    with tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        try:
+            columns, summary = await run_in_threadpool(bulk.parse_bulk, body, content_type)
+            if columns is not None and summary["accepted"]:
+                await run_in_threadpool(ingest_columns, columns, "bulk")
+        except ValueError as e:
+            logger.error(f"Dados inválidos na importação em massa: {e}")
+            raise HTTPException(status_code=422, detail=str(e))
+        except Exception as e:
+            logger.error(f"Erro na importação em massa: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows"] / elapsed) if elapsed else None
+    logger.info(
+        f"Importação em massa: {summary['accepted']} aceitas, {summary['rejected']} rejeitadas "
+        f"em {elapsed:.2f}s"
+    )
+    return summary
+
+@app.post("/api/v1/imports", status_code=202)
+async def create_import(
+    request: Request,
+    mapping: Optional[str] = Query(None, description='Colunas do arquivo em JSON, ex.: {"date": "Data", "amount": "Valor"}'),
+):
+    """
+    Recebe um arquivo grande (CSV, NDJSON, Parquet ou Excel .xlsx, pelo
+    Content-Type) e devolve o id da importação sem esperar o processamento.
+    
+    O corpo vai direto para disco; a leitura, validação e gravação rodam em
+    segundo plano, em blocos. Acompanhe por GET /api/v1/imports/{id}.
+    """
+    content_type = request.headers.get("content-type", "")
+    if imports.file_kind(content_type) is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Use Content-Type text/csv, application/x-ndjson, application/vnd.apache.parquet "
+                   "ou application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    columns = {}
+    if mapping:
+        try:
+            columns = json.loads(mapping)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="mapping deve ser um objeto JSON")
+        known = bulk.REQUIRED_COLUMNS + ["customer"]
+        if not isinstance(columns, dict) or any(key not in known or not isinstance(value, str) for key, value in columns.items()):
+            raise HTTPException(status_code=422, detail=f"mapping deve associar colunas de {known} a nomes de colunas do arquivo")
+    
+    job = IMPORTS.create(content_type, columns)
+    try:
+        with open(job.path, "wb") as file:
+            async for chunk in request.stream():
+                file.write(chunk)
+    except Exception:
+        IMPORTS.discard(job)
+        raise
+    IMPORTS.enqueue(job)
+    logger.info(f"Importação {job.id} na fila ({job.bytes} bytes)")
+    return codec.JsonResponse(IMPORTS.get(job.id), status_code=202, headers={"Location": f"/api/v1/imports/{job.id}"})
+
+@app.get("/api/v1/imports/{job_id}")
+def get_import(job_id: str):
+    """
+    Estado de uma importação: status (queued, running, done, failed), bytes e
+    linhas processadas, aceitas, rejeitadas (com exemplos), vazão e ETA.
+    """
+    status = IMPORTS.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Importação não encontrada")
+    return status
@@ -0,0 +1,325 @@
+"""
+Métricas da API no formato texto do Prometheus e medição de trechos internos
+
+Contadores, gauges e histogramas com rótulos, sem dependências externas, e um
+middleware ASGI que mede cada rota (pelo caminho declarado, não pela URL).
+Trechos quentes (agregação, serialização, validação) são medidos com
+`section` (gerenciador de contexto) ou `timed` (decorador) no histograma
+sales_api_section_seconds:
+
+    with metrics.section("serialize.records"):
+        ...
+
+    @metrics.timed("aggregate.kpis")
+    def compute_kpis(...): ...
+
+Com `configure(False)` nada é registrado: `section` devolve um contexto vazio
+compartilhado e `timed` só chama a função.
+"""
+
+import bisect
+import contextlib
+import functools
+import math
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de 0,5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Vendas por lote importado
+BATCH_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+_enabled = True
+
+
+def configure(enabled: bool):
+    """Liga ou desliga a coleta (a exposição em /metrics continua respondendo)"""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Registry:
+    """Conjunto de métricas expostas em /metrics"""
+
+    def __init__(self):
+        self.metrics: List["Metric"] = []
+
+    def register(self, metric: "Metric"):
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self.metrics.append(metric)
+
+    def render(self) -> bytes:
+        """Todas as métricas no formato texto 0.0.4"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, names, values, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_labels(names, values)} {_format_value(value)}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    """Base: valores por combinação de rótulos (tupla de textos)"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}, recebeu {labels}")
+        return tuple(str(label) for label in labels)
+
+    def samples(self):
+        """(sufixo, nomes dos rótulos, valores dos rótulos, valor) de cada série"""
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in sorted(items):
+            yield "", self.labelnames, labels, value
+
+
+class Counter(Metric):
+    """Valor que só cresce (requisições, vendas importadas)"""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Valor que sobe e desce (requisições em andamento, linhas no store)"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, *labels, amount: float = 1.0):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Distribuição em faixas cumulativas (_bucket), com _sum e _count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Registry = REGISTRY):
+        if "le" in labelnames:
+            raise ValueError("O rótulo 'le' é reservado aos histogramas")
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Contagem por faixa (não cumulativa; a soma é feita na exposição) e soma dos valores
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(counts), total)) for labels, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, labels + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, labels, total
+            yield "_count", self.labelnames, labels, cumulative
+
+
+# Métricas da API
+
+REQUESTS = Counter("sales_api_requests_total", "Requisições HTTP por rota e status", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("sales_api_request_duration_seconds", "Latência das requisições HTTP por rota", ["method", "route"])
+IN_PROGRESS = Gauge("sales_api_requests_in_progress", "Requisições HTTP em andamento", ["method"])
+
+SECTION_SECONDS = Histogram(
+    "sales_api_section_seconds", "Duração de trechos internos (agregação, serialização, validação)", ["section"]
+)
+
+INGEST_ROWS = Counter("sales_api_ingest_rows_total", "Vendas importadas", ["source"])
+INGEST_BATCH_ROWS = Histogram("sales_api_ingest_batch_rows", "Vendas por lote importado", ["source"], buckets=BATCH_BUCKETS)
+INGEST_SECONDS = Histogram("sales_api_ingest_duration_seconds", "Tempo de gravação de cada lote", ["source"])
+INGEST_ROWS_PER_SECOND = Gauge("sales_api_ingest_rows_per_second", "Vazão do último lote importado", ["source"])
+
+IMPORT_JOBS = Counter("sales_api_import_jobs_total", "Importações em segundo plano terminadas por status", ["status"])
+
+QUERY_PLANS = Counter("sales_api_query_plans_total", "Consultas de /api/v1/query por caminho do planejador", ["source"])
+
+WAL_RECORDS = Counter("sales_api_wal_records_total", "Lotes gravados no WAL do store em memória")
+WAL_SYNCS = Counter("sales_api_wal_syncs_total", "fsyncs do WAL (um fsync confirma vários lotes concorrentes)")
+
+STORE_ROWS = Gauge("sales_api_store_rows", "Vendas no store em memória")
+MEMORY_BYTES = Gauge("sales_api_memory_bytes", "Memória ocupada por componente", ["component"])
+
+CACHE_REQUESTS = Counter(
+    "sales_api_cache_requests_total", "Leituras do cache de respostas (hit, miss, not_modified)", ["endpoint", "result"]
+)
+CACHE_HIT_RATIO = Gauge("sales_api_cache_hit_ratio", "Fração de respostas sem recálculo (hit ou 304)", ["endpoint"])
+
+EVENT_SUBSCRIBERS = Gauge("sales_api_event_subscribers", "Conexões abertas em /api/v1/events")
+EVENTS_PUBLISHED = Counter("sales_api_events_published_total", "Eventos enviados aos assinantes de /api/v1/events", ["event"])
+
+DEPENDENCY_UP = Gauge("sales_api_dependency_up", "Dependência respondeu na última verificação de /health", ["dependency"])
+DEPENDENCY_SECONDS = Gauge("sales_api_dependency_latency_seconds", "Latência medida na última verificação de /health", ["dependency"])
+
+
+def record_ingest(source: str, rows: int, seconds: float):
+    """Registra um lote importado (vendas, tamanho do lote e vazão)"""
+    INGEST_ROWS.inc(source, amount=rows)
+    INGEST_BATCH_ROWS.observe(rows, source)
+    INGEST_SECONDS.observe(seconds, source)
+    if seconds > 0:
+        INGEST_ROWS_PER_SECOND.set(rows / seconds, source)
+
+
+def update_cache_ratios():
+    """Recalcula a fração de acertos do cache por rota a partir dos contadores"""
+    totals: Dict[str, List[float]] = {}
+    for _, _, (endpoint, result), value in CACHE_REQUESTS.samples():
+        counts = totals.setdefault(endpoint, [0.0, 0.0])
+        counts[1] += value
+        if result != "miss":
+            counts[0] += value
+    for endpoint, (served, total) in totals.items():
+        CACHE_HIT_RATIO.set(served / total if total else 0.0, endpoint)
+
+
+# Medição de trechos
+
+_NOOP = contextlib.nullcontext()
+
+
+class _Section:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        SECTION_SECONDS.observe(time.perf_counter() - self.started, self.name)
+        return False
+
+
+def section(name: str):
+    """Contexto que mede o trecho em sales_api_section_seconds{section=name}"""
+    return _Section(name) if _enabled else _NOOP
+
+
+def timed(name: str):
+    """Decorador que mede cada chamada da função como o trecho `name`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                SECTION_SECONDS.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: requisições em andamento, latência e status por rota.
+
+    A rota é o caminho declarado (ex.: /api/v1/sales/daily), conhecido depois
+    do roteamento; URLs sem rota contam como "unmatched" para não criar uma
+    série por URL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec(method)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            REQUESTS.inc(method, route, status)
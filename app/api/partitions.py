@@ -0,0 +1,806 @@
+"""
+Armazenamento das vendas em partições mensais Parquet, com poda por data
+
+Cada lote é dividido por mês e cada parte vira um arquivo Parquet novo em
+`<diretório>/<AAAA-MM>/part-<n>.parquet`. O manifesto (`manifest.json`)
+guarda estatísticas pequenas de cada arquivo: primeiro e último dia, vendas,
+receita, quantidade e soma dos valores unitários.
+
+- Totais, contagem e limites de datas saem só do manifesto, sem ler dados.
+- Consultas por intervalo (`daily`, `activity`) leem só os arquivos cujo
+  [min_day, max_day] cruza o intervalo, em paralelo num pool de threads
+  (pyarrow e NumPy liberam o GIL).
+- Arquivos são lidos por mapeamento de memória quando uma consulta os toca;
+  as colunas lidas ficam num LRU limitado por `cache_bytes` e o resto do
+  histórico fica só em disco.
+- Meses com muitos arquivos pequenos (lotes de POST /sales/batch) são
+  compactados em um único arquivo.
+- O manifesto guarda também o Space-Saving dos maiores clientes por
+  métrica, atualizado a cada lote (ranking aproximado sem ler partições),
+  e a receita e a quantidade de cada categoria em cada arquivo.
+- Ao lado de cada arquivo, `part-<n>.stats.npz` guarda sketches calculados
+  na gravação: t-digest do valor dos pedidos, HyperLogLog dos produtos e
+  dos clientes de cada categoria. Percentis, produtos distintos e a
+  quebra por categoria combinam esses sketches (arquivos pequenos, lidos
+  uma vez por processo), sem ler as colunas das partições.
+
+A posição de cada venda (cursor de /sales) segue a ordem das partições: mês
+e, dentro do mês, ordem de gravação. Só lotes com datas de meses anteriores
+deslocam as posições seguintes.
+
+Vários processos (`uvicorn --workers N`) podem usar o mesmo diretório: as
+gravações são exclusivas (flock no arquivo `lock`) e sempre partem do
+manifesto relido dentro do lock; as leituras relêem o manifesto quando outro
+processo o substituiu.
+"""
+
+import contextlib
+import copy
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from app.api.query import DATE_DIMENSIONS, GroupTotals, QuerySpec, period_keys
+from app.api.sketches import HLL_REGISTERS, TOP_METRICS, SpaceSaving, TDigest, hll_estimate, hll_update
+from app.api.storage import SalesBackend, approximate_top, top_indices, top_totals
+from app.api.store import day_to_iso, parse_days, parse_quantities
+
+MANIFEST = "manifest.json"
+LOCK = "lock"
+
+SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("product", pa.string()),
+    ("category", pa.string()),
+    ("amount", pa.float64()),
+    ("quantity", pa.int32()),
+    ("customer", pa.string()),
+])
+
+# Linhas por row group (unidade de leitura da listagem paginada)
+ROW_GROUP_ROWS = 65_536
+
+# Arquivos num mesmo mês a partir dos quais o mês é reescrito num arquivo só
+COMPACT_FILES = 32
+
+# Arquivos substituídos pela compactação continuam no disco por este tempo (leituras em
+# andamento, também de outros processos); a lista fica no manifesto
+GARBAGE_SECONDS = 300
+
+# Colunas numéricas guardadas no cache como vetores NumPy (as demais como arrays Arrow)
+NUMERIC_COLUMNS = ("date", "amount", "quantity")
+
+
+class Partition(NamedTuple):
+    """Um arquivo Parquet e as suas estatísticas"""
+
+    path: str
+    month: str
+    seq: int
+    rows: int
+    min_day: int
+    max_day: int
+    revenue: float
+    quantity: int
+    amount: float
+    # Categoria -> [receita, quantidade] (None em manifestos anteriores, calculado ao carregar)
+    categories: Optional[Dict[str, list]] = None
+
+    def overlaps(self, start_day: int, end_day: int) -> bool:
+        return self.min_day <= end_day and self.max_day >= start_day
+
+    def inside(self, start_day: int, end_day: int) -> bool:
+        return start_day <= self.min_day and self.max_day <= end_day
+
+
+class PartitionStats(NamedTuple):
+    """Sketches de um arquivo (gravados ao lado dele), combinados entre partições na leitura"""
+
+    tickets: TDigest
+    products: np.ndarray    # registradores HyperLogLog dos produtos
+    categories: np.ndarray  # categoria de cada linha de `customers`
+    customers: np.ndarray   # registradores HyperLogLog dos clientes, uma linha por categoria
+
+
+def stats_path(path: str) -> str:
+    """Arquivo de sketches de uma partição"""
+    return path[:-len(".parquet")] + ".stats.npz"
+
+
+def text_hashes(values) -> np.ndarray:
+    """Hash de 64 bits de textos, igual em todos os processos (registradores combináveis)"""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def table_stats(table: pa.Table) -> Tuple[Dict[str, list], PartitionStats]:
+    """Totais por categoria (manifesto) e sketches das vendas de uma tabela"""
+    revenue = table.column("amount").to_numpy() * table.column("quantity").to_numpy()
+    tickets = TDigest()
+    tickets.update(revenue)
+    summary = pa.table({
+        "category": table.column("category"),
+        "revenue": revenue,
+        "quantity": table.column("quantity").to_numpy().astype(np.int64),
+    }).group_by("category").aggregate([("revenue", "sum"), ("quantity", "sum")])
+    names = summary.column("category").to_pylist()
+    totals = {
+        name: [part_revenue, part_quantity]
+        for name, part_revenue, part_quantity in zip(
+            names, summary.column("revenue_sum").to_pylist(), summary.column("quantity_sum").to_pylist()
+        )
+    }
+
+    products = np.zeros((1, HLL_REGISTERS), dtype=np.uint8)
+    uniques = pc.unique(table.column("product")).to_numpy(zero_copy_only=False)
+    hll_update(products, np.zeros(len(uniques), dtype=np.int64), text_hashes(uniques))
+    pairs = table.select(["category", "customer"]).group_by(["category", "customer"]).aggregate([])
+    pairs = pairs.filter(pc.is_valid(pairs.column("customer")))
+    customers = np.zeros((len(names), HLL_REGISTERS), dtype=np.uint8)
+    rows = pd.Index(names).get_indexer(pairs.column("category").to_numpy(zero_copy_only=False))
+    hll_update(customers, rows, text_hashes(pairs.column("customer").to_numpy(zero_copy_only=False)))
+    return totals, PartitionStats(tickets, products[0], np.array(names, dtype=str), customers)
+
+
+def save_stats(path: str, stats: PartitionStats):
+    with open(path + ".tmp", "wb") as file:
+        np.savez_compressed(
+            file, tickets_means=stats.tickets.means, tickets_weights=stats.tickets.weights,
+            tickets_range=np.array([stats.tickets.min, stats.tickets.max]),
+            products=stats.products, categories=stats.categories, customers=stats.customers,
+        )
+    os.replace(path + ".tmp", path)
+
+
+def load_stats(path: str) -> PartitionStats:
+    with np.load(path) as data:
+        tickets = TDigest()
+        tickets.means, tickets.weights = data["tickets_means"], data["tickets_weights"]
+        tickets.min, tickets.max = (float(value) for value in data["tickets_range"])
+        return PartitionStats(tickets, data["products"], data["categories"], data["customers"])
+
+
+class ColumnCache:
+    """LRU de colunas lidas, limitado em bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: "OrderedDict[Tuple[str, str], object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str], load):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        value = load()
+        size = value.nbytes
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = value
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self.nbytes -= old.nbytes
+        return value
+
+    def discard(self, path: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self.nbytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+class PartitionView:
+    """Conjunto imutável de partições publicado por uma gravação (leituras consistentes)"""
+
+    def __init__(self, root: str, partitions: Sequence[Partition], cache: ColumnCache):
+        self.root = root
+        self.partitions = tuple(partitions)
+        self.cache = cache
+        self.offsets = np.cumsum([0] + [part.rows for part in self.partitions])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def path(self, part: Partition) -> str:
+        return os.path.join(self.root, part.path)
+
+    def column(self, part: Partition, name: str):
+        """Coluna inteira de uma partição (dias como int32, numéricas como NumPy, textos como Arrow)"""
+        def load():
+            array = pq.read_table(self.path(part), columns=[name], memory_map=True).column(name).combine_chunks()
+            if name == "date":
+                return array.cast(pa.int32()).to_numpy()
+            if name in NUMERIC_COLUMNS:
+                return array.to_numpy()
+            return array
+        return self.cache.get((part.path, name), load)
+
+    def slices(self, start: int, stop: int) -> Iterator[Tuple[Partition, int, int]]:
+        """(partição, início, fim locais) das posições [start, stop)"""
+        stop = min(stop, len(self))
+        first = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        for i in range(max(first, 0), len(self.partitions)):
+            base = int(self.offsets[i])
+            if base >= stop:
+                break
+            yield self.partitions[i], max(start - base, 0), min(stop - base, self.partitions[i].rows)
+
+    def read_rows(self, part: Partition, start: int, stop: int) -> pa.Table:
+        """Linhas [start, stop) de uma partição, lendo só os row groups necessários"""
+        file = pq.ParquetFile(self.path(part), memory_map=True)
+        groups, base, skip = [], 0, None
+        for i in range(file.num_row_groups):
+            rows = file.metadata.row_group(i).num_rows
+            if base + rows > start and base < stop:
+                groups.append(i)
+                skip = base if skip is None else skip
+            base += rows
+        if not groups:
+            return SCHEMA.empty_table()
+        return file.read_row_groups(groups).slice(start - skip, stop - start)
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> List[dict]:
+        """Linhas no formato dict (mesmo formato do SaleItem)"""
+        stop = len(self) if stop is None else stop
+        rows = []
+        for table in self.iter_tables(start, stop):
+            columns = {
+                "date": day_to_iso(table.column("date").cast(pa.int32()).to_numpy()).tolist(),
+                "product": table.column("product").to_pylist(),
+                "category": table.column("category").to_pylist(),
+                "amount": table.column("amount").to_pylist(),
+                "quantity": table.column("quantity").to_pylist(),
+                "customer": table.column("customer").to_pylist(),
+            }
+            names = list(columns)
+            rows.extend(dict(zip(names, values)) for values in zip(*columns.values()))
+        return rows
+
+    def iter_tables(self, start: int, stop: int, chunk_rows: Optional[int] = None) -> Iterator[pa.Table]:
+        """Linhas [start, stop) como tabelas Arrow, no máximo `chunk_rows` por tabela"""
+        for part, lo, hi in self.slices(start, stop):
+            step = chunk_rows or hi - lo
+            for chunk in range(lo, hi, step):
+                yield self.read_rows(part, chunk, min(chunk + step, hi))
+
+
+class PartitionedBackend(SalesBackend):
+    """
+    Vendas em partições mensais Parquet num diretório, agregadas sob demanda.
+
+    Não mantém cópia das vendas no store em memória: só as colunas das
+    partições consultadas recentemente ficam no cache.
+    """
+
+    name = "partitioned"
+    uses_memory_store = False
+
+    def __init__(self, directory: str, threads: Optional[int] = None, cache_bytes: int = 256 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.cache = ColumnCache(cache_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=threads or min(8, os.cpu_count() or 1), thread_name_prefix="partitions")
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, LOCK), "a+b")
+        self._stamp = None
+        self._next_seq = 0
+        self._garbage: List[Tuple[float, str]] = []
+        self._view = PartitionView(directory, [], self.cache)
+        self._top = {metric: SpaceSaving() for metric in TOP_METRICS}
+        # Sketches por caminho de arquivo (arquivos nunca são reescritos no mesmo caminho)
+        self._stats: Dict[str, PartitionStats] = {}
+        self._stats_lock = threading.Lock()
+
+        with self._locked():
+            # Dentro do lock: arquivos de uma gravação em andamento em outro processo já estão no manifesto
+            self._remove_orphans(self._view.partitions)
+
+    def snapshot(self) -> PartitionView:
+        """Partições atuais, para várias leituras seguidas no mesmo estado"""
+        self._refresh()
+        return self._view
+
+    def _refresh(self):
+        """Relê o manifesto se ele foi substituído (por este ou outro processo) desde a última leitura"""
+        path = os.path.join(self.directory, MANIFEST)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._stamp:
+            return
+        with self._load_lock:
+            with open(path) as file:
+                stat = os.fstat(file.fileno())
+                stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if stamp == self._stamp:
+                    return
+                manifest = json.load(file)
+            self._load(manifest)
+            self._stamp = stamp
+
+    def _load(self, manifest: dict):
+        partitions = [Partition(**entry) for entry in manifest["partitions"]]
+        for i, part in enumerate(partitions):
+            if part.categories is None:
+                # Arquivo gravado antes dos totais por categoria: calculados uma única vez
+                table = pq.read_table(os.path.join(self.directory, part.path), memory_map=True)
+                totals, stats = table_stats(table)
+                partitions[i] = part._replace(categories=totals)
+                with self._stats_lock:
+                    self._stats.setdefault(part.path, stats)
+        view = PartitionView(self.directory, partitions, self.cache)
+        if "top_customers" in manifest:
+            top = {metric: SpaceSaving.from_state(state) for metric, state in manifest["top_customers"].items()}
+        else:
+            # Diretório gravado antes do sketch: monta a partir das partições uma única vez
+            top = {metric: SpaceSaving() for metric in TOP_METRICS}
+            for part in partitions:
+                table = pq.read_table(view.path(part), columns=["customer", "amount", "quantity"], memory_map=True)
+                self._update_top(top, *(table.column(name).to_numpy(zero_copy_only=False)
+                                        for name in ("customer", "amount", "quantity")))
+        for path in {part.path for part in self._view.partitions} - {part.path for part in partitions}:
+            # Arquivos substituídos pela compactação de outro processo
+            self._discard(path)
+        self._next_seq = manifest["next_seq"]
+        self._garbage = [tuple(entry) for entry in manifest.get("garbage", [])]
+        self._view, self._top = view, top
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Gravação exclusiva entre threads e processos, a partir do manifesto mais recente"""
+        with self._write_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    @property
+    def nbytes(self) -> int:
+        return self.cache.nbytes
+
+    def ping(self):
+        if not os.access(self.directory, os.W_OK):
+            raise OSError(f"Diretório de partições sem permissão de escrita: {self.directory}")
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self._lock_file.close()
+
+    # Escrita
+
+    def append_columns(self, columns: dict) -> int:
+        day = parse_days(columns["date"])
+        n = len(day)
+        if n == 0:
+            return 0
+        customer = columns.get("customer")
+        batch = {
+            "date": day,
+            "product": np.asarray(columns["product"], dtype=object),
+            "category": np.asarray(columns["category"], dtype=object),
+            "amount": np.asarray(columns["amount"], dtype=np.float64),
+            "quantity": parse_quantities(columns["quantity"]),
+            "customer": np.full(n, None, dtype=object) if customer is None else np.asarray(customer, dtype=object),
+        }
+        for name, values in batch.items():
+            if len(values) != n:
+                raise ValueError(f"Coluna '{name}' com {len(values)} linhas, esperado {n}")
+
+        months = day.astype("datetime64[D]").astype("datetime64[M]")
+        with self._locked():
+            top = {metric: copy.copy(sketch) for metric, sketch in self._top.items()}
+            self._update_top(top, batch["customer"], batch["amount"], batch["quantity"])
+            partitions = list(self._view.partitions)
+            touched = set()
+            for month in np.unique(months):
+                rows = np.flatnonzero(months == month)
+                arrays = [pa.array(day[rows], type=pa.int32()).cast(pa.date32())]
+                arrays += [pa.array(batch[name][rows], type=SCHEMA.field(name).type) for name in SCHEMA.names[1:]]
+                table = pa.Table.from_arrays(arrays, schema=SCHEMA)
+                partitions.append(self._write(str(month), table))
+                touched.add(str(month))
+            for month in sorted(touched):
+                files = [part for part in partitions if part.month == month]
+                if len(files) >= COMPACT_FILES:
+                    partitions = self._compact(partitions, files)
+            partitions.sort(key=lambda part: (part.month, part.seq))
+            self._collect_garbage()
+            with self._load_lock:
+                self._save(partitions, top)
+                self._view = PartitionView(self.directory, partitions, self.cache)
+                self._top = top
+        return n
+
+    @staticmethod
+    def _update_top(top: Dict[str, SpaceSaving], customer, amount, quantity):
+        """Soma um lote aos sketches dos maiores clientes (cópias, publicadas depois)"""
+        top["revenue"].update(customer, amount * quantity)
+        top["quantity"].update(customer, quantity)
+
+    def _write(self, month: str, table: pa.Table) -> Partition:
+        """Grava `table` como um arquivo novo do mês e calcula as estatísticas"""
+        seq = self._next_seq
+        self._next_seq += 1
+        path = os.path.join(month, f"part-{seq:08d}.parquet")
+        target = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        pq.write_table(table, target + ".tmp", row_group_size=ROW_GROUP_ROWS)
+        os.replace(target + ".tmp", target)
+        totals, stats = table_stats(table)
+        save_stats(stats_path(target), stats)
+        with self._stats_lock:
+            self._stats[path] = stats
+
+        day = table.column("date").cast(pa.int32()).to_numpy()
+        amount = table.column("amount").to_numpy()
+        quantity = table.column("quantity").to_numpy()
+        return Partition(
+            path=path, month=month, seq=seq, rows=table.num_rows,
+            min_day=int(day.min()), max_day=int(day.max()),
+            revenue=float(np.dot(amount, quantity)), quantity=int(quantity.sum()), amount=float(amount.sum()),
+            categories=totals,
+        )
+
+    def _discard(self, path: str):
+        """Esquece colunas e sketches de um arquivo que saiu do manifesto"""
+        self.cache.discard(path)
+        with self._stats_lock:
+            self._stats.pop(path, None)
+
+    def _compact(self, partitions: List[Partition], files: List[Partition]) -> List[Partition]:
+        """Reescreve os arquivos de um mês num só (mesma ordem das linhas)"""
+        files = sorted(files, key=lambda part: part.seq)
+        table = pa.concat_tables(
+            pq.read_table(os.path.join(self.directory, part.path), memory_map=True) for part in files
+        )
+        merged = self._write(files[0].month, table)
+        now = time.time()
+        for part in files:
+            self._garbage.append((now, part.path))
+            self._discard(part.path)
+        replaced = {part.path for part in files}
+        return [part for part in partitions if part.path not in replaced] + [merged]
+
+    def _save(self, partitions: List[Partition], top: Dict[str, SpaceSaving]):
+        path = os.path.join(self.directory, MANIFEST)
+        manifest = {
+            "next_seq": self._next_seq,
+            "partitions": [part._asdict() for part in partitions],
+            "top_customers": {metric: sketch.state() for metric, sketch in top.items()},
+            "garbage": [list(entry) for entry in self._garbage],
+        }
+        with open(path + ".tmp", "w") as file:
+            json.dump(manifest, file)
+        os.replace(path + ".tmp", path)
+        stat = os.stat(path)
+        self._stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _collect_garbage(self):
+        limit = time.time() - GARBAGE_SECONDS
+        while self._garbage and self._garbage[0][0] <= limit:
+            _, path = self._garbage.pop(0)
+            for name in (path, stats_path(path)):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _remove_orphans(self, partitions: List[Partition]):
+        """Apaga arquivos fora do manifesto (gravação ou compactação interrompida); só com o lock"""
+        known = {part.path for part in partitions} | {path for _, path in self._garbage}
+        known |= {stats_path(path) for path in known}
+        for month in os.listdir(self.directory):
+            folder = os.path.join(self.directory, month)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if os.path.join(month, name) not in known:
+                    os.remove(os.path.join(folder, name))
+
+    # Leitura
+
+    def _map(self, func, partitions: Sequence[Partition]) -> list:
+        """Aplica `func` às partições no pool de threads"""
+        if len(partitions) <= 1:
+            return [func(part) for part in partitions]
+        return list(self._pool.map(func, partitions))
+
+    def count(self) -> int:
+        return len(self.snapshot())
+
+    def kpis(self) -> dict:
+        partitions = self.snapshot().partitions
+        return {
+            "total_revenue": float(sum(part.revenue for part in partitions)),
+            "total_orders": int(sum(part.rows for part in partitions)),
+            "total_quantity": int(sum(part.quantity for part in partitions)),
+        }
+
+    def day_bounds(self) -> Optional[Tuple[int, int]]:
+        partitions = self.snapshot().partitions
+        if not partitions:
+            return None
+        return min(part.min_day for part in partitions), max(part.max_day for part in partitions)
+
+    def _between(self, view: PartitionView, start_day: int, end_day: int) -> List[Partition]:
+        """Partições com alguma venda em [start_day, end_day] (poda pelas estatísticas)"""
+        return [part for part in view.partitions if part.overlaps(start_day, end_day)]
+
+    def _rows(self, view: PartitionView, part: Partition, start_day: int, end_day: int):
+        """Máscara das linhas no intervalo; None se a partição inteira está nele"""
+        if part.inside(start_day, end_day):
+            return None
+        day = view.column(part, "date")
+        return (day >= start_day) & (day <= end_day)
+
+    def daily(self, start_day: int, end_day: int):
+        length = max(end_day - start_day + 1, 0)
+        revenue = np.zeros(length)
+        orders = np.zeros(length, dtype=np.int64)
+        if length == 0:
+            return revenue, orders
+        view = self.snapshot()
+
+        def scan(part):
+            day = view.column(part, "date")
+            weights = view.column(part, "amount") * view.column(part, "quantity")
+            mask = self._rows(view, part, start_day, end_day)
+            if mask is not None:
+                day, weights = day[mask], weights[mask]
+            offset = day.astype(np.int64) - start_day
+            return np.bincount(offset, weights=weights, minlength=length), np.bincount(offset, minlength=length)
+
+        for part_revenue, part_orders in self._map(scan, self._between(view, start_day, end_day)):
+            revenue += part_revenue
+            orders += part_orders
+        return revenue, orders
+
+    def activity(self, start_day: int, end_day: int) -> dict:
+        if end_day < start_day:
+            return {"revenue": 0.0, "orders": 0, "customers": 0}
+        view = self.snapshot()
+
+        def scan(part):
+            customers = view.column(part, "customer")
+            mask = self._rows(view, part, start_day, end_day)
+            if mask is None:
+                return part.revenue, part.rows, pc.unique(customers)
+            revenue = float(np.dot(view.column(part, "amount")[mask], view.column(part, "quantity")[mask]))
+            return revenue, int(mask.sum()), pc.unique(customers.filter(pa.array(mask)))
+
+        results = self._map(scan, self._between(view, start_day, end_day))
+        if not results:
+            return {"revenue": 0.0, "orders": 0, "customers": 0}
+        customers = pc.count_distinct(pa.chunked_array([unique for _, _, unique in results], type=pa.string()))
+        return {
+            "revenue": float(sum(revenue for revenue, _, _ in results)),
+            "orders": int(sum(orders for _, orders, _ in results)),
+            "customers": customers.as_py(),
+        }
+
+    def _partition_stats(self, view: PartitionView, part: Partition) -> PartitionStats:
+        """Sketches de um arquivo: do cache, do arquivo .stats.npz ou, sem ele, das colunas (uma vez)"""
+        with self._stats_lock:
+            stats = self._stats.get(part.path)
+        if stats is None:
+            path = view.path(part)
+            try:
+                stats = load_stats(stats_path(path))
+            except FileNotFoundError:
+                _, stats = table_stats(pq.read_table(path, memory_map=True))
+            with self._stats_lock:
+                self._stats[part.path] = stats
+        return stats
+
+    def _all_stats(self, view: PartitionView) -> List[PartitionStats]:
+        return self._map(lambda part: self._partition_stats(view, part), view.partitions)
+
+    def by_category(self) -> List[dict]:
+        """Totais do manifesto; clientes distintos pelos HyperLogLog por categoria das partições"""
+        view = self.snapshot()
+        # Categorias na ordem em que aparecem nas partições
+        revenue: Dict[str, float] = {}
+        quantity: Dict[str, int] = {}
+        for part in view.partitions:
+            for category, (part_revenue, part_quantity) in part.categories.items():
+                revenue[category] = revenue.get(category, 0.0) + part_revenue
+                quantity[category] = quantity.get(category, 0) + part_quantity
+        if not revenue:
+            return []
+        names = pd.Index(list(revenue))
+        registers = np.zeros((len(names), HLL_REGISTERS), dtype=np.uint8)
+        for stats in self._all_stats(view):
+            rows = names.get_indexer(stats.categories)
+            registers[rows] = np.maximum(registers[rows], stats.customers)
+        customers = np.round(hll_estimate(registers)).astype(np.int64)
+        return [
+            {"category": category, "revenue": float(revenue[category]), "quantity": int(quantity[category]),
+             "customers": int(count)}
+            for category, count in zip(revenue, customers)
+        ]
+
+    def detail(self) -> dict:
+        view = self.snapshot()
+        rows = len(view)
+        stats = self._all_stats(view)
+        products = round(hll_estimate(np.max([part.products for part in stats], axis=0))) if stats else 0
+        return {
+            "average_amount": sum(part.amount for part in view.partitions) / rows if rows else 0.0,
+            "total_items": int(sum(part.quantity for part in view.partitions)),
+            "unique_products": int(products),
+        }
+
+    def ticket_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Optional[float]]:
+        """t-digests das partições combinados (exatos até 200 pedidos), com interpolação linear"""
+        tickets = TDigest()
+        tickets.merge(stats.tickets for stats in self._all_stats(self.snapshot()))
+        return {
+            f"p{p}": None if value is None else round(value, 2)
+            for p in percentiles
+            for value in [tickets.quantile(p / 100)]
+        }
+
+    def top(self, by: str, metric: str, n: int, start_day: Optional[int] = None,
+            end_day: Optional[int] = None) -> List[dict]:
+        view = self.snapshot()
+        start_day = np.iinfo(np.int32).min if start_day is None else start_day
+        end_day = np.iinfo(np.int32).max if end_day is None else end_day
+
+        def scan(part):
+            table = pa.table({
+                "key": view.column(part, by),
+                "revenue": view.column(part, "amount") * view.column(part, "quantity"),
+                "quantity": view.column(part, "quantity").astype(np.int64),
+            })
+            mask = self._rows(view, part, start_day, end_day)
+            if mask is not None:
+                table = table.filter(pa.array(mask))
+            return table.group_by("key").aggregate([("revenue", "sum"), ("quantity", "sum"), ("revenue", "count")])
+
+        results = self._map(scan, self._between(view, start_day, end_day))
+        if not results:
+            return []
+        totals = pa.concat_tables(results).group_by("key").aggregate(
+            [("revenue_sum", "sum"), ("quantity_sum", "sum"), ("revenue_count", "sum")]
+        )
+        totals = totals.filter(pc.is_valid(totals.column("key")))
+        columns = {
+            "revenue": totals.column("revenue_sum_sum").to_numpy(),
+            "quantity": totals.column("quantity_sum_sum").to_numpy(),
+            "orders": totals.column("revenue_count_sum").to_numpy(),
+        }
+        # Só as chaves escolhidas viram texto (clientes podem ser milhões)
+        chosen = top_indices(columns[metric], n)
+        keys = totals.column("key").take(pa.array(chosen)).to_pylist()
+        return top_totals(by, keys, *(columns[name][chosen] for name in ("revenue", "quantity", "orders")), metric, n)
+
+    def top_customers(self, metric: str, n: int) -> Optional[dict]:
+        self._refresh()
+        keys, counts, errors, guaranteed = self._top[metric].top(n)
+        return approximate_top(keys.tolist(), counts, errors, guaranteed, metric)
+
+    def query(self, spec: QuerySpec) -> Tuple[GroupTotals, dict]:
+        view = self.snapshot()
+        bounds = self.day_bounds()
+        start_day, end_day = spec.days(bounds) if bounds else (0, -1)
+        selected = self._between(view, start_day, end_day)
+        plan = {"partitions_read": len(selected), "partitions_pruned": len(view.partitions) - len(selected)}
+
+        if not spec.dimensions and not spec.filters:
+            # Totais do intervalo: estatísticas do manifesto; só partições da borda são lidas
+            inside = [part for part in selected if part.inside(start_day, end_day)]
+            edges = [part for part in selected if not part.inside(start_day, end_day)]
+
+            def edge(part):
+                mask = self._rows(view, part, start_day, end_day)
+                quantity = view.column(part, "quantity")[mask]
+                return float(np.dot(view.column(part, "amount")[mask], quantity)), int(quantity.sum(dtype=np.int64)), len(quantity)
+
+            results = [(part.revenue, part.quantity, part.rows) for part in inside]
+            results += self._map(edge, edges)
+            revenue, quantity, orders = (sum(values) for values in zip(*results)) if results else (0.0, 0, 0)
+            plan.update({
+                "plan": "rollup", "source": "manifest", "partitions_read": len(edges),
+                "reason": "totais das partições inteiras no intervalo pelo manifesto",
+                "rows_scanned": sum(part.rows for part in edges),
+            })
+            return GroupTotals({}, {}, np.array([revenue]), np.array([quantity]), np.array([orders])), plan
+
+        keys = list(spec.dimensions)
+        date = spec.date_dimension
+
+        def scan(part):
+            mask = self._rows(view, part, start_day, end_day)
+            for name, values in spec.filters.items():
+                matched = pc.is_in(view.column(part, name), value_set=pa.array(values, pa.string()))
+                matched = matched.to_numpy(zero_copy_only=False)
+                mask = matched if mask is None else mask & matched
+            columns = {}
+            for name in keys:
+                if name == date:
+                    columns[name] = period_keys(view.column(part, "date"), date)
+                else:
+                    columns[name] = view.column(part, name)
+            columns["revenue"] = view.column(part, "amount") * view.column(part, "quantity")
+            columns["quantity"] = view.column(part, "quantity").astype(np.int64)
+            table = pa.table(columns)
+            if mask is not None:
+                table = table.filter(pa.array(mask))
+            if not keys:
+                return pa.table({
+                    "revenue_sum": [pc.sum(table.column("revenue")).as_py() or 0.0],
+                    "quantity_sum": [pc.sum(table.column("quantity")).as_py() or 0],
+                    "revenue_count": [table.num_rows],
+                })
+            return table.group_by(keys).aggregate([("revenue", "sum"), ("quantity", "sum"), ("revenue", "count")])
+
+        plan.update({
+            "plan": "scan", "source": "partitions",
+            "reason": "partições podadas pelo intervalo; filtros e agrupamento lidos das colunas",
+            "rows_scanned": sum(part.rows for part in selected),
+        })
+        results = self._map(scan, selected)
+        if not results:
+            empty = np.zeros(0, dtype=np.int64)
+            if not keys:
+                return GroupTotals({}, {}, np.zeros(1), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)), plan
+            return GroupTotals({name: empty for name in keys}, {}, np.zeros(0), empty, empty), plan
+        totals = pa.concat_tables(results)
+        if keys:
+            totals = totals.group_by(keys).aggregate(
+                [("revenue_sum", "sum"), ("quantity_sum", "sum"), ("revenue_count", "sum")]
+            )
+            measures = ("revenue_sum_sum", "quantity_sum_sum", "revenue_count_sum")
+        else:
+            totals = pa.table({name: [pc.sum(totals.column(name)).as_py()] for name in totals.column_names})
+            measures = ("revenue_sum", "quantity_sum", "revenue_count")
+        columns, decoders = {}, {}
+        for name in keys:
+            if name in DATE_DIMENSIONS:
+                columns[name] = totals.column(name).to_numpy().astype(np.int64)
+                continue
+            # Textos viram códigos de um dicionário local (só os grupos retornados são decodificados)
+            encoded = pc.dictionary_encode(totals.column(name)).combine_chunks()
+            columns[name] = pc.fill_null(encoded.indices, -1).to_numpy().astype(np.int64)
+            labels = np.array(encoded.dictionary.to_pylist() + [None], dtype=object)
+            decoders[name] = labels.__getitem__
+        revenue, quantity, orders = (totals.column(name).to_numpy() for name in measures)
+        return GroupTotals(columns, decoders, revenue.astype(np.float64), quantity.astype(np.int64), orders.astype(np.int64)), plan
+
+    def iter_columns(self) -> Iterator[dict]:
+        """Lê todas as vendas em blocos de colunas, uma partição por vez"""
+        view = self.snapshot()
+        for part in view.partitions:
+            table = pq.read_table(view.path(part), memory_map=True)
+            yield {
+                "date": table.column("date").cast(pa.int32()).to_numpy().astype("datetime64[D]"),
+                "product": table.column("product").to_numpy(zero_copy_only=False),
+                "category": table.column("category").to_numpy(zero_copy_only=False),
+                "amount": table.column("amount").to_numpy(),
+                "quantity": table.column("quantity").to_numpy(),
+                "customer": table.column("customer").to_numpy(zero_copy_only=False),
+            }
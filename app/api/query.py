@@ -0,0 +1,381 @@
+"""
+Consultas genéricas (agrupamento, filtros e ordenação) com planejador
+
+GET /api/v1/query descreve a consulta por dimensões (day, week ou month,
+product, category, customer), medidas (revenue, quantity, orders,
+average_ticket), filtros (intervalo de datas e valores de produto, categoria
+ou cliente) e ordenação. O planejador escolhe o caminho mais barato que
+responde o valor exato:
+
+- agregados (app.api.rollups): vetores por dia para séries e totais de
+  intervalos, vetores por produto ou categoria para todo o período;
+- varredura colunar: linhas do intervalo pelo índice de datas, filtros
+  aplicados aos códigos de dicionário (do mais seletivo ao menos, pela
+  estimativa dos agregados) e somas por grupo com np.bincount.
+
+Cada backend devolve totais por grupo (`GroupTotals`) e a descrição do
+caminho; ordenação, limite e formatação das linhas são comuns (`run`).
+"""
+
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.api import timeseries
+from app.api.rollups import SalesRollups
+from app.api.store import TOTALS_DICTIONARIES, SalesStore, day_to_iso
+
+DATE_DIMENSIONS = timeseries.GRANULARITIES
+KEY_DIMENSIONS = ("product", "category", "customer")
+DIMENSIONS = DATE_DIMENSIONS + KEY_DIMENSIONS
+MEASURES = ("revenue", "quantity", "orders", "average_ticket")
+DEFAULT_MEASURES = ("revenue", "orders")
+
+# Combinações de chaves até este tamanho são somadas em vetores densos; acima, por np.unique
+DENSE_GROUPS = 1 << 22
+
+
+class QuerySpec(NamedTuple):
+    """Consulta já validada; dias como números de dias (None = sem limite)"""
+
+    dimensions: Tuple[str, ...]
+    measures: Tuple[str, ...]
+    start_day: Optional[int]
+    end_day: Optional[int]
+    filters: Dict[str, Tuple[str, ...]]
+    order_by: Tuple[Tuple[str, bool], ...]
+    limit: int
+
+    @property
+    def date_dimension(self) -> Optional[str]:
+        return next((name for name in self.dimensions if name in DATE_DIMENSIONS), None)
+
+    @property
+    def key_dimensions(self) -> List[str]:
+        return [name for name in self.dimensions if name in KEY_DIMENSIONS]
+
+    def covers(self, bounds: Optional[Tuple[int, int]]) -> bool:
+        """O intervalo da consulta inclui todas as vendas"""
+        return bounds is None or (
+            (self.start_day is None or self.start_day <= bounds[0])
+            and (self.end_day is None or self.end_day >= bounds[1])
+        )
+
+    def days(self, bounds: Tuple[int, int]) -> Tuple[int, int]:
+        """Intervalo da consulta com os limites ausentes trocados pelos das vendas"""
+        return (bounds[0] if self.start_day is None else self.start_day,
+                bounds[1] if self.end_day is None else self.end_day)
+
+
+class GroupTotals(NamedTuple):
+    """
+    Totais por grupo. `keys` tem um vetor por dimensão: início do período
+    (número de dias) nas de data e código nas demais (-1 = sem valor);
+    `decoders` converte os códigos de cada dimensão em texto.
+    """
+
+    keys: Dict[str, np.ndarray]
+    decoders: Dict[str, Callable[[np.ndarray], np.ndarray]]
+    revenue: np.ndarray
+    quantity: Optional[np.ndarray]
+    orders: np.ndarray
+
+
+def split_names(value: Optional[str]) -> List[str]:
+    """Itens de uma lista separada por vírgulas"""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def build_spec(dimensions: Optional[str], measures: Optional[str], start_day: Optional[int],
+               end_day: Optional[int], filters: Dict[str, Optional[List[str]]], order_by: Optional[str],
+               limit: int) -> QuerySpec:
+    """Valida os parâmetros da rota; erros viram ValueError com a mensagem para o cliente"""
+    dims = split_names(dimensions)
+    unknown = [name for name in dims if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Dimensões inválidas {unknown}; use {list(DIMENSIONS)}")
+    if len(set(dims)) != len(dims):
+        raise ValueError("Dimensões repetidas")
+    if sum(name in DATE_DIMENSIONS for name in dims) > 1:
+        raise ValueError(f"No máximo uma dimensão de data ({', '.join(DATE_DIMENSIONS)})")
+    values = split_names(measures) or list(DEFAULT_MEASURES)
+    unknown = [name for name in values if name not in MEASURES]
+    if unknown:
+        raise ValueError(f"Medidas inválidas {unknown}; use {list(MEASURES)}")
+    order = []
+    for item in split_names(order_by):
+        descending = item.startswith("-")
+        key = item[1:] if descending else item
+        if key not in dims and key not in values:
+            raise ValueError(f"order_by só aceita dimensões e medidas da consulta: {key!r}")
+        order.append((key, descending))
+    return QuerySpec(
+        dimensions=tuple(dims),
+        measures=tuple(dict.fromkeys(values)),
+        start_day=start_day,
+        end_day=end_day,
+        filters={name: tuple(dict.fromkeys(chosen)) for name, chosen in filters.items() if chosen},
+        order_by=tuple(order),
+        limit=limit,
+    )
+
+
+def group_totals(keys: Dict[str, np.ndarray], revenue: np.ndarray, quantity: np.ndarray):
+    """
+    Soma receita, quantidade e pedidos por combinação das chaves (vetores int64
+    alinhados às vendas). Retorna (chaves por grupo, receita, quantidade, pedidos).
+    """
+    if not keys:
+        return {}, np.array([revenue.sum()]), np.array([quantity.sum(dtype=np.int64)]), np.array([len(revenue)])
+    if not len(revenue):
+        empty = np.zeros(0, dtype=np.int64)
+        return {name: empty for name in keys}, np.zeros(0), empty, empty
+    # Chave única por venda em base mista: deslocamento de cada chave vezes o tamanho das seguintes
+    lows, spans = {}, {}
+    for name, values in keys.items():
+        lows[name] = int(values.min())
+        spans[name] = int(values.max()) - lows[name] + 1
+    size = int(np.prod([float(span) for span in spans.values()]))
+    if size >= 2 ** 62:
+        # Espaço grande demais para a base mista: agrupa pelas linhas distintas
+        stacked = np.stack(list(keys.values()), axis=1)
+        groups, inverse = np.unique(stacked, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        count = len(groups)
+        columns = {name: groups[:, i] for i, name in enumerate(keys)}
+    else:
+        combined = np.zeros(len(revenue), dtype=np.int64)
+        for name, values in keys.items():
+            combined *= spans[name]
+            combined += values - lows[name]
+        if size <= DENSE_GROUPS:
+            inverse, count = combined, size
+            present = None
+        else:
+            present, inverse = np.unique(combined, return_inverse=True)
+            count = len(present)
+    orders = np.bincount(inverse, minlength=count)
+    revenue = np.bincount(inverse, weights=revenue, minlength=count)
+    quantity = np.bincount(inverse, weights=quantity, minlength=count).astype(np.int64)
+    if size < 2 ** 62:
+        if present is None:
+            present = np.flatnonzero(orders)
+            revenue, quantity, orders = revenue[present], quantity[present], orders[present]
+        columns = {}
+        for name in reversed(list(keys)):
+            present, offset = np.divmod(present, spans[name])
+            columns[name] = offset + lows[name]
+        columns = {name: columns[name] for name in keys}
+    return columns, revenue, quantity, orders
+
+
+def period_keys(day: np.ndarray, granularity: str) -> np.ndarray:
+    """Início do período de cada venda por tabela dos dias do intervalo (evita converter datas por venda)"""
+    if not len(day):
+        return np.zeros(0, dtype=np.int64)
+    low = int(day.min())
+    table = timeseries.period_starts(np.arange(low, int(day.max()) + 1), granularity)
+    return table[day - low]
+
+
+def _sortable(name: str, totals: GroupTotals, values: Dict[str, np.ndarray], rows: np.ndarray) -> np.ndarray:
+    """Vetor numérico que ordena os grupos `rows` pela chave `name`"""
+    if name in values:
+        return values[name][rows]
+    keys = totals.keys[name][rows]
+    if name in DATE_DIMENSIONS:
+        return keys
+    # Textos: posição na ordem alfabética (sem valor vem primeiro)
+    labels = totals.decoders[name](keys)
+    labels[pd.isna(labels)] = ""
+    return np.unique(labels.astype(str), return_inverse=True)[1].ravel()
+
+
+def finish(totals: GroupTotals, spec: QuerySpec) -> List[dict]:
+    """Ordena, aplica o limite e formata as linhas (só os grupos retornados viram texto)"""
+    values = {"revenue": totals.revenue, "orders": totals.orders}
+    if totals.quantity is not None:
+        values["quantity"] = totals.quantity
+    if "average_ticket" in spec.measures:
+        values["average_ticket"] = np.divide(
+            totals.revenue, totals.orders, out=np.zeros(len(totals.orders)), where=totals.orders > 0
+        )
+    count = len(totals.orders)
+    order = list(spec.order_by)
+    ordered = {key for key, _ in order}
+    # Desempate pelas dimensões (resultado determinístico)
+    order += [(name, False) for name in spec.dimensions if name not in ordered]
+
+    rows = np.arange(count)
+    if spec.order_by and spec.order_by[0][0] in values and spec.limit < count:
+        # Pré-seleção em O(grupos) pela primeira medida, mantendo os empates no corte
+        key, descending = spec.order_by[0]
+        first = -values[key] if descending else values[key]
+        cut = first[np.argpartition(first, spec.limit - 1)[spec.limit - 1]]
+        rows = np.flatnonzero(first <= cut)
+    if order and len(rows) > 1:
+        columns = [_sortable(key, totals, values, rows) for key, _ in order]
+        columns = [-column if descending else column for column, (_, descending) in zip(columns, order)]
+        rows = rows[np.lexsort(columns[::-1])]
+    rows = rows[:spec.limit]
+
+    output = {}
+    for name in spec.dimensions:
+        keys = totals.keys[name][rows]
+        output[name] = day_to_iso(keys).tolist() if name in DATE_DIMENSIONS else totals.decoders[name](keys).tolist()
+    for name in spec.measures:
+        selected = values[name][rows]
+        if name in ("quantity", "orders"):
+            output[name] = selected.astype(np.int64).tolist()
+        else:
+            output[name] = np.round(selected.astype(np.float64), 2).tolist()
+    names = list(output)
+    return [dict(zip(names, row)) for row in zip(*output.values())]
+
+
+def run(execute: Callable[[QuerySpec], Tuple[GroupTotals, dict]], spec: QuerySpec) -> dict:
+    """Executa a consulta no backend e monta a resposta (com o plano e os tempos em "explain")"""
+    started = time.perf_counter()
+    totals, plan = execute(spec)
+    executed = time.perf_counter()
+    rows = finish(totals, spec)
+    finished = time.perf_counter()
+    groups = len(totals.orders)
+    plan.update({
+        "groups": groups,
+        "execute_ms": round((executed - started) * 1000, 3),
+        "finish_ms": round((finished - executed) * 1000, 3),
+        "total_ms": round((finished - started) * 1000, 3),
+    })
+    return {
+        "dimensions": list(spec.dimensions),
+        "measures": list(spec.measures),
+        "groups": groups,
+        "truncated": groups > len(rows),
+        "rows": rows,
+        "explain": plan,
+    }
+
+
+# Planejador do store em memória
+
+def choose_rollup(spec: QuerySpec, whole: bool) -> Tuple[Optional[str], str]:
+    """Agregado que responde a consulta ("totals", "day", "product" ou "category") ou None, e o motivo"""
+    keys = set(spec.key_dimensions) | set(spec.filters)
+    date = spec.date_dimension
+    if "customer" in keys:
+        return None, "agregados não têm totais por cliente"
+    if not keys:
+        if "quantity" not in spec.measures:
+            return "day", "vetores por dia dos agregados (somas acumuladas para intervalos)"
+        if not date and whole:
+            return "totals", "totais gerais dos agregados"
+        return None, "agregados por dia não têm quantidade"
+    if date:
+        return None, "agregados por dia não são divididos por produto ou categoria"
+    if len(keys) > 1:
+        return None, "agregados não cruzam produto e categoria"
+    if not whole:
+        return None, "totais por produto e categoria dos agregados são de todo o período"
+    name = keys.pop()
+    return name, f"totais por {name} dos agregados"
+
+
+def filter_codes(store: SalesStore, name: str, values) -> np.ndarray:
+    """Códigos de dicionário dos valores (valores inexistentes são ignorados)"""
+    dictionary = getattr(store, TOTALS_DICTIONARIES[name])
+    codes = [dictionary.codes.get(value) for value in values]
+    return np.array([code for code in codes if code is not None], dtype=np.int32)
+
+
+def _selectivity(rollups: SalesRollups, name: str, codes: np.ndarray) -> float:
+    """Fração estimada das vendas que passa no filtro (pedidos de todo o período; clientes sem estimativa)"""
+    if name == "customer" or not rollups.orders:
+        return 1.0
+    orders = rollups.totals_by(name)[2]
+    return float(orders[codes[codes < len(orders)]].sum()) / rollups.orders
+
+
+def _decoder(store: SalesStore, name: str):
+    return getattr(store, TOTALS_DICTIONARIES[name]).decode
+
+
+def run_rollup(spec: QuerySpec, store: SalesStore, rollups: SalesRollups, source: str):
+    """Totais por grupo a partir dos agregados, sem ler vendas"""
+    bounds = rollups.day_bounds()
+    if source in ("product", "category"):
+        revenue, quantity, orders = rollups.totals_by(source)
+        present = np.flatnonzero(orders)
+        if source in spec.filters:
+            present = np.intersect1d(present, filter_codes(store, source, spec.filters[source]))
+        revenue, quantity, orders = revenue[present], quantity[present], orders[present]
+        if source not in spec.dimensions:
+            return GroupTotals({}, {}, np.array([revenue.sum()]), np.array([quantity.sum()]), np.array([orders.sum()]))
+        return GroupTotals({source: present}, {source: _decoder(store, source)}, revenue, quantity, orders)
+    if source == "totals":
+        kpis = rollups.kpis()
+        return GroupTotals({}, {}, np.array([kpis["total_revenue"]]), np.array([kpis["total_quantity"]]),
+                           np.array([kpis["total_orders"]]))
+    date = spec.date_dimension
+    if bounds is None:
+        if date:
+            return GroupTotals({date: np.zeros(0, dtype=np.int64)}, {}, np.zeros(0), None, np.zeros(0, dtype=np.int64))
+        return GroupTotals({}, {}, np.zeros(1), None, np.zeros(1, dtype=np.int64))
+    start, end = spec.days(bounds)
+    if not date:
+        revenue, orders = rollups.window(start, end)
+        return GroupTotals({}, {}, np.array([revenue]), None, np.array([orders]))
+    # Só o trecho com vendas: dias fora dele não formam grupos
+    start, end = max(start, bounds[0]), min(end, bounds[1])
+    revenue, orders = rollups.daily(start, end)
+    starts, revenue, orders = timeseries.aggregate(start, revenue, orders.astype(np.int64), date)
+    present = np.flatnonzero(orders)
+    return GroupTotals({date: starts[present]}, {}, revenue[present], None, orders[present])
+
+
+def run_scan(spec: QuerySpec, store: SalesStore, rollups: SalesRollups):
+    """Totais por grupo varrendo as colunas das vendas selecionadas; retorna (totais, linhas lidas, filtros)"""
+    rows = None
+    scanned = len(store)
+    if not spec.covers(rollups.day_bounds()):
+        # Intervalo de datas pelo índice ordenado (busca binária)
+        rows = store.rows_between(*spec.days(rollups.day_bounds()))
+        scanned = len(rows)
+    filters = sorted(
+        ((name, filter_codes(store, name, values)) for name, values in spec.filters.items()),
+        key=lambda item: _selectivity(rollups, *item),
+    )
+    for name, codes in filters:
+        column = store.column(name) if rows is None else store.column(name)[rows]
+        mask = np.isin(column, codes)
+        rows = np.flatnonzero(mask) if rows is None else rows[mask]
+
+    def column(name):
+        return store.column(name) if rows is None else store.column(name)[rows]
+
+    amount, quantity = column("amount"), column("quantity")
+    keys = {}
+    for name in spec.dimensions:
+        if name in DATE_DIMENSIONS:
+            keys[name] = period_keys(column("day"), name)
+        else:
+            keys[name] = column(name).astype(np.int64)
+    groups, revenue, quantity, orders = group_totals(keys, amount * quantity, quantity)
+    decoders = {name: _decoder(store, name) for name in spec.key_dimensions}
+    return GroupTotals(groups, decoders, revenue, quantity, orders), scanned, [name for name, _ in filters]
+
+
+def run_memory(spec: QuerySpec, store: SalesStore, rollups: SalesRollups) -> Tuple[GroupTotals, dict]:
+    """Planeja e executa a consulta num snapshot do store em memória"""
+    source, reason = choose_rollup(spec, spec.covers(rollups.day_bounds()))
+    if source is not None:
+        return run_rollup(spec, store, rollups, source), {
+            "plan": "rollup", "source": f"rollups.{source}", "reason": reason, "rows_scanned": 0,
+        }
+    totals, scanned, filters = run_scan(spec, store, rollups)
+    return totals, {
+        "plan": "scan", "source": "store", "reason": reason, "rows_scanned": scanned,
+        "index": "date" if scanned < len(store) else None, "filter_order": filters,
+    }
@@ -0,0 +1,242 @@
+"""
+Agregados mantidos incrementalmente durante a ingestão
+"""
+
+from typing import List
+import copy
+import numpy as np
+
+from app.api.sketches import HLL_RELATIVE_ERROR, SalesSketches
+from app.api.store import SalesStore
+
+
+def _added(array: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Novo vetor com `values` somado a `array` (estendido com zeros se preciso); `array` não muda"""
+    result = np.zeros(max(len(array), len(values)), dtype=array.dtype)
+    result[:len(array)] = array
+    result[:len(values)] += values
+    return result
+
+
+class SalesRollups:
+    """
+    Totais, totais por categoria, por produto e por dia atualizados a cada lote.
+
+    As leituras não varrem as vendas: os vetores por categoria são indexados
+    pelo código da categoria e os vetores por dia pelo deslocamento em dias a
+    partir de `day_origin`. Somas acumuladas dos vetores por dia respondem o
+    total de qualquer intervalo em O(1); clientes distintos e percentis vêm
+    dos sketches (app.api.sketches).
+
+    Os vetores nunca são alterados no lugar: cada lote gera vetores novos,
+    então um `snapshot()` (cópia rasa) continua consistente enquanto o
+    próximo lote é aplicado.
+    """
+
+    def __init__(self):
+        self.revenue = 0.0
+        self.orders = 0
+        self.quantity = 0
+        self.amount = 0.0
+        self.product_orders = np.zeros(0, dtype=np.int64)
+        self.product_revenue = np.zeros(0, dtype=np.float64)
+        self.product_quantity = np.zeros(0, dtype=np.int64)
+        self.category_revenue = np.zeros(0, dtype=np.float64)
+        self.category_quantity = np.zeros(0, dtype=np.int64)
+        self.category_orders = np.zeros(0, dtype=np.int64)
+        self.day_origin = None
+        self.day_revenue = np.zeros(0, dtype=np.float64)
+        self.day_orders = np.zeros(0, dtype=np.int64)
+        self.day_revenue_prefix = np.zeros(1)
+        self.day_orders_prefix = np.zeros(1, dtype=np.int64)
+        self.sketches = SalesSketches()
+
+    @property
+    def nbytes(self) -> int:
+        """Memória dos vetores de agregados (sem os sketches)"""
+        arrays = (
+            self.product_orders, self.product_revenue, self.product_quantity,
+            self.category_revenue, self.category_quantity, self.category_orders,
+            self.day_revenue, self.day_orders, self.day_revenue_prefix, self.day_orders_prefix,
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def apply(self, store: SalesStore, start: int, stop: int):
+        """Soma aos agregados as linhas [start, stop) recém-adicionadas ao store"""
+        if stop <= start:
+            return
+        rows = slice(start, stop)
+        amount = store.column("amount")[rows]
+        quantity = store.column("quantity")[rows]
+        day = store.column("day")[rows]
+        category = store.column("category")[rows]
+        product = store.column("product")[rows]
+        revenue = amount * quantity
+
+        self.revenue += float(revenue.sum())
+        self.orders += stop - start
+        self.quantity += int(quantity.sum(dtype=np.int64))
+        self.amount += float(amount.sum())
+
+        self.product_orders = _added(self.product_orders, np.bincount(product, minlength=len(store.products)))
+        self.product_revenue = _added(self.product_revenue, np.bincount(product, weights=revenue, minlength=len(store.products)))
+        self.product_quantity = _added(
+            self.product_quantity, np.bincount(product, weights=quantity, minlength=len(store.products)).astype(np.int64)
+        )
+
+        size = len(store.categories)
+        self.category_revenue = _added(self.category_revenue, np.bincount(category, weights=revenue, minlength=size))
+        self.category_quantity = _added(
+            self.category_quantity, np.bincount(category, weights=quantity, minlength=size).astype(np.int64)
+        )
+        self.category_orders = _added(self.category_orders, np.bincount(category, minlength=size))
+
+        first, last = int(day.min()), int(day.max())
+        if self.day_origin is None:
+            self.day_origin = first
+        elif first < self.day_origin:
+            shift = self.day_origin - first
+            self.day_revenue = np.concatenate([np.zeros(shift), self.day_revenue])
+            self.day_orders = np.concatenate([np.zeros(shift, dtype=np.int64), self.day_orders])
+            self.day_origin = first
+        offset = day.astype(np.int64) - self.day_origin
+        self.day_revenue = _added(self.day_revenue, np.bincount(offset, weights=revenue))
+        self.day_orders = _added(self.day_orders, np.bincount(offset))
+        self.day_revenue_prefix = np.concatenate([[0.0], np.cumsum(self.day_revenue)])
+        self.day_orders_prefix = np.concatenate([[0], np.cumsum(self.day_orders)])
+
+        self.sketches.apply(store, start, stop)
+
+    def snapshot(self) -> "SalesRollups":
+        """Cópia rasa para leitura (os vetores são compartilhados, nunca alterados no lugar)"""
+        view = copy.copy(self)
+        view.sketches = self.sketches.snapshot()
+        return view
+
+    def rebuild(self, store: SalesStore):
+        """Recalcula todos os agregados a partir do store"""
+        self.__init__()
+        self.apply(store, 0, len(store))
+
+    def verify(self, store: SalesStore) -> List[str]:
+        """Compara com uma varredura completa do store; retorna as divergências"""
+        differences = []
+        revenue = store.revenue()
+        if not np.isclose(self.revenue, float(revenue.sum()), rtol=1e-9):
+            differences.append(f"revenue: {self.revenue} != {float(revenue.sum())}")
+        if self.orders != len(store):
+            differences.append(f"orders: {self.orders} != {len(store)}")
+        quantity = int(store.column("quantity").sum(dtype=np.int64))
+        if self.quantity != quantity:
+            differences.append(f"quantity: {self.quantity} != {quantity}")
+        amount = float(store.column("amount").sum())
+        if not np.isclose(self.amount, amount, rtol=1e-9):
+            differences.append(f"amount: {self.amount} != {amount}")
+        products = int(np.count_nonzero(np.bincount(store.column("product"), minlength=1)))
+        if self.unique_products() != products:
+            differences.append(f"produtos únicos: {self.unique_products()} != {products}")
+        brute_revenue, brute_quantity, _ = store.totals_by("product")
+        size = len(brute_revenue)
+        if not np.allclose(self.product_revenue[:size], brute_revenue, rtol=1e-9) or \
+                not np.array_equal(self.product_quantity[:size], brute_quantity):
+            differences.append("totais por produto divergentes")
+
+        expected = {row["category"]: row for row in store.by_category()}
+        for row in self.by_category(store):
+            brute = expected.pop(row["category"], None)
+            if brute is None:
+                differences.append(f"categoria {row['category']!r} inexistente no store")
+            elif not np.isclose(row["revenue"], brute["revenue"], rtol=1e-9) or row["quantity"] != brute["quantity"]:
+                differences.append(f"categoria {row['category']!r}: {row} != {brute}")
+        for name in expected:
+            differences.append(f"categoria {name!r} ausente dos agregados")
+
+        if len(store):
+            day = store.column("day")
+            first, last = int(day.min()), int(day.max())
+            brute_revenue, brute_orders = store.daily(first, last)
+            rollup_revenue, rollup_orders = self.daily(first, last)
+            if not np.allclose(rollup_revenue, brute_revenue, rtol=1e-9) or not np.array_equal(rollup_orders, brute_orders):
+                differences.append("totais por dia divergentes")
+            revenue, orders = self.window(first, last)
+            if not np.isclose(revenue, self.revenue, rtol=1e-9) or orders != self.orders:
+                differences.append("somas acumuladas por dia divergentes")
+
+        # Estimativa de clientes distintos dentro de 4 erros padrão do valor exato
+        customer = store.column("customer")
+        exact = int(np.count_nonzero(np.bincount(customer[customer >= 0], minlength=1)))
+        estimate = self.sketches.distinct_customers()
+        if abs(estimate - exact) > max(4 * HLL_RELATIVE_ERROR * exact, 2):
+            differences.append(f"clientes distintos: estimativa {estimate} longe de {exact}")
+        return differences
+
+    # Leitura
+
+    def kpis(self) -> dict:
+        """Totais gerais"""
+        return {"total_revenue": self.revenue, "total_orders": self.orders, "total_quantity": self.quantity}
+
+    def unique_products(self) -> int:
+        """Produtos com pelo menos uma venda"""
+        return int(np.count_nonzero(self.product_orders))
+
+    def detail(self) -> dict:
+        """Estatísticas da análise detalhada: valor unitário médio, itens e produtos únicos"""
+        return {
+            "average_amount": self.amount / self.orders if self.orders else 0.0,
+            "total_items": self.quantity,
+            "unique_products": self.unique_products(),
+        }
+
+    def by_category(self, store: SalesStore) -> List[dict]:
+        """Receita e quantidade por categoria (na ordem de aparição)"""
+        names = store.categories.values
+        codes = np.flatnonzero(self.category_orders[:len(names)])
+        customers = self.sketches.customers_by_category(codes)
+        return [
+            {
+                "category": names[code],
+                "revenue": float(self.category_revenue[code]),
+                "quantity": int(self.category_quantity[code]),
+                "customers": customers[code],
+            }
+            for code in codes
+        ]
+
+    def totals_by(self, name: str):
+        """(receita, quantidade, pedidos) por código de produto ou categoria, de todo o período"""
+        if name not in ("product", "category"):
+            raise ValueError(f"Sem totais por {name!r} nos agregados")
+        return getattr(self, f"{name}_revenue"), getattr(self, f"{name}_quantity"), getattr(self, f"{name}_orders")
+
+    def window(self, start_day: int, end_day: int):
+        """(receita, pedidos) do intervalo [start_day, end_day] pelas somas acumuladas"""
+        if self.day_origin is None:
+            return 0.0, 0
+        lo = min(max(start_day - self.day_origin, 0), len(self.day_revenue))
+        hi = min(max(end_day - self.day_origin + 1, 0), len(self.day_revenue))
+        if lo >= hi:
+            return 0.0, 0
+        revenue = float(self.day_revenue_prefix[hi] - self.day_revenue_prefix[lo])
+        return revenue, int(self.day_orders_prefix[hi] - self.day_orders_prefix[lo])
+
+    def day_bounds(self):
+        """(primeiro, último) dia com vendas, ou None sem vendas"""
+        days = np.flatnonzero(self.day_orders)
+        if self.day_origin is None or not len(days):
+            return None
+        return self.day_origin + int(days[0]), self.day_origin + int(days[-1])
+
+    def daily(self, start_day: int, end_day: int):
+        """Receita e pedidos por dia no intervalo [start_day, end_day], sem varrer vendas"""
+        length = max(end_day - start_day + 1, 0)
+        revenue = np.zeros(length)
+        orders = np.zeros(length, dtype=np.int64)
+        if self.day_origin is None or length == 0:
+            return revenue, orders
+        lo = max(start_day, self.day_origin)
+        hi = min(end_day, self.day_origin + len(self.day_revenue) - 1)
+        if lo <= hi:
+            revenue[lo - start_day:hi - start_day + 1] = self.day_revenue[lo - self.day_origin:hi - self.day_origin + 1]
+            orders[lo - start_day:hi - start_day + 1] = self.day_orders[lo - self.day_origin:hi - self.day_origin + 1]
+        return revenue, orders
@@ -0,0 +1,279 @@
+"""
+Store de vendas em arquivos mapeados em memória, compartilhado entre processos
+
+Com `uvicorn --workers N` todos os workers abrem o mesmo diretório
+(SHARED_STORE_DIR): colunas e índice de datas ficam em arquivos mapeados
+(np.memmap) cujas páginas o sistema operacional compartilha, então a memória
+das vendas não se multiplica pelo número de workers. Cada worker mantém só
+os seus agregados (SalesRollups, pequenos).
+
+Qualquer worker pode gravar, um por vez (flock no arquivo `lock`): primeiro
+lê o que os outros publicaram, grava depois do tamanho publicado e publica o
+novo tamanho no cabeçalho ao soltar o flock (depois do registro no WAL, se
+houver). Os demais percebem o cabeçalho mudar (`changed`)
+e passam a ler as linhas novas (`refresh`), sem copiar as colunas.
+
+Arquivos do diretório:
+    header.bin                 contador de publicação (seqlock), tamanho, capacidade,
+                               geração do índice e tamanho de cada dicionário (int64),
+                               seguidos de uma cópia dos campos gravada antes de cada publicação
+    <coluna>.bin               amount, quantity, day, product, category, customer
+    index_<nome>.<geração>.bin índice de datas; um lote fora de ordem grava a geração seguinte
+    <dicionário>.jsonl         textos de products, categories e customers na ordem dos códigos
+                               (linhas depois das publicadas são de um escritor morto e são
+                               descartadas pelo escritor seguinte)
+    lock                       arquivo do flock dos escritores
+    store_id                   identificação aleatória do store, criada junto com ele
+
+Um diretório existente é reaproveitado (as vendas continuam lá); apague-o
+para começar vazio. Só funciona em sistemas com fcntl (Linux, macOS).
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from app.api.store import Dictionary, SalesStore
+
+DICTIONARIES = ("products", "categories", "customers")
+HEADER_FIELDS = ("seq", "size", "capacity", "index_generation") + DICTIONARIES
+SEQ, SIZE, CAPACITY, INDEX_GENERATION = range(4)
+# Cópia dos campos (sem o seq) gravada antes de abrir a publicação: se o escritor
+# morrer com o seq ímpar, o cabeçalho é consertado a partir dela
+SHADOW = len(HEADER_FIELDS)
+HEADER_LENGTH = SHADOW + len(HEADER_FIELDS) - 1
+
+# Segundos com o seq ímpar até o leitor tomar o flock e conferir se o escritor morreu
+REPAIR_AFTER = 0.5
+
+
+def _map(path: str, dtype, capacity: int, create: bool = False) -> np.ndarray:
+    """
+    Mapeia `capacity` posições de `path` (leitura e escrita, compartilhado).
+
+    Com `create`, cria ou estende o arquivo (nunca encolhe): mapeamentos já
+    abertos do começo do arquivo continuam válidos.
+    """
+    nbytes = max(capacity, 1) * np.dtype(dtype).itemsize
+    if create:
+        with open(path, "a+b") as file:
+            if os.fstat(file.fileno()).st_size < nbytes:
+                file.truncate(nbytes)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=(max(capacity, 1),)).view(np.ndarray)
+
+
+class SharedSalesStore(SalesStore):
+    """SalesStore com colunas em arquivos mapeados de `directory`, compartilhados entre processos"""
+
+    def __init__(self, directory: str, capacity: int = 1 << 20):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._lock_file = open(os.path.join(directory, "lock"), "a+b")
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._unpublished = False
+        self._seen = -1
+        self._index_generation = 0
+        self._published_generation = 0
+        self._dictionary_offsets = dict.fromkeys(DICTIONARIES, 0)
+        self._persisted = dict.fromkeys(DICTIONARIES, 0)
+
+        with self.lock():
+            self._header = _map(os.path.join(directory, "header.bin"), np.int64, HEADER_LENGTH, create=True)
+            if int(self._header[SEQ]) == 0:
+                # Nunca publicado: começa vazio (descarta restos de uma inicialização interrompida)
+                for name in os.listdir(directory):
+                    if name.endswith((".bin", ".jsonl")) and name != "header.bin":
+                        os.remove(os.path.join(directory, name))
+                SalesStore.__init__(self, capacity)
+            else:
+                self._size = 0
+                self._capacity = 0
+                self._data = {}
+                self._index = {}
+                self.products = Dictionary()
+                self.categories = Dictionary()
+                self.customers = Dictionary()
+                self.refresh()
+            try:
+                with open(os.path.join(directory, "store_id")) as file:
+                    self.store_id = file.read().strip()
+            except FileNotFoundError:
+                self._write_store_id()
+
+    # Arquivos
+
+    def _path(self, key: str, generation: int = None) -> str:
+        if key.startswith("index_"):
+            generation = self._index_generation if generation is None else generation
+            return os.path.join(self.directory, f"{key}.{generation}.bin")
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _dictionary_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.jsonl")
+
+    def _write_store_id(self):
+        """Diretório novo: vendas de um diretório recriado não se confundem com as anteriores (ETag)"""
+        self.store_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, "store_id")
+        with open(path + ".tmp", "w") as file:
+            file.write(self.store_id)
+        os.replace(path + ".tmp", path)
+
+    def _allocate(self, key: str, dtype, capacity: int) -> np.ndarray:
+        return _map(self._path(key), dtype, capacity, create=True)
+
+    def _allocate_index(self):
+        # Índice reescrito: arquivos da geração seguinte (leitores continuam na atual)
+        self._index_generation += 1
+        return super()._allocate_index()
+
+    def _grow(self, key: str, column: np.ndarray, capacity: int) -> np.ndarray:
+        # Estende o próprio arquivo, sem copiar as linhas
+        return _map(self._path(key), column.dtype, capacity, create=True)
+
+    # Publicação (escritor)
+
+    @contextlib.contextmanager
+    def lock(self):
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    try:
+                        if self._unpublished:
+                            self._unpublished = False
+                            self._write_header()
+                    finally:
+                        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def append_columns(self, *args, **kwargs) -> int:
+        with self.lock():
+            # Grava a partir do último tamanho publicado por qualquer processo
+            self.refresh()
+            return super().append_columns(*args, **kwargs)
+
+    def _publish(self):
+        super()._publish()
+        if self._lock_depth:
+            # Outros processos veem o lote ao soltar o flock, depois do que mais for feito com ele
+            self._unpublished = True
+        else:
+            self._write_header()
+
+    def _write_header(self):
+        """Grava os textos novos dos dicionários e publica tamanho, capacidade e geração do índice"""
+        for name in DICTIONARIES:
+            values = getattr(self, name).values
+            new = values[self._persisted[name]:]
+            if new:
+                data = "".join(json.dumps(value, ensure_ascii=False) + "\n" for value in new).encode("utf-8")
+                with open(self._dictionary_path(name), "ab") as file:
+                    # Com o flock, o arquivo só pode passar do fim publicado com textos de um
+                    # escritor morto antes de publicar: descartados, os novos entram no lugar
+                    if file.tell() > self._dictionary_offsets[name]:
+                        file.truncate(self._dictionary_offsets[name])
+                    file.write(data)
+                self._dictionary_offsets[name] += len(data)
+                self._persisted[name] = len(values)
+
+        header = self._header
+        fields = [self._size, self._capacity, self._index_generation] + [len(getattr(self, name)) for name in DICTIONARIES]
+        # Seqlock: ímpar enquanto os campos mudam
+        header[SHADOW:] = fields
+        header[SEQ] += 1
+        header[SIZE:SHADOW] = fields
+        header[SEQ] += 1
+        self._seen = int(header[SEQ])
+
+        if self._published_generation and self._published_generation != self._index_generation:
+            # Processos que ainda mapeiam a geração anterior continuam lendo (o arquivo só some do diretório)
+            for name in ("order", "day"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(f"index_{name}", self._published_generation))
+        self._published_generation = self._index_generation
+
+    # Leitura das publicações de outros processos
+
+    def changed(self) -> bool:
+        return int(self._header[SEQ]) != self._seen
+
+    def _read_header(self):
+        """(seq, campos) consistentes do cabeçalho"""
+        deadline = time.monotonic() + REPAIR_AFTER
+        while True:
+            seq = int(self._header[SEQ])
+            if seq % 2 == 0:
+                fields = [int(value) for value in self._header[SIZE:SHADOW]]
+                if int(self._header[SEQ]) == seq:
+                    return seq, fields
+            elif time.monotonic() > deadline:
+                self._repair_header()
+                deadline = time.monotonic() + REPAIR_AFTER
+            time.sleep(0)
+
+    def _repair_header(self):
+        """
+        Seq ímpar por tempo demais: sob o flock (liberado pelo sistema se o
+        escritor morreu), um seq ainda ímpar é publicação interrompida. Tudo o
+        que os campos descrevem já estava gravado; os campos vêm da cópia.
+        """
+        with self.lock():
+            header = self._header
+            if int(header[SEQ]) % 2:
+                header[SIZE:SHADOW] = header[SHADOW:]
+                header[SEQ] += 1
+
+    def refresh(self) -> int:
+        while True:
+            seq, fields = self._read_header()
+            if seq == self._seen:
+                return self._size
+            try:
+                self._attach(*fields)
+            except FileNotFoundError:
+                # Geração do índice substituída enquanto mapeava: lê o cabeçalho de novo
+                continue
+            self._seen = seq
+            SalesStore._publish(self)
+            return self._size
+
+    def _attach(self, size: int, capacity: int, generation: int, *dictionary_sizes):
+        """Mapeia as colunas publicadas e lê os textos novos dos dicionários"""
+        data, index = self._data, self._index
+        if capacity != self._capacity:
+            data = {name: _map(self._path(name), dtype, capacity) for name, dtype in self.COLUMNS.items()}
+        if capacity != self._capacity or generation != self._index_generation:
+            index = {
+                name: _map(self._path(f"index_{name}", generation), np.int32, capacity)
+                for name in ("order", "day")
+            }
+        for name, count in zip(DICTIONARIES, dictionary_sizes):
+            self._load_dictionary(name, count)
+        self._data, self._index = data, index
+        self._capacity = capacity
+        self._index_generation = self._published_generation = generation
+        self._size = size
+
+    def _load_dictionary(self, name: str, count: int):
+        dictionary = getattr(self, name)
+        missing = count - len(dictionary)
+        if missing <= 0:
+            return
+        with open(self._dictionary_path(name), "rb") as file:
+            file.seek(self._dictionary_offsets[name])
+            values = [json.loads(file.readline()) for _ in range(missing)]
+            self._dictionary_offsets[name] = file.tell()
+        dictionary.encode(np.array(values, dtype=object))
+        self._persisted[name] = len(dictionary)
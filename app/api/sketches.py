@@ -0,0 +1,390 @@
+"""
+Sketches atualizados na ingestão: HyperLogLog e t-digest
+
+- HyperLogLog (precisão p = 12, 4096 registradores de 1 byte): clientes
+  distintos por dia e por categoria. Registradores de dias diferentes se
+  combinam com máximo elemento a elemento, então qualquer intervalo de datas
+  é respondido sem varrer as vendas. Erro padrão relativo 1,04 / sqrt(4096)
+  ≈ 1,6% (≈ 3,3% em 95% dos casos); até ~10 mil clientes a contagem linear
+  dos registradores vazios é praticamente exata.
+- t-digest (compressão 200): percentis do valor dos pedidos (amount ×
+  quantity), com interpolação linear como o np.percentile. Exatos até 200
+  pedidos; depois, erro de posto tipicamente abaixo de 0,5% no centro e bem
+  menor nas caudas (p99), com memória fixa (~centenas de centróides).
+- Space-Saving ponderado (TOP_CAPACITY contadores): maiores clientes por
+  receita e por quantidade, com memória fixa qualquer que seja o número de
+  clientes. Cada contador superestima o total do cliente em no máximo o seu
+  `error`, que é no máximo o total somado / TOP_CAPACITY.
+
+Memória: 4 KB por dia com vendas (~15 MB para 10 anos de vendas diárias; dias
+sem vendas entre duas datas distantes não ocupam nada) mais 4 KB por categoria
+e ~100 KB por métrica do Space-Saving.
+"""
+
+import copy
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.api.store import SalesStore
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_RELATIVE_ERROR = 1.04 / np.sqrt(HLL_REGISTERS)
+
+TDIGEST_COMPRESSION = 200
+
+TOP_CAPACITY = 4096
+TOP_METRICS = ("revenue", "quantity")
+
+
+# HyperLogLog
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """Hash de 64 bits (splitmix64) de inteiros, vetorizado"""
+    z = np.asarray(values).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Número de bits significativos de cada uint64 (busca binária vetorizada)"""
+    x = values.copy()
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= (np.uint64(1) << np.uint64(shift))
+        length += shift * high
+        x = np.where(high, x >> np.uint64(shift), x)
+    return length + x.astype(np.int64)
+
+
+def hll_positions(hashes: np.ndarray):
+    """(registrador, posição do primeiro bit 1) de cada hash"""
+    rest_bits = 64 - HLL_PRECISION
+    index = (hashes >> np.uint64(rest_bits)).astype(np.int64)
+    rest = hashes & np.uint64((1 << rest_bits) - 1)
+    rank = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+    return index, rank
+
+
+def hll_update(registers: np.ndarray, rows: np.ndarray, hashes: np.ndarray):
+    """
+    Atualiza a matriz de registradores (uma linha por dia/categoria).
+
+    Agrupa por posição (poucas dezenas de valores distintos, ordenação radix)
+    e aplica cada grupo em ordem crescente; dentro de um grupo o valor é o
+    mesmo, então índices repetidos não importam. Evita np.maximum.at, que é
+    lento no NumPy 1.24.
+    """
+    if not len(hashes):
+        return
+    index, rank = hll_positions(hashes)
+    cells = np.asarray(rows, dtype=np.int64) * HLL_REGISTERS + index
+    order = np.argsort(rank, kind="stable")
+    cells, rank = cells[order], rank[order]
+    edges = np.flatnonzero(np.r_[True, rank[1:] != rank[:-1], True])
+    flat = registers.reshape(-1)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        group = cells[lo:hi]
+        flat[group] = np.maximum(flat[group], rank[lo])
+
+
+# 2^-r de cada valor possível de um registrador (consulta em tabela em vez de ldexp)
+_HLL_POWERS = np.ldexp(1.0, -np.arange(65))
+
+
+def hll_estimate(registers: np.ndarray):
+    """
+    Cardinalidade estimada de um conjunto de registradores (com correção para
+    poucos valores); com uma matriz, uma estimativa por linha, num só passo.
+    """
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / _HLL_POWERS[registers].sum(axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate = np.where(small, m * np.log(m / np.maximum(zeros, 1)), estimate)
+    return float(estimate) if estimate.ndim == 0 else estimate
+
+
+def _grow_rows(matrix: np.ndarray, rows: int) -> np.ndarray:
+    """Aumenta uma matriz de registradores (com zeros) até `rows` linhas"""
+    if rows <= len(matrix):
+        return matrix
+    grown = np.zeros((max(rows, 2 * len(matrix)), matrix.shape[1]), dtype=matrix.dtype)
+    grown[:len(matrix)] = matrix
+    return grown
+
+
+# t-digest
+
+class TDigest:
+    """
+    t-digest com fusão em lote (escala k1).
+
+    Cada lote é ordenado, recebe os centróides atuais na posição certa e é
+    agrupado pela posição de cada ponto na escala k1 = δ/2π · asin(2q - 1), que deixa
+    centróides pequenos nas caudas e maiores no centro. Até `compression`
+    pontos nada é agrupado e os percentis são exatos.
+    """
+
+    def __init__(self, compression: int = TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return len(self.means)
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        # Ordena só o lote e encaixa os centróides atuais (poucos) com searchsorted
+        values = np.sort(values)
+        positions = np.searchsorted(values, self.means)
+        means = np.insert(values, positions, self.means)
+        weights = np.insert(np.ones(len(values)), positions, self.weights)
+        if len(means) <= self.compression:
+            self.means, self.weights = means, weights
+        else:
+            self._compress(means, weights)
+
+    def merge(self, digests: Iterable["TDigest"]):
+        """
+        Junta os centróides de outros t-digests (ex.: um por partição) numa
+        única compressão; sem passar de `compression` centróides, nada é
+        agrupado e pontos isolados continuam exatos.
+        """
+        digests = [self] + [digest for digest in digests if len(digest.means)]
+        means = np.concatenate([digest.means for digest in digests])
+        if not len(means):
+            return
+        weights = np.concatenate([digest.weights for digest in digests])
+        self.min = min(digest.min for digest in digests)
+        self.max = max(digest.max for digest in digests)
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        if len(means) <= self.compression:
+            self.means, self.weights = means, weights
+        else:
+            self._compress(means, weights)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+        edges = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        total = np.add.reduceat(weights, edges)
+        self.means = np.add.reduceat(means * weights, edges) / total
+        self.weights = total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Valor na posição q·(n - 1) da ordenação (contada a partir de 0), com
+        interpolação linear entre os centros dos centróides. Centróides de um
+        ponto ficam na posição exata do ponto, então sem agrupamento o
+        resultado é igual ao do np.percentile.
+        """
+        if not len(self.means):
+            return None
+        cumulative = np.cumsum(self.weights)
+        center = cumulative - self.weights / 2 - 0.5
+        x = np.concatenate([[0.0], center, [cumulative[-1] - 1]])
+        y = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * (cumulative[-1] - 1), x, y))
+
+
+# Space-Saving
+
+class SpaceSaving:
+    """
+    Space-Saving ponderado (Metwally et al.) aplicado em lotes.
+
+    Guarda até `capacity` chaves com um contador (total estimado, nunca
+    abaixo do real) e o erro máximo do contador. Uma chave fora da lista tem
+    total real de no máximo `floor`, o menor contador com a lista cheia.
+    Cada lote é somado por chave; chaves novas entram com o total do lote
+    mais `floor` (o que podem ter acumulado antes) e, se a lista passar da
+    capacidade, ficam só os maiores contadores.
+
+    Os vetores são trocados a cada lote, nunca alterados no lugar.
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY):
+        self.capacity = capacity
+        self.keys = np.zeros(0, dtype=object)
+        self.counts = np.zeros(0)
+        self.errors = np.zeros(0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def floor(self) -> float:
+        """Maior total possível de uma chave fora da lista"""
+        return float(self.counts.min()) if len(self.keys) >= self.capacity else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.counts.nbytes + self.errors.nbytes
+
+    def update(self, keys, weights):
+        """Soma `weights` (não negativos) às chaves do lote; chaves nulas são ignoradas"""
+        codes, uniques = pd.factorize(np.asarray(keys))
+        valid = codes >= 0
+        if not valid.any():
+            return
+        sums = np.bincount(codes[valid], weights=np.asarray(weights, dtype=np.float64)[valid], minlength=len(uniques))
+        uniques = np.asarray(uniques)
+        if not len(self.keys):
+            # Mesmo tipo das chaves do primeiro lote (códigos inteiros ou textos)
+            self.keys = uniques[:0]
+        position = pd.Index(self.keys).get_indexer(uniques)
+        known = position >= 0
+        floor = self.floor
+        counts = self.counts.copy()
+        counts[position[known]] += sums[known]
+        keys = np.concatenate([self.keys, uniques[~known]])
+        counts = np.concatenate([counts, sums[~known] + floor])
+        errors = np.concatenate([self.errors, np.full(int((~known).sum()), floor)])
+        if len(keys) > self.capacity:
+            keep = np.argpartition(-counts, self.capacity - 1)[:self.capacity]
+            keys, counts, errors = keys[keep], counts[keep], errors[keep]
+        self.keys, self.counts, self.errors = keys, counts, errors
+
+    def top(self, n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, bool]:
+        """
+        (chaves, contadores, erros) das `n` maiores e se a lista é garantida.
+
+        Garantida quando o total mínimo de cada chave (contador - erro) não
+        fica abaixo do contador seguinte: nenhuma chave de fora pode superá-la.
+        """
+        order = np.lexsort((self.errors, -self.counts))
+        chosen, rest = order[:n], order[n:]
+        threshold = float(self.counts[rest[0]]) if len(rest) else self.floor
+        guaranteed = bool(np.all(self.counts[chosen] - self.errors[chosen] >= threshold))
+        return self.keys[chosen], self.counts[chosen], self.errors[chosen], guaranteed
+
+    def state(self) -> dict:
+        """Estado serializável em JSON (chaves de texto)"""
+        return {"keys": self.keys.tolist(), "counts": self.counts.tolist(), "errors": self.errors.tolist()}
+
+    @classmethod
+    def from_state(cls, state: dict, capacity: int = TOP_CAPACITY) -> "SpaceSaving":
+        sketch = cls(capacity)
+        sketch.keys = np.array(state["keys"], dtype=object)
+        sketch.counts = np.array(state["counts"], dtype=np.float64)
+        sketch.errors = np.array(state["errors"], dtype=np.float64)
+        return sketch
+
+
+class SalesSketches:
+    """
+    HyperLogLog de clientes por dia e por categoria, t-digest do valor dos
+    pedidos e Space-Saving dos maiores clientes (códigos do store) por métrica.
+
+    Só dias com vendas têm registradores: a linha i de `day_customers` é o
+    dia `days[i]` (na ordem em que os dias apareceram; `day_rows` faz o
+    caminho inverso na ingestão). As linhas de `category_customers` são
+    códigos de categoria do store.
+
+    Os registradores do HyperLogLog são atualizados no lugar (só crescem): um
+    snapshot lido durante uma ingestão pode já contar parte dos clientes do
+    lote em andamento. O t-digest e o Space-Saving trocam seus vetores a cada lote.
+    """
+
+    def __init__(self):
+        self.days = np.zeros(0, dtype=np.int64)
+        self.day_rows: Dict[int, int] = {}
+        self.day_customers = np.zeros((0, HLL_REGISTERS), dtype=np.uint8)
+        self.category_customers = np.zeros((0, HLL_REGISTERS), dtype=np.uint8)
+        self.tickets = TDigest()
+        self.top_customers = {metric: SpaceSaving() for metric in TOP_METRICS}
+
+    def snapshot(self) -> "SalesSketches":
+        """Cópia rasa para leitura (dias e matrizes ficam coerentes entre si)"""
+        view = copy.copy(self)
+        view.tickets = copy.copy(self.tickets)
+        view.top_customers = {metric: copy.copy(sketch) for metric, sketch in self.top_customers.items()}
+        return view
+
+    @property
+    def nbytes(self) -> int:
+        top = sum(sketch.nbytes for sketch in self.top_customers.values())
+        return self.day_customers.nbytes + self.category_customers.nbytes + self.tickets.means.nbytes * 2 + top
+
+    def apply(self, store: SalesStore, start: int, stop: int):
+        """Atualiza os sketches com as linhas [start, stop) recém-adicionadas ao store"""
+        if stop <= start:
+            return
+        rows = slice(start, stop)
+        amount = store.column("amount")[rows]
+        quantity = store.column("quantity")[rows]
+        self.tickets.update(amount * quantity)
+
+        day = store.column("day")[rows].astype(np.int64)
+        category = store.column("category")[rows].astype(np.int64)
+        customer = store.column("customer")[rows].astype(np.int64)
+        known = customer >= 0
+        if not known.any():
+            return
+        day, category, customer = day[known], category[known], customer[known]
+        self.top_customers["revenue"].update(customer, (amount * quantity)[known])
+        self.top_customers["quantity"].update(customer, quantity[known])
+
+        # Linha de cada dia do lote; dias novos entram no fim da matriz
+        unique_days, positions = np.unique(day, return_inverse=True)
+        new_days = [value for value in unique_days.tolist() if value not in self.day_rows]
+        for value in new_days:
+            self.day_rows[value] = len(self.day_rows)
+        self.day_customers = _grow_rows(self.day_customers, len(self.day_rows))
+        if new_days:
+            self.days = np.concatenate([self.days, np.array(new_days, dtype=np.int64)])
+        self.category_customers = _grow_rows(self.category_customers, len(store.categories))
+        day_row = np.array([self.day_rows[value] for value in unique_days.tolist()], dtype=np.int64)[positions]
+
+        hashes = hash64(customer)
+        hll_update(self.day_customers, day_row, hashes)
+        hll_update(self.category_customers, category, hashes)
+
+    def distinct_customers(self, start_day: Optional[int] = None, end_day: Optional[int] = None) -> int:
+        """Clientes distintos estimados no intervalo [start_day, end_day] (padrão: tudo)"""
+        inside = np.ones(len(self.days), dtype=bool)
+        if start_day is not None:
+            inside &= self.days >= start_day
+        if end_day is not None:
+            inside &= self.days <= end_day
+        rows = np.flatnonzero(inside)
+        if not len(rows):
+            return 0
+        return int(round(hll_estimate(self.day_customers[rows].max(axis=0))))
+
+    def customers_by_category(self, codes: Iterable[int]) -> Dict[int, int]:
+        """Clientes distintos estimados por código de categoria"""
+        codes = np.fromiter(codes, dtype=np.int64)
+        estimates = np.zeros(len(codes), dtype=np.int64)
+        known = codes < len(self.category_customers)
+        if known.any():
+            estimates[known] = np.round(hll_estimate(self.category_customers[codes[known]]))
+        return dict(zip(codes.tolist(), estimates.tolist()))
+
+    def ticket_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Optional[float]]:
+        """Percentis do valor dos pedidos ({"p50": ..., ...})"""
+        return {
+            f"p{p}": None if value is None else round(value, 2)
+            for p in percentiles
+            for value in [self.tickets.quantile(p / 100)]
+        }
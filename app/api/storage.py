@@ -0,0 +1,285 @@
+"""
+Interface de armazenamento das vendas e implementação em memória
+"""
+
+import contextlib
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.api.query import GroupTotals, QuerySpec, run_memory
+from app.api.rollups import SalesRollups
+from app.api.sketches import TOP_METRICS
+from app.api.store import TOTALS_DICTIONARIES, SalesStore
+
+# Dimensões do ranking de /api/v1/sales/top
+TOP_DIMENSIONS = ("product", "customer", "category")
+
+
+def top_indices(values: np.ndarray, n: int) -> np.ndarray:
+    """Posições dos `n` maiores valores, do maior para o menor (seleção parcial em O(len), empates pela posição)"""
+    if n < len(values):
+        chosen = np.argpartition(-values, n - 1)[:n]
+    else:
+        chosen = np.arange(len(values))
+    return chosen[np.lexsort((chosen, -values[chosen]))]
+
+
+def top_totals(by: str, keys, revenue, quantity, orders, metric: str, n: int) -> List[dict]:
+    """Ranking das chaves com pedidos pelos totais por chave (vetores alinhados a `keys`)"""
+    present = np.flatnonzero(np.asarray(orders) > 0)
+    totals = {"revenue": np.asarray(revenue)[present], "quantity": np.asarray(quantity)[present]}
+    chosen = present[top_indices(totals[metric], n)]
+    return [
+        {by: keys[i], "revenue": round(float(revenue[i]), 2), "quantity": int(quantity[i]), "orders": int(orders[i])}
+        for i in chosen
+    ]
+
+
+def approximate_top(names, counts, errors, guaranteed: bool, metric: str) -> dict:
+    """Resposta de SalesBackend.top_customers a partir do Space-Saving"""
+    cast = int if metric == "quantity" else lambda value: round(float(value), 2)
+    return {
+        "items": [
+            {"customer": name, metric: cast(count), "error": cast(error)}
+            for name, count, error in zip(names, counts, errors)
+        ],
+        "guaranteed": guaranteed,
+    }
+
+
+class SalesBackend:
+    """
+    Operações que a API precisa do armazenamento.
+
+    Lotes chegam no formato de colunas de SalesStore.append_columns; os dias
+    são números de dias desde 1970-01-01.
+    """
+
+    name = "base"
+
+    # A API mantém uma cópia das vendas no store em memória (listagem de /sales e sketches)
+    uses_memory_store = True
+
+    @property
+    def nbytes(self) -> int:
+        """Memória mantida pelo próprio backend (caches)"""
+        return 0
+
+    def append_columns(self, columns: dict) -> int:
+        """Grava um lote inteiro e retorna a quantidade de vendas gravadas"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Total de vendas armazenadas"""
+        raise NotImplementedError
+
+    def kpis(self) -> dict:
+        """Totais gerais: total_revenue, total_orders e total_quantity"""
+        raise NotImplementedError
+
+    def daily(self, start_day: int, end_day: int):
+        """Vetores (receita, pedidos) por dia no intervalo [start_day, end_day]"""
+        raise NotImplementedError
+
+    def day_bounds(self) -> Optional[Tuple[int, int]]:
+        """(primeiro, último) dia com vendas, ou None sem vendas"""
+        raise NotImplementedError
+
+    def by_category(self) -> List[dict]:
+        """Receita e quantidade por categoria"""
+        raise NotImplementedError
+
+    def detail(self) -> dict:
+        """Valor unitário médio (average_amount), total_items e unique_products"""
+        raise NotImplementedError
+
+    def activity(self, start_day: int, end_day: int) -> dict:
+        """Receita (revenue), pedidos (orders) e clientes distintos (customers) em [start_day, end_day]"""
+        raise NotImplementedError
+
+    def ticket_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Optional[float]]:
+        """
+        Percentis do valor dos pedidos ({"p50": ..., ...}), mesma definição em
+        todos os backends: interpolação linear entre os dois valores vizinhos
+        da posição q·(n - 1) na ordenação (padrão do np.percentile e
+        PERCENTILE_CONT do PostgreSQL). Exatos, exceto no backend em memória
+        com muitas vendas (t-digest).
+        """
+        raise NotImplementedError
+
+    def top(self, by: str, metric: str, n: int, start_day: Optional[int] = None,
+            end_day: Optional[int] = None) -> List[dict]:
+        """
+        `n` maiores produtos, clientes ou categorias (`by`) por receita ou
+        quantidade (`metric`) em [start_day, end_day] (padrão: todo o período),
+        com receita, quantidade e pedidos exatos de cada um.
+        """
+        raise NotImplementedError
+
+    def top_customers(self, metric: str, n: int) -> Optional[dict]:
+        """
+        Maiores clientes de todo o período pelo Space-Saving mantido na
+        ingestão: {"items": [{"customer", metric, "error"}], "guaranteed"}, ou
+        None se o backend não mantém o sketch.
+        """
+        return None
+
+    def query(self, spec: QuerySpec) -> Tuple[GroupTotals, dict]:
+        """
+        Totais por grupo da consulta genérica (/api/v1/query) e a descrição do
+        caminho escolhido (plan, source, reason, rows_scanned, ...).
+        """
+        raise NotImplementedError
+
+    def ping(self):
+        """Verifica o acesso ao armazenamento (levanta exceção se indisponível)"""
+
+    def close(self):
+        """Libera recursos (conexões, arquivos)"""
+
+
+class MemorySnapshot(NamedTuple):
+    """Store e agregados publicados juntos pelo mesmo lote"""
+
+    store: SalesStore
+    rollups: SalesRollups
+
+
+class MemoryBackend(SalesBackend):
+    """
+    Store colunar em memória com agregados incrementais.
+
+    Escritas são serializadas por um lock e terminam publicando um snapshot
+    novo (store e agregados) com uma única atribuição. Leituras pegam o
+    snapshot atual sem lock: veem cada lote inteiro ou nada dele, e totais,
+    séries e categorias de uma mesma leitura batem entre si.
+
+    Com um store compartilhado entre processos (SharedSalesStore), `refresh`
+    aplica aos agregados deste processo as vendas gravadas pelos outros.
+
+    Com um `journal` (app.api.wal.Journal), cada lote é registrado no WAL e
+    só retorna depois de chegar ao disco.
+    """
+
+    name = "memory"
+
+    def __init__(self, store: SalesStore, rollups: SalesRollups, journal=None):
+        self.store = store
+        self.rollups = rollups
+        self.journal = journal
+        self._write_lock = threading.RLock()
+        self._publish()
+
+    def _publish(self):
+        self._snapshot = MemorySnapshot(self.store.snapshot(), self.rollups.snapshot())
+
+    def snapshot(self) -> MemorySnapshot:
+        """Estado consistente mais recente, para várias leituras seguidas"""
+        return self._snapshot
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Escrita exclusiva (entre threads e, no store compartilhado, entre processos), já sincronizada"""
+        with self._write_lock, self.store.lock():
+            self._catch_up()
+            yield
+
+    def refresh(self) -> Optional[Tuple[int, int]]:
+        """Aplica as vendas publicadas por outros processos; intervalo das linhas novas ou None"""
+        if not self.store.changed():
+            return None
+        with self._write_lock:
+            return self._catch_up()
+
+    def _catch_up(self) -> Optional[Tuple[int, int]]:
+        start = len(self.store)
+        stop = self.store.refresh()
+        if stop == start:
+            return None
+        self.rollups.apply(self.store, start, stop)
+        self._publish()
+        return start, stop
+
+    def append_columns(self, columns: dict) -> int:
+        record = None
+        with self.exclusive():
+            if self.journal is not None:
+                self.journal.begin(self.store)
+            start = len(self.store)
+            count = self.store.append_columns(**columns)
+            self.rollups.apply(self.store, start, len(self.store))
+            if self.journal is not None:
+                record = self.journal.log(self.store)
+            self._publish()
+        if record is not None:
+            # fsync fora do lock: lotes de outras threads entram no mesmo fsync
+            self.journal.commit(record)
+        return count
+
+    def rebuild(self) -> List[str]:
+        """Reconstrói os agregados a partir do store e confere; retorna as divergências"""
+        with self.exclusive():
+            self.rollups.rebuild(self.store)
+            differences = self.rollups.verify(self.store)
+            self._publish()
+        return differences
+
+    def count(self) -> int:
+        return len(self._snapshot.store)
+
+    def kpis(self) -> dict:
+        return self._snapshot.rollups.kpis()
+
+    def daily(self, start_day: int, end_day: int):
+        revenue, orders = self._snapshot.rollups.daily(start_day, end_day)
+        return revenue, orders.astype(np.int64)
+
+    def day_bounds(self) -> Optional[Tuple[int, int]]:
+        return self._snapshot.rollups.day_bounds()
+
+    def by_category(self) -> List[dict]:
+        snapshot = self._snapshot
+        return snapshot.rollups.by_category(snapshot.store)
+
+    def detail(self) -> dict:
+        return self._snapshot.rollups.detail()
+
+    def activity(self, start_day: int, end_day: int) -> dict:
+        # Somas acumuladas (exatas) e HyperLogLog (estimativa, ~1,6% de erro padrão)
+        rollups = self._snapshot.rollups
+        revenue, orders = rollups.window(start_day, end_day)
+        customers = rollups.sketches.distinct_customers(start_day, end_day)
+        return {"revenue": revenue, "orders": orders, "customers": customers}
+
+    def ticket_percentiles(self, percentiles=(50, 90, 99)) -> Dict[str, Optional[float]]:
+        return self._snapshot.rollups.sketches.ticket_percentiles(percentiles)
+
+    def top(self, by: str, metric: str, n: int, start_day: Optional[int] = None,
+            end_day: Optional[int] = None) -> List[dict]:
+        store, rollups = self._snapshot
+        bounds = rollups.day_bounds()
+        whole = bounds is None or (
+            (start_day is None or start_day <= bounds[0]) and (end_day is None or end_day >= bounds[1])
+        )
+        if whole and by != "customer":
+            # Produtos e categorias de todo o período: vetores dos agregados, sem varrer vendas
+            totals = rollups.totals_by(by)
+        else:
+            rows = None if whole else store.rows_between(
+                bounds[0] if start_day is None else start_day, bounds[1] if end_day is None else end_day
+            )
+            totals = store.totals_by(by, rows)
+        keys = getattr(store, TOTALS_DICTIONARIES[by]).values
+        return top_totals(by, keys, *totals, metric, n)
+
+    def top_customers(self, metric: str, n: int) -> Optional[dict]:
+        store, rollups = self._snapshot
+        codes, counts, errors, guaranteed = rollups.sketches.top_customers[metric].top(n)
+        names = store.customers.decode(codes.astype(np.int64)).tolist()
+        return approximate_top(names, counts, errors, guaranteed, metric)
+
+    def query(self, spec: QuerySpec) -> Tuple[GroupTotals, dict]:
+        store, rollups = self._snapshot
+        return run_memory(spec, store, rollups)
@@ -0,0 +1,430 @@
+"""
+Armazenamento colunar em memória para as vendas
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+import contextlib
+import numpy as np
+import pandas as pd
+
+# Datas de venda aceitas: fora deste intervalo a data é tratada como inválida
+# (agregados e sketches por dia crescem com o intervalo de datas)
+FIRST_SALE_DATE, LAST_SALE_DATE = "1970-01-01", "2100-12-31"
+SALE_DAYS = tuple(int(np.datetime64(value, "D").astype(np.int64)) for value in (FIRST_SALE_DATE, LAST_SALE_DATE))
+
+
+def _parse_date(value) -> np.datetime64:
+    """Converte uma data em texto: ISO pelo NumPy, outros formatos pelo pandas (dia primeiro)"""
+    try:
+        return np.datetime64(value, "s")
+    except ValueError:
+        return np.datetime64(pd.to_datetime(value, dayfirst=True), "s")
+
+
+def coerce_days(values, bounded: bool = True):
+    """
+    Converte datas para número de dias desde 1970-01-01 (int32) sem gerar erro.
+
+    Retorna (dias, válidos): cada data distinta é convertida uma única vez
+    (ISO pelo NumPy, outros formatos como DD/MM/AAAA pelo pandas); valores
+    inválidos ou vazios ficam com válidos=False, assim como, com `bounded`,
+    datas fora de [FIRST_SALE_DATE, LAST_SALE_DATE].
+    """
+    dates = np.asarray(values)
+    if not np.issubdtype(dates.dtype, np.datetime64):
+        codes, uniques = pd.factorize(dates.astype(object))
+        parsed = np.empty(len(uniques) + 1, dtype="datetime64[s]")
+        parsed[-1] = np.datetime64("NaT")
+        try:
+            # Caso comum: todas ISO, convertidas de uma vez
+            parsed[:-1] = np.asarray(uniques, dtype=object).astype("datetime64[s]")
+        except (ValueError, TypeError, OverflowError):
+            for i, value in enumerate(uniques):
+                try:
+                    parsed[i] = _parse_date(value)
+                except (ValueError, TypeError, OverflowError):
+                    parsed[i] = np.datetime64("NaT")
+        dates = parsed[codes]
+    valid = ~np.isnat(dates)
+    numbers = dates[valid].astype("datetime64[D]").astype(np.int64)
+    if bounded:
+        inside = (numbers >= SALE_DAYS[0]) & (numbers <= SALE_DAYS[1])
+        valid[valid] = inside
+        numbers = numbers[inside]
+    days = np.zeros(len(dates), dtype=np.int32)
+    days[valid] = numbers
+    return days, valid
+
+
+def parse_days(values, bounded: bool = True) -> np.ndarray:
+    """
+    Converte datas para número de dias (int32); datas inválidas, vazias ou
+    (com `bounded`) fora de [FIRST_SALE_DATE, LAST_SALE_DATE] geram ValueError
+    """
+    days, valid = coerce_days(values, bounded)
+    if not valid.all():
+        invalid = np.asarray(values, dtype=object)[~valid][:5].tolist()
+        raise ValueError(f"Datas inválidas ou fora de {FIRST_SALE_DATE} a {LAST_SALE_DATE}: {invalid}")
+    return days
+
+
+def day_number(value) -> int:
+    """Converte uma única data para número de dias (filtros de consulta: qualquer data válida)"""
+    return int(parse_days([value], bounded=False)[0])
+
+
+def day_to_iso(days) -> np.ndarray:
+    """Converte números de dias de volta para texto ISO (AAAA-MM-DD)"""
+    return np.datetime_as_string(np.asarray(days, dtype=np.int64).astype("datetime64[D]"), unit="D")
+
+
+def parse_quantities(values) -> np.ndarray:
+    """
+    Converte quantidades para o tipo da coluna do store (int32); valores fora
+    do intervalo dele geram ValueError (a conversão direta daria a volta ou
+    falharia com OverflowError)
+    """
+    dtype = SalesStore.COLUMNS["quantity"]
+    try:
+        numbers = np.asarray(values, dtype=np.int64)
+    except OverflowError:
+        raise ValueError("Campo 'quantity' fora do intervalo") from None
+    bounds = np.iinfo(dtype)
+    if len(numbers) and (numbers.min() < bounds.min or numbers.max() > bounds.max):
+        raise ValueError("Campo 'quantity' fora do intervalo")
+    return numbers.astype(dtype)
+
+
+def records_to_columns(records: Iterable[dict]) -> dict:
+    """Converte vendas no formato dict (SaleItem.dict()) para o formato de colunas"""
+    records = list(records)
+    return {
+        "date": [r["date"] for r in records],
+        "product": [r["product"] for r in records],
+        "category": [r["category"] for r in records],
+        "amount": [r["amount"] for r in records],
+        "quantity": [r["quantity"] for r in records],
+        "customer": [r.get("customer") for r in records],
+    }
+
+
+# Dicionário de cada coluna codificada
+TOTALS_DICTIONARIES = {"product": "products", "category": "categories", "customer": "customers"}
+
+
+class Dictionary:
+    """Codificação por dicionário: cada texto distinto recebe um código inteiro"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self._lookup = np.array([None], dtype=object)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values: Sequence[Optional[str]]) -> np.ndarray:
+        """Retorna os códigos (int32) dos valores; nulos viram -1 (aceita pd.Categorical sem recodificar)"""
+        if isinstance(values, pd.Categorical):
+            local_codes, uniques = values.codes, values.categories
+        else:
+            local_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self.codes.get(value)
+            if code is None:
+                code = len(self.values)
+                self.codes[value] = code
+                self.values.append(value)
+            mapping[i] = code
+        codes = np.full(len(local_codes), -1, dtype=np.int32)
+        valid = local_codes >= 0
+        codes[valid] = mapping[local_codes[valid]]
+        return codes
+
+    def extend(self, values: Sequence[str]):
+        """Acrescenta textos novos no fim, com os códigos seguintes na ordem dada (recuperação do WAL)"""
+        for value in values:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Converte códigos de volta para texto (None para -1)"""
+        if len(self._lookup) != len(self.values) + 1:
+            self._lookup = np.array(self.values + [None], dtype=object)
+        return self._lookup[codes]
+
+
+class SalesStore:
+    """
+    Vendas guardadas em colunas NumPy com crescimento amortizado.
+
+    amount: float64, quantity: int32, day: int32 (dias desde 1970-01-01),
+    product/category/customer: códigos int32 de dicionário (-1 = sem cliente).
+
+    Leituras usam o snapshot publicado (`snapshot()`): tamanho e referências
+    às colunas fixos, sem lock. Escritas (um escritor por vez) só gravam
+    depois do tamanho publicado ou em vetores novos e publicam o snapshot
+    seguinte com uma única atribuição, então uma leitura nunca vê um lote
+    pela metade.
+    """
+
+    COLUMNS = {
+        "amount": np.float64,
+        "quantity": np.int32,
+        "day": np.int32,
+        "product": np.int32,
+        "category": np.int32,
+        "customer": np.int32,
+    }
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        self._data = {name: self._allocate(name, dtype, self._capacity) for name, dtype in self.COLUMNS.items()}
+        self.products = Dictionary()
+        self.categories = Dictionary()
+        self.customers = Dictionary()
+        # Índice de datas: permutação das linhas ordenada por dia e os dias nessa ordem
+        self._index = self._allocate_index()
+        self._publish()
+
+    @classmethod
+    def restore(cls, columns: Dict[str, np.ndarray], index: Dict[str, np.ndarray],
+                dictionaries: Dict[str, List[str]]) -> "SalesStore":
+        """
+        Store com colunas já prontas (ex.: mapeadas de um snapshot, somente
+        leitura), sem copiar: o primeiro lote que não couber copia as colunas
+        para vetores novos, como no crescimento normal.
+        """
+        size = len(columns["amount"])
+        if not size:
+            return cls()
+        store = cls.__new__(cls)
+        store._size = store._capacity = size
+        store._data = {name: columns[name] for name in cls.COLUMNS}
+        store._index = {name: index[name] for name in ("order", "day")}
+        for name in TOTALS_DICTIONARIES.values():
+            dictionary = Dictionary()
+            dictionary.extend(dictionaries[name])
+            setattr(store, name, dictionary)
+        store._publish()
+        return store
+
+    # Alocação (SharedSalesStore troca por arquivos mapeados em memória)
+
+    def _allocate(self, key: str, dtype, capacity: int) -> np.ndarray:
+        """Vetor para a coluna ou índice `key` ("amount", ..., "index_order", "index_day")"""
+        return np.empty(capacity, dtype)
+
+    def _allocate_index(self) -> Dict[str, np.ndarray]:
+        """Vetores novos para o índice de datas"""
+        return {name: self._allocate(f"index_{name}", np.int32, self._capacity) for name in ("order", "day")}
+
+    def _grow(self, key: str, column: np.ndarray, capacity: int) -> np.ndarray:
+        """Vetor com `capacity` posições e as linhas válidas de `column`"""
+        grown = self._allocate(key, column.dtype, capacity)
+        grown[:self._size] = column[:self._size]
+        return grown
+
+    # Sincronização entre processos (sem efeito no store em memória do processo)
+
+    def lock(self):
+        """Exclusão entre escritores de processos diferentes"""
+        return contextlib.nullcontext()
+
+    def changed(self) -> bool:
+        """Indica se outro processo publicou vendas ainda não vistas"""
+        return False
+
+    def refresh(self) -> int:
+        """Passa a ver as vendas publicadas por outros processos; retorna o novo tamanho"""
+        return len(self)
+
+    def __len__(self):
+        return self._snapshot._size
+
+    def snapshot(self) -> "SalesStore":
+        """Store somente leitura com as linhas publicadas até agora (sem copiar as colunas)"""
+        return self._snapshot
+
+    def _publish(self):
+        view = SalesStore.__new__(SalesStore)
+        view._size = self._size
+        view._capacity = self._capacity
+        view._data = dict(self._data)
+        view._index = dict(self._index)
+        view.products, view.categories, view.customers = self.products, self.categories, self.customers
+        view._snapshot = view
+        self._snapshot = view
+
+    def _reserve(self, extra: int):
+        """Garante espaço para mais `extra` linhas dobrando a capacidade"""
+        needed = self._size + extra
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        for prefix, arrays in (("", self._data), ("index_", self._index)):
+            for name, column in arrays.items():
+                arrays[name] = self._grow(prefix + name, column, capacity)
+        self._capacity = capacity
+
+    def column(self, name: str) -> np.ndarray:
+        """Visão (sem cópia) das linhas publicadas de uma coluna"""
+        view = self._snapshot
+        return view._data[name][:view._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelas linhas válidas e pelo índice de datas (sem capacidade livre)"""
+        per_row = sum(np.dtype(dtype).itemsize for dtype in self.COLUMNS.values())
+        per_row += sum(column.itemsize for column in self._index.values())
+        return per_row * len(self)
+
+    # Escrita
+
+    def append(self, records: Iterable[dict]) -> int:
+        """Adiciona uma lista de vendas no formato dict (como SaleItem.dict())"""
+        return self.append_columns(**records_to_columns(records))
+
+    def append_columns(self, date, product, category, amount, quantity, customer=None) -> int:
+        """Adiciona um lote já em formato de colunas numa única operação"""
+        if self._snapshot is self:
+            raise TypeError("Snapshot do store é somente leitura")
+        day = parse_days(date)
+        n = len(day)
+        if n == 0:
+            return 0
+        if customer is None:
+            customer = [None] * n
+
+        batch = {
+            "amount": np.asarray(amount, dtype=np.float64),
+            "quantity": parse_quantities(quantity),
+            "day": day,
+            "product": self.products.encode(product),
+            "category": self.categories.encode(category),
+            "customer": self.customers.encode(customer),
+        }
+        for name, values in batch.items():
+            if len(values) != n:
+                raise ValueError(f"Coluna '{name}' com {len(values)} linhas, esperado {n}")
+        return self.append_encoded(batch)
+
+    def append_encoded(self, batch: Dict[str, np.ndarray]) -> int:
+        """Adiciona linhas já convertidas (dias e códigos dos dicionários atuais), como as do WAL"""
+        if self._snapshot is self:
+            raise TypeError("Snapshot do store é somente leitura")
+        n = len(batch["amount"])
+        if n == 0:
+            return 0
+        self._reserve(n)
+        start, stop = self._size, self._size + n
+        for name, values in batch.items():
+            self._data[name][start:stop] = values
+        self._size = stop
+        self._index_dates(start, stop)
+        self._publish()
+        return n
+
+    def _index_dates(self, start: int, stop: int):
+        """Inclui as linhas [start, stop) no índice de datas"""
+        day = self._data["day"][start:stop]
+        order = np.argsort(day, kind="stable").astype(np.int32)
+        days = day[order]
+        order += start
+        index_order, index_days = self._index["order"], self._index["day"]
+        if start == 0 or days[0] >= index_days[start - 1]:
+            # Caso comum (lotes em ordem cronológica): só estende o índice
+            index_order[start:stop] = order
+            index_days[start:stop] = days
+            return
+        # Lote fora de ordem: intercala duas sequências já ordenadas em vetores
+        # novos (snapshots publicados continuam lendo o índice anterior). A
+        # posição de cada linha nova vem de uma busca binária, sem reordenar o
+        # índice inteiro; depois das linhas antigas do mesmo dia, como na
+        # ordenação estável.
+        positions = np.searchsorted(index_days[:start], days, side="right")
+        index = self._allocate_index()
+        index["order"][:stop] = np.insert(index_order[:start], positions, order)
+        index["day"][:stop] = np.insert(index_days[:start], positions, days)
+        self._index = index
+
+    def date_index(self):
+        """(ordem das linhas, dias nessa ordem) do índice de datas das linhas publicadas"""
+        view = self._snapshot
+        return view._index["order"][:view._size], view._index["day"][:view._size]
+
+    def rows_between(self, start_day: int, end_day: int) -> np.ndarray:
+        """Índices das linhas com dia em [start_day, end_day] (busca binária)"""
+        view = self._snapshot
+        days = view._index["day"][:view._size]
+        lo = np.searchsorted(days, start_day, side="left")
+        hi = np.searchsorted(days, end_day, side="right")
+        return view._index["order"][lo:hi]
+
+    # Leitura
+
+    def revenue(self) -> np.ndarray:
+        """Receita por linha (amount * quantity)"""
+        return self.column("amount") * self.column("quantity")
+
+    def total_revenue(self) -> float:
+        """Receita total"""
+        return float(np.dot(self.column("amount"), self.column("quantity")))
+
+    def by_category(self) -> List[dict]:
+        """Receita e quantidade por categoria"""
+        codes = self.column("category")
+        size = len(self.categories)
+        revenue = np.bincount(codes, weights=self.revenue(), minlength=size)
+        quantity = np.bincount(codes, weights=self.column("quantity"), minlength=size)
+        present = np.bincount(codes, minlength=size) > 0
+        return [
+            {"category": self.categories.values[code], "revenue": float(revenue[code]), "quantity": int(quantity[code])}
+            for code in np.flatnonzero(present)
+        ]
+
+    def totals_by(self, name: str, rows=None):
+        """(receita, quantidade, pedidos) por código de `name` ("product", "category", "customer") nas linhas `rows`"""
+        view = self._snapshot
+        rows = slice(0, view._size) if rows is None else rows
+        codes = view._data[name][rows]
+        amount, quantity = view._data["amount"][rows], view._data["quantity"][rows]
+        known = codes >= 0
+        if not known.all():
+            # Vendas sem cliente não entram no ranking de clientes
+            codes, amount, quantity = codes[known], amount[known], quantity[known]
+        size = len(getattr(view, TOTALS_DICTIONARIES[name]))
+        revenue = np.bincount(codes, weights=amount * quantity, minlength=size)
+        return revenue, np.bincount(codes, weights=quantity, minlength=size).astype(np.int64), np.bincount(codes, minlength=size)
+
+    def daily(self, start_day: int, end_day: int):
+        """Receita e pedidos por dia no intervalo [start_day, end_day]"""
+        length = end_day - start_day + 1
+        if length <= 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        view = self._snapshot
+        rows = view.rows_between(start_day, end_day)
+        offset = view._data["day"][rows].astype(np.int64) - start_day
+        revenue = np.bincount(offset, weights=view._data["amount"][rows] * view._data["quantity"][rows], minlength=length)
+        orders = np.bincount(offset, minlength=length)
+        return revenue, orders
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> List[dict]:
+        """Linhas no formato dict (mesmo formato do SaleItem)"""
+        view = self._snapshot
+        stop = view._size if stop is None else min(stop, view._size)
+        rows = slice(start, stop)
+        columns = {
+            "date": day_to_iso(view._data["day"][rows]).tolist(),
+            "product": self.products.decode(view._data["product"][rows]).tolist(),
+            "category": self.categories.decode(view._data["category"][rows]).tolist(),
+            "amount": view._data["amount"][rows].tolist(),
+            "quantity": view._data["quantity"][rows].tolist(),
+            "customer": self.customers.decode(view._data["customer"][rows]).tolist(),
+        }
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
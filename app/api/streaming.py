@@ -0,0 +1,118 @@
+"""
+Exportação das vendas em blocos (NDJSON e Arrow IPC stream)
+"""
+
+import io
+from typing import Iterator
+
+import numpy as np
+
+from app.api import codec
+from app.api.store import SalesStore
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow é opcional: sem ele o formato Arrow fica indisponível
+    pa = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Linhas por bloco enviado ao cliente
+CHUNK_ROWS = 10_000
+
+
+def iter_ndjson(store: SalesStore, start: int, stop: int, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Gera as linhas [start, stop) como NDJSON, um bloco por vez"""
+    for chunk_start in range(start, stop, chunk_rows):
+        yield codec.encode_ndjson(store, chunk_start, min(chunk_start + chunk_rows, stop))
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino de escrita que acumula bytes até serem drenados para a resposta"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _dictionary_column(codes: np.ndarray, dictionary):
+    """Coluna Arrow codificada por dicionário; código -1 vira nulo"""
+    indices = pa.array(codes, type=pa.int32(), mask=codes < 0)
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+ARROW_SCHEMA = None if pa is None else pa.schema([
+    ("date", pa.date32()),
+    ("product", pa.dictionary(pa.int32(), pa.string())),
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+    ("amount", pa.float64()),
+    ("quantity", pa.int32()),
+    ("customer", pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def iter_arrow(store: SalesStore, start: int, stop: int, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Gera as linhas [start, stop) como Arrow IPC stream.
+
+    Os dicionários são enviados uma única vez (estado no início da exportação);
+    cada bloco carrega só os códigos inteiros e as colunas numéricas. Uma
+    visão das partições Parquet (app.api.partitions) é exportada pelas suas
+    tabelas, com o dicionário de cada bloco.
+    """
+    if not isinstance(store, SalesStore):
+        yield from _iter_arrow_tables(store.iter_tables(start, stop, chunk_rows))
+        return
+    dictionaries = {
+        "product": pa.array(store.products.values[:], type=pa.string()),
+        "category": pa.array(store.categories.values[:], type=pa.string()),
+        "customer": pa.array(store.customers.values[:], type=pa.string()),
+    }
+    schema = ARROW_SCHEMA
+
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    for chunk_start in range(start, stop, chunk_rows):
+        rows = slice(chunk_start, min(chunk_start + chunk_rows, stop))
+        batch = pa.record_batch([
+            pa.array(store.column("day")[rows], type=pa.int32()).cast(pa.date32()),
+            _dictionary_column(store.column("product")[rows], dictionaries["product"]),
+            _dictionary_column(store.column("category")[rows], dictionaries["category"]),
+            pa.array(store.column("amount")[rows], type=pa.float64()),
+            pa.array(store.column("quantity")[rows], type=pa.int32()),
+            _dictionary_column(store.column("customer")[rows], dictionaries["customer"]),
+        ], schema=schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _iter_arrow_tables(tables) -> Iterator[bytes]:
+    """Arrow IPC stream a partir de tabelas com textos simples (codificados por bloco)"""
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, ARROW_SCHEMA)
+    for table in tables:
+        columns = [
+            pc.dictionary_encode(table.column(name)) if pa.types.is_dictionary(field.type) else table.column(name)
+            for name, field in zip(ARROW_SCHEMA.names, ARROW_SCHEMA)
+        ]
+        for batch in pa.Table.from_arrays(columns, schema=ARROW_SCHEMA).to_batches():
+            writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
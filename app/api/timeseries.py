@@ -0,0 +1,101 @@
+"""
+Séries temporais por dia, semana ou mês com redução de pontos no servidor
+
+Parte dos vetores diários (receita e pedidos) do backend e agrega por período
+com np.add.reduceat. Se ainda houver mais pontos que `max_points`, reduz por
+agregação de períodos vizinhos (soma, preserva os totais) ou por LTTB
+(Largest-Triangle-Three-Buckets, preserva o formato da curva de receita).
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from app.api.store import day_to_iso
+
+GRANULARITIES = ("day", "week", "month")
+DOWNSAMPLING = ("sum", "lttb")
+
+
+def period_starts(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Primeiro dia do período (dia, semana iniciando na segunda ou mês) de cada dia"""
+    days = np.asarray(days, dtype=np.int64)
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 foi quinta-feira: (dia + 3) % 7 é o dia da semana com segunda = 0
+        return days - (days + 3) % 7
+    if granularity == "month":
+        months = days.astype("datetime64[D]").astype("datetime64[M]")
+        return months.astype("datetime64[D]").astype(np.int64)
+    raise ValueError(f"Granularidade inválida: {granularity!r}")
+
+
+def aggregate(start_day: int, revenue: np.ndarray, orders: np.ndarray, granularity: str):
+    """Soma os vetores diários (o primeiro é `start_day`) por período"""
+    if not len(revenue):
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    starts = period_starts(np.arange(start_day, start_day + len(revenue)), granularity)
+    edges = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    return starts[edges], np.add.reduceat(revenue, edges), np.add.reduceat(orders, edges)
+
+
+def lttb_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Índices escolhidos pelo LTTB em pontos igualmente espaçados.
+
+    Mantém o primeiro e o último ponto; em cada faixa intermediária escolhe o
+    ponto que forma o maior triângulo com o ponto anterior escolhido e a média
+    da faixa seguinte. O laço é por faixa (max_points iterações), vetorizado
+    dentro de cada faixa.
+    """
+    n = len(values)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])[:max(max_points, 1)]
+    y = np.asarray(values, dtype=np.float64)
+    every = (n - 2) / (max_points - 2)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        next_lo, next_hi = hi, min(int((i + 2) * every) + 1, n)
+        next_x = (next_lo + next_hi - 1) / 2.0
+        next_y = y[next_lo:next_hi].mean()
+        x = np.arange(lo, hi)
+        area = np.abs((a - next_x) * (y[lo:hi] - y[a]) - (a - x) * (next_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(starts: np.ndarray, revenue: np.ndarray, orders: np.ndarray, max_points: int, method: str = "sum"):
+    """Reduz a série a no máximo `max_points` pontos"""
+    if len(starts) <= max_points:
+        return starts, revenue, orders
+    if method == "lttb":
+        keep = lttb_indices(revenue, max_points)
+        return starts[keep], revenue[keep], orders[keep]
+    step = -(-len(starts) // max_points)
+    edges = np.arange(0, len(starts), step)
+    return starts[edges], np.add.reduceat(revenue, edges), np.add.reduceat(orders, edges)
+
+
+def build_series(start_day: int, revenue: np.ndarray, orders: np.ndarray, granularity: str,
+                 max_points: Optional[int] = None, method: str = "sum") -> dict:
+    """Série pronta para a resposta: pontos {date, revenue, orders} e metadados"""
+    starts, revenue, orders = aggregate(start_day, revenue, orders, granularity)
+    periods = len(starts)
+    if max_points:
+        starts, revenue, orders = downsample(starts, revenue, orders, max_points, method)
+    return {
+        "granularity": granularity,
+        "periods": periods,
+        "downsampled": len(starts) < periods,
+        "points": [
+            {"date": day, "revenue": round(float(value), 2), "orders": int(count)}
+            for day, value, count in zip(day_to_iso(starts).tolist(), revenue, orders)
+        ],
+    }
@@ -0,0 +1,489 @@
+"""
+Persistência do store em memória: log de escrita antecipada (WAL) e snapshots
+
+Cada lote gravado vira um registro binário no fim do segmento atual do WAL
+(`wal-<primeira linha>.log`), com as linhas já convertidas e os textos novos
+dos dicionários:
+
+    cabeçalho (24 bytes)  tamanho do corpo, CRC32 do corpo, primeira linha, linhas
+    corpo                 colunas do lote (amount, quantity, day, product,
+                          category, customer) e um JSON com os textos novos de
+                          products, categories e customers
+
+O lote só é confirmado depois do fsync do seu registro. Lotes concorrentes
+dividem o fsync (group commit): quem chega primeiro sincroniza tudo que já foi
+escrito e os demais só esperam o resultado.
+
+Quando o segmento passa de `snapshot_bytes`, uma thread grava um snapshot
+colunar (`snapshot-<linhas>/`: um .npy por coluna e pelo índice de datas, os
+dicionários e os agregados) e o WAL continua num segmento novo; segmentos e
+snapshots anteriores são apagados. Na inicialização, `recover` mapeia as
+colunas do snapshot mais recente (sem copiar) e reaplica só os registros
+posteriores a ele. Um registro incompleto ou com CRC errado no fim do log
+(processo morto no meio da escrita) é descartado: o lote não tinha sido
+confirmado.
+
+Com o store compartilhado entre workers (SharedSalesStore), todos gravam no
+mesmo diretório, cada lote com o flock do store. O arquivo `wal.head` diz o
+segmento atual, onde termina o último registro e até que linha ele vai:
+antes de escrever, o worker segue o segmento (trocado por outro worker no
+snapshot) e descarta o fim deixado por um worker morto no meio da escrita ou
+antes de publicar o lote no store. O primeiro worker a abrir o store
+compartilhado vazio recupera nele o snapshot e o WAL (`recover_shared`); os
+seguintes só retomam o WAL. Snapshots são gravados por um worker de cada vez
+(flock em `snapshot.lock`).
+"""
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import pickle
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.api import metrics
+from app.api.rollups import SalesRollups
+from app.api.store import TOTALS_DICTIONARIES, SalesStore
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho de cada registro: tamanho e CRC32 do corpo, primeira linha e linhas do lote
+RECORD = struct.Struct("<IIqq")
+
+# wal.head: primeira linha do segmento atual, início e fim do último registro, linhas até o fim dele
+HEAD = struct.Struct("<qqqq")
+
+COLUMNS = tuple(SalesStore.COLUMNS.items())
+DICTIONARIES = tuple(TOTALS_DICTIONARIES.values())
+
+# Versão do formato dos snapshots (agregados de outra versão são recalculados a partir das colunas)
+SNAPSHOT_FORMAT = 2
+
+
+def _segment_name(first_row: int) -> str:
+    return f"wal-{first_row:020d}.log"
+
+
+def _snapshot_name(rows: int) -> str:
+    return f"snapshot-{rows:020d}"
+
+
+def _number(name: str) -> int:
+    return int(name.split("-", 1)[1].split(".", 1)[0])
+
+
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_record(store: SalesStore, start: int, stop: int, dictionary_starts: dict) -> bytes:
+    """Registro do WAL com as linhas [start, stop) e os textos dos dicionários a partir de `dictionary_starts`"""
+    body = [store.column(name)[start:stop].tobytes() for name, _ in COLUMNS]
+    texts = [getattr(store, name).values[dictionary_starts[name]:] for name in DICTIONARIES]
+    body.append(json.dumps(texts, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    payload = b"".join(body)
+    return RECORD.pack(len(payload), zlib.crc32(payload), start, stop - start) + payload
+
+
+def read_records(path: str):
+    """(posição, primeira linha, colunas, textos novos) de cada registro íntegro; para no primeiro corrompido"""
+    with open(path, "rb") as file:
+        offset = 0
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            length, crc, start, rows = RECORD.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            columns, position = {}, 0
+            for name, dtype in COLUMNS:
+                columns[name] = np.frombuffer(payload, dtype=dtype, count=rows, offset=position)
+                position += rows * np.dtype(dtype).itemsize
+            texts = json.loads(payload[position:].decode("utf-8"))
+            offset += RECORD.size + length
+            yield offset, start, columns, texts
+
+
+class Journal:
+    """
+    WAL e snapshots do store em memória em `directory`.
+
+    `recover()` devolve o store e os agregados recuperados; `attach(backend)`
+    liga o journal ao MemoryBackend, que chama `log` com o lock de escrita e
+    `commit` depois de soltá-lo.
+    """
+
+    def __init__(self, directory: str, sync: bool = True, snapshot_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync = sync
+        self.snapshot_bytes = snapshot_bytes
+        # Resultado da recuperação (para o log e o /health)
+        self.snapshot_rows = 0
+        self.replayed_rows = 0
+        self.recovery_seconds = 0.0
+
+        self._file = None
+        self._segment = None
+        self._segment_bytes = 0
+        self._head = os.open(os.path.join(directory, "wal.head"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._snapshot_file = open(os.path.join(directory, "snapshot.lock"), "a+b")
+        self._needs_snapshot = False
+        self._logged_rows = 0
+        self._logged_texts = dict.fromkeys(DICTIONARIES, 0)
+        self._lock = threading.Lock()
+        self._durable = threading.Condition(self._lock)
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._error: Optional[BaseException] = None
+        self._backend = None
+        self._snapshot_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    # Recuperação
+
+    def recover(self) -> Tuple[SalesStore, SalesRollups]:
+        """Snapshot mais recente mais os registros posteriores do WAL; abre o segmento para novos lotes"""
+        started = time.perf_counter()
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                # Snapshot interrompido: nunca chegou a ser publicado
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        store, rollups = self._load_snapshot()
+        self.snapshot_rows = len(store)
+        self._replay(store, rollups)
+        self.replayed_rows = len(store) - self.snapshot_rows
+        self._logged_rows = len(store)
+        self._logged_texts = {name: len(getattr(store, name)) for name in DICTIONARIES}
+        self._open_segment(len(store))
+        self.recovery_seconds = time.perf_counter() - started
+        return store, rollups
+
+    def recover_shared(self, store: SalesStore) -> Optional[SalesRollups]:
+        """
+        Store compartilhado, com o flock dele: vazio, recebe o snapshot e o WAL
+        e retorna os agregados recuperados; com vendas (de outro worker), só
+        retoma o WAL e retorna None (agregados calculados a partir do store).
+        """
+        if len(store):
+            if os.fstat(self._head).st_size < HEAD.size:
+                self._open_segment(len(store))
+                self._needs_snapshot = True
+            else:
+                self._needs_snapshot = self._follow(len(store)) != len(store)
+            # WAL que não termina no store (DATA_DIR novo ou de outro store): snapshot logo no attach
+            self._logged_rows = len(store)
+            return None
+        recovered, rollups = self.recover()
+        for name in DICTIONARIES:
+            getattr(store, name).extend(getattr(recovered, name).values)
+        store.append_encoded({name: recovered.column(name) for name, _ in COLUMNS})
+        return rollups
+
+    def _snapshots(self) -> List[str]:
+        names = [name for name in os.listdir(self.directory) if name.startswith("snapshot-") and not name.endswith(".tmp")]
+        return sorted(names, key=_number)
+
+    def _segments(self) -> List[str]:
+        names = [name for name in os.listdir(self.directory) if name.startswith("wal-") and name.endswith(".log")]
+        return sorted(names, key=_number)
+
+    def _load_snapshot(self) -> Tuple[SalesStore, SalesRollups]:
+        names = self._snapshots()
+        if not names:
+            return SalesStore(), SalesRollups()
+        path = os.path.join(self.directory, names[-1])
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        with open(os.path.join(path, "dictionaries.json"), encoding="utf-8") as file:
+            dictionaries = json.load(file)
+        # Colunas mapeadas do disco (somente leitura): nada é copiado para a memória aqui
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name, _ in COLUMNS}
+        index = {name: np.load(os.path.join(path, f"index_{name}.npy"), mmap_mode="r") for name in ("order", "day")}
+        store = SalesStore.restore(columns, index, dictionaries)
+        rollups = None
+        if meta.get("format") == SNAPSHOT_FORMAT:
+            try:
+                with open(os.path.join(path, "rollups.pickle"), "rb") as file:
+                    rollups = pickle.load(file)
+            except (OSError, pickle.UnpicklingError, AttributeError, EOFError) as e:
+                logger.warning(f"Agregados do snapshot ilegíveis ({e}); recalculando")
+        if rollups is None:
+            rollups = SalesRollups()
+            rollups.rebuild(store)
+        return store, rollups
+
+    def _replay(self, store: SalesStore, rollups: SalesRollups):
+        """Reaplica os registros posteriores ao snapshot, num único lote no store e nos agregados"""
+        first = len(store)
+        batches = []
+        expected = first
+        segments = self._segments()
+        for i, name in enumerate(segments):
+            path = os.path.join(self.directory, name)
+            good = 0
+            for good, start, columns, texts in read_records(path):
+                rows = len(columns["amount"])
+                if start + rows <= first:
+                    continue
+                if start != expected:
+                    break
+                for dictionary, values in zip(DICTIONARIES, texts):
+                    getattr(store, dictionary).extend(values)
+                batches.append(columns)
+                expected += rows
+            else:
+                if good < os.path.getsize(path):
+                    # Fim incompleto (lote não confirmado): descarta para continuar gravando depois dele
+                    logger.warning(f"WAL {name}: {os.path.getsize(path) - good} bytes finais descartados")
+                    with open(path, "r+b") as file:
+                        file.truncate(good)
+                continue
+            # Lacuna nas linhas: o que vem depois não pode ser aplicado
+            logger.error(f"WAL {name}: registro fora de sequência (esperada a linha {expected}); ignorando o restante")
+            for later in segments[i:]:
+                os.replace(os.path.join(self.directory, later), os.path.join(self.directory, later + ".corrupt"))
+            break
+        if batches:
+            store.append_encoded({name: np.concatenate([batch[name] for batch in batches]) for name, _ in COLUMNS})
+            rollups.apply(store, first, len(store))
+
+    # Gravação
+
+    def _open_segment(self, first_row: int):
+        path = os.path.join(self.directory, _segment_name(first_row))
+        self._file = open(path, "ab")
+        self._segment = first_row
+        self._segment_bytes = self._file.tell()
+        _fsync_directory(self.directory)
+        self._write_head(self._segment_bytes, self._segment_bytes, first_row)
+
+    def _close_segment(self):
+        """Sincroniza e fecha o segmento aberto (com o lock de escrita do backend)"""
+        with self._lock:
+            while self._syncing:
+                self._durable.wait()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._synced = self._written
+
+    def _write_head(self, record_start: int, end: int, rows: int):
+        os.pwrite(self._head, HEAD.pack(self._segment, record_start, end, rows), 0)
+
+    def _follow(self, published_rows: int) -> int:
+        """
+        Com o lock de escrita: passa ao segmento atual se outro processo o
+        trocou e descarta o último registro se ele vai além das linhas
+        publicadas no store (processo morto antes de publicar) ou um fim
+        incompleto (morto no meio da escrita). Retorna até que linha o WAL vai.
+        """
+        data = os.pread(self._head, HEAD.size, 0)
+        if len(data) < HEAD.size:
+            return self._logged_rows
+        segment, record_start, end, rows = HEAD.unpack(data)
+        if segment != self._segment:
+            if self._file is not None:
+                self._close_segment()
+            self._file = open(os.path.join(self.directory, _segment_name(segment)), "ab")
+            self._segment = segment
+        keep = end
+        if rows > published_rows:
+            keep, rows = record_start, published_rows
+        size = os.fstat(self._file.fileno()).st_size
+        if size > keep:
+            logger.warning(f"WAL {_segment_name(segment)}: {size - keep} bytes de um lote não publicado descartados")
+            self._file.truncate(keep)
+            self._write_head(keep, keep, rows)
+        self._segment_bytes = keep
+        return rows
+
+    def check(self):
+        """Recusa lotes novos depois de uma falha de escrita no WAL (não seriam recuperáveis)"""
+        if self._error is not None:
+            raise RuntimeError(f"WAL indisponível: {self._error}")
+
+    def begin(self, store: SalesStore):
+        """Início de um lote (com o lock de escrita, antes de gravar no store): o registro parte daqui"""
+        self.check()
+        self._follow(len(store))
+        self._logged_rows = len(store)
+        self._logged_texts = {name: len(getattr(store, name)) for name in DICTIONARIES}
+
+    def log(self, store: SalesStore) -> int:
+        """
+        Escreve as linhas ainda não registradas (chamado com o lock de escrita
+        do backend, logo após o lote entrar no store); retorna o número do
+        registro para `commit`.
+        """
+        self.check()
+        start, stop = self._logged_rows, len(store)
+        if stop <= start:
+            return self._written
+        record = encode_record(store, start, stop, self._logged_texts)
+        with self._lock:
+            try:
+                self._file.write(record)
+                self._file.flush()
+                self._write_head(self._segment_bytes, self._segment_bytes + len(record), stop)
+            except OSError as e:
+                self._error = e
+                raise
+            self._segment_bytes += len(record)
+            self._written += 1
+            number = self._written
+        self._logged_rows = stop
+        self._logged_texts = {name: len(getattr(store, name)) for name in DICTIONARIES}
+        metrics.WAL_RECORDS.inc()
+        if self._segment_bytes >= self.snapshot_bytes:
+            self._wake.set()
+        return number
+
+    def commit(self, number: int):
+        """Espera o registro `number` chegar ao disco; um fsync confirma todos os registros já escritos"""
+        if not self.sync:
+            return
+        with self._lock:
+            while self._synced < number:
+                if self._syncing:
+                    self._durable.wait()
+                    continue
+                self._syncing = True
+                target, file = self._written, self._file
+                self._lock.release()
+                try:
+                    os.fsync(file.fileno())
+                    metrics.WAL_SYNCS.inc()
+                except OSError as e:
+                    self._error = e
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                    self._durable.notify_all()
+                self.check()
+                self._synced = max(self._synced, target)
+
+    def _rotate(self, first_row: int):
+        """Fecha o segmento atual (já sincronizado) e abre o seguinte"""
+        self._follow(first_row)
+        self._close_segment()
+        self._open_segment(first_row)
+
+    # Snapshots
+
+    def attach(self, backend):
+        """Liga ao MemoryBackend (exclusive, snapshot) e inicia a thread de snapshots"""
+        self._backend = backend
+        if self._needs_snapshot:
+            self.snapshot()
+        self._thread = threading.Thread(target=self._run, name="wal-snapshots", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.snapshot()
+            except Exception:
+                logger.exception("Falha ao gravar snapshot do store")
+
+    @contextlib.contextmanager
+    def _snapshotting(self):
+        """Um snapshot por vez, entre threads e entre processos"""
+        with self._snapshot_lock:
+            fcntl.flock(self._snapshot_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._snapshot_file, fcntl.LOCK_UN)
+
+    def snapshot(self) -> Optional[str]:
+        """Grava um snapshot do estado atual e apaga o WAL e snapshots anteriores; None se nada mudou"""
+        with self._snapshotting():
+            with self._backend.exclusive():
+                store, rollups = self._backend.snapshot()
+                rows = len(store)
+                # Com o store compartilhado, outro worker pode já ter gravado este snapshot
+                if rows == max([self.snapshot_rows] + [_number(name) for name in self._snapshots()]):
+                    return None
+                sizes = {name: len(getattr(store, name)) for name in DICTIONARIES}
+                # Agregados serializados com o lock: os registradores do HyperLogLog mudam no lugar
+                rollups_bytes = pickle.dumps(rollups, protocol=pickle.HIGHEST_PROTOCOL)
+                self._rotate(rows)
+            started = time.perf_counter()
+            path = self._write_snapshot(store, rows, sizes, rollups_bytes)
+            self.snapshot_rows = rows
+            for name in self._snapshots():
+                if _number(name) < rows:
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            for name in self._segments():
+                if _number(name) < rows:
+                    os.remove(os.path.join(self.directory, name))
+            logger.info(f"Snapshot de {rows} vendas gravado em {time.perf_counter() - started:.2f}s")
+            return path
+
+    def _write_snapshot(self, store: SalesStore, rows: int, sizes: dict, rollups_bytes: bytes) -> str:
+        final = os.path.join(self.directory, _snapshot_name(rows))
+        temporary = final + ".tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+
+        def write(name, save):
+            with open(os.path.join(temporary, name), "wb") as file:
+                save(file)
+                file.flush()
+                os.fsync(file.fileno())
+
+        # O snapshot do store só lê linhas já publicadas: os lotes seguintes gravam depois delas
+        for name, _ in COLUMNS:
+            write(f"{name}.npy", lambda file: np.save(file, store.column(name)))
+        for name, values in zip(("order", "day"), store.date_index()):
+            write(f"index_{name}.npy", lambda file: np.save(file, values))
+        texts = {name: getattr(store, name).values[:sizes[name]] for name in DICTIONARIES}
+        write("dictionaries.json", lambda file: file.write(json.dumps(texts, ensure_ascii=False).encode("utf-8")))
+        write("rollups.pickle", lambda file: file.write(rollups_bytes))
+        meta = {"format": SNAPSHOT_FORMAT, "rows": rows, "created_at": time.time()}
+        write("meta.json", lambda file: file.write(json.dumps(meta).encode("utf-8")))
+        _fsync_directory(temporary)
+        os.replace(temporary, final)
+        _fsync_directory(self.directory)
+        return final
+
+    def close(self, snapshot: bool = True):
+        """Para a thread; com `snapshot`, grava o estado final (a próxima inicialização não reaplica WAL)"""
+        if self._closed:
+            return
+        if snapshot and self._backend is not None and self._error is None:
+            self.snapshot()
+        self._closed = True
+        self._wake.set()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                if self.sync:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        os.close(self._head)
+        self._snapshot_file.close()
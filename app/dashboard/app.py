@@ -8,7 +8,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 import requests
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from live import SALES_TABLE_ROWS, get_live_data
 
 # Configuração da página
 st.set_page_config(
@@ -43,54 +48,70 @@ st.sidebar.markdown("---")
 
 # Seleção de período
 st.sidebar.subheader("📅 Período")
-period = st.sidebar.selectbox(
-    "Selecionar período",
-    ["Últimos 7 dias", "Últimos 15 dias", "Últimos 30 dias"]
-)
-
-days_map = {
-    "Últimos 7 dias": 7,
-    "Últimos 15 dias": 15,
-    "Últimos 30 dias": 30
+# Períodos: dias (None = todo o período) e granularidade da série agregada na API
+periods = {
+    "Últimos 7 dias": (7, "day"),
+    "Últimos 15 dias": (15, "day"),
+    "Últimos 30 dias": (30, "day"),
+    "Últimos 90 dias": (90, "day"),
+    "Último ano": (365, "week"),
+    "Todo o período": (None, "month")
 }
-days = days_map[period]
+period = st.sidebar.selectbox("Selecionar período", list(periods))
+days, granularity = periods[period]
+
+# Pontos máximos por gráfico (a API reduz séries maiores)
+MAX_CHART_POINTS = 400
+
+# Visões compartilhadas entre sessões, corrigidas pelos eventos da API (/api/v1/events)
+live = get_live_data(API_URL)
+live_updates = st.sidebar.checkbox("⚡ Atualização ao vivo", value=True)
 
 # Botão de atualizar
 if st.sidebar.button("🔄 Atualizar Dados"):
-    st.cache_data.clear()
+    live.invalidate()
     st.rerun()
 
-# Funções para carregar dados (com cache)
-@st.cache_data(ttl=60)
-def load_kpis():
-    """Carrega KPIs da API"""
+# Sessão HTTP compartilhada entre reruns (conexões reaproveitadas)
+@st.cache_resource
+def get_session():
+    """Sessão com pool de conexões e novas tentativas com backoff"""
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_json(session, url, params):
+    """GET que retorna (dados, erro) sem chamar o Streamlit (roda em threads)"""
     try:
-        response = requests.get(f"{API_URL}/api/v1/kpis", timeout=5)
+        response = session.get(url, params=params, timeout=10)
         if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"Erro na API: {response.status_code}")
-            return None
+            return response.json(), None
+        return None, f"Erro na API: {response.status_code}"
     except Exception as e:
-        st.error(f"Erro ao conectar: {e}")
-        return None
+        return None, f"Erro ao conectar: {e}"
 
-@st.cache_data(ttl=60)
-def load_daily_sales(days):
-    """Carrega vendas diárias"""
-    try:
-        response = requests.get(
-            f"{API_URL}/api/v1/sales/daily",
-            params={"days": days},
-            timeout=5
-        )
-        if response.status_code == 200:
-            data = response.json()
-            return pd.DataFrame(data)
-        else:
-            return pd.DataFrame()
-    except:
-        return pd.DataFrame()
+# Carrega os dados de um período (chamada só quando a visão compartilhada precisa recarregar)
+def load_dashboard(api_url, days, granularity):
+    """Carrega o pacote do dashboard e a primeira página de vendas em paralelo"""
+    params = {"granularity": granularity, "max_points": MAX_CHART_POINTS}
+    if days is None:
+        params["all_time"] = "true"
+    else:
+        params["days"] = days
+    session = get_session()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        bundle = executor.submit(fetch_json, session, f"{api_url}/api/v1/dashboard", params)
+        sales = executor.submit(fetch_json, session, f"{api_url}/api/v1/sales", {"limit": SALES_TABLE_ROWS})
+        return bundle.result(), sales.result()
+
+# Versão antes da leitura: um delta que chegue depois provoca nova execução da página
+live_version = live.version
+(dashboard, dashboard_error), (sales_rows, sales_error) = live.get(
+    (days, granularity), lambda: load_dashboard(API_URL, days, granularity), all_time=days is None
+)
 
 # Layout principal com abas
 tab1, tab2, tab3 = st.tabs(["📈 Visão Geral", "📊 Análise Detalhada", "ℹ️ Sobre"])
@@ -98,30 +119,44 @@ tab1, tab2, tab3 = st.tabs(["📈 Visão Geral", "📊 Análise Detalhada", "ℹ
 with tab1:
     # KPIs principais
     st.subheader("📌 Indicadores de Performance")
-    kpis = load_kpis()
+    kpis = dashboard["kpis"] if dashboard else None
 
     if kpis:
+        # Variações: janela do período escolhido contra a janela anterior (calculadas na API)
+        def delta(value):
+            return None if value is None else f"{value:+.1f}%"
+
         col1, col2, col3, col4 = st.columns(4)
 
         with col1:
-            st.metric("Receita Total", f"R$ {kpis['total_revenue']:,.2f}", f"{kpis['revenue_growth']}%")
+            st.metric("Receita Total", f"R$ {kpis['total_revenue']:,.2f}", delta(kpis['revenue_growth']))
 
         with col2:
-            st.metric("Total de Pedidos", f"{kpis['total_orders']:,}", "8.3%")
+            st.metric("Total de Pedidos", f"{kpis['total_orders']:,}", delta(kpis['orders_growth']))
 
         with col3:
-            st.metric("Ticket Médio", f"R$ {kpis['average_ticket']:,.2f}", "3.2%")
+            st.metric("Ticket Médio", f"R$ {kpis['average_ticket']:,.2f}", delta(kpis['average_ticket_growth']))
 
         with col4:
-            st.metric("Clientes Ativos", f"{kpis['active_customers']:,}", "15.7%")
+            st.metric(f"Clientes Ativos ({kpis['period_days']} dias)", f"{kpis['active_customers']:,}", delta(kpis['active_customers_growth']))
+
+        percentis = kpis.get("ticket_percentiles") or {}
+        if percentis.get("p50") is not None:
+            st.caption(
+                f"Valor dos pedidos: mediana R$ {percentis['p50']:,.2f} · "
+                f"p90 R$ {percentis['p90']:,.2f} · p99 R$ {percentis['p99']:,.2f}"
+            )
     else:
+        if dashboard_error:
+            st.error(dashboard_error)
         st.warning("Não foi possível carregar os KPIs. Verifique a conexão com a API.")
 
     st.markdown("---")
 
-    # Gráfico de vendas diárias
-    st.subheader("📅 Vendas Diárias")
-    daily_sales = load_daily_sales(days)
+    # Gráfico de vendas (série já agregada e reduzida na API)
+    titles = {"day": "Vendas Diárias", "week": "Vendas Semanais", "month": "Vendas Mensais"}
+    st.subheader(f"📅 {titles[granularity]}")
+    daily_sales = pd.DataFrame(dashboard["series"]["points"]) if dashboard else pd.DataFrame()
 
     if not daily_sales.empty:
         fig = go.Figure()
@@ -129,7 +164,7 @@ with tab1:
         fig.add_trace(go.Scatter(x=daily_sales['date'], y=daily_sales['revenue'], name='Receita', marker_color='red', line=dict(width=3), yaxis='y2'))
 
         fig.update_layout(
-            title=f'Vendas Diárias - {period}',
+            title=f'{titles[granularity]} - {period}',
             xaxis_title='Data',
             yaxis=dict(title='Número de Pedidos', color='blue'),
             yaxis2=dict(title='Receita (R$)', color='red', overlaying='y', side='right'),
@@ -144,31 +179,41 @@ with tab2:
     st.subheader("📊 Análise Detalhada")
     st.write("### Dados de Vendas")
 
-    try:
-        response = requests.get(f"{API_URL}/api/v1/sales", timeout=5)
-        if response.status_code == 200:
-            sales_data = pd.DataFrame(response.json())
-            st.dataframe(
-                sales_data,
-                column_config={
-                    "date": "Data",
-                    "product": "Produto",
-                    "category": "Categoria",
-                    "amount": st.column_config.NumberColumn("Valor Unitário", format="R$ %.2f"),
-                    "quantity": "Quantidade"
-                },
-                hide_index=True,
+    if sales_rows is not None:
+        sales_data = pd.DataFrame(sales_rows)
+        st.caption(f"Primeiras {len(sales_data):,} vendas")
+        st.dataframe(
+            sales_data,
+            column_config={
+                "date": "Data",
+                "product": "Produto",
+                "category": "Categoria",
+                "amount": st.column_config.NumberColumn("Valor Unitário", format="R$ %.2f"),
+                "quantity": "Quantidade"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.warning(f"Não foi possível carregar os dados detalhados ({sales_error})")
+
+    if dashboard:
+        # Estatísticas calculadas na API sobre todas as vendas
+        detail = dashboard["detail"]
+        st.write("### Estatísticas")
+        col1, col2, col3 = st.columns(3)
+        with col1: st.metric("Média de Valor", f"R$ {detail['average_amount']:.2f}")
+        with col2: st.metric("Total de Itens", f"{detail['total_items']:,}")
+        with col3: st.metric("Produtos Únicos", f"{detail['unique_products']:,}")
+
+        categories = pd.DataFrame(dashboard["by_category"])
+        if not categories.empty:
+            st.write("### Receita por Categoria")
+            st.plotly_chart(
+                px.bar(categories, x="category", y="revenue", labels={"category": "Categoria", "revenue": "Receita (R$)"}),
                 use_container_width=True
             )
 
-            st.write("### Estatísticas")
-            col1, col2, col3 = st.columns(3)
-            with col1: st.metric("Média de Valor", f"R$ {sales_data['amount'].mean():.2f}")
-            with col2: st.metric("Total de Itens", sales_data['quantity'].sum())
-            with col3: st.metric("Produtos Únicos", sales_data['product'].nunique())
-    except:
-        st.warning("Não foi possível carregar os dados detalhados")
-
 with tab3:
     st.subheader("ℹ️ Sobre o Projeto")
     st.markdown("""
@@ -197,4 +242,20 @@ st.markdown(
     </div>
     """,
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+# Atualização ao vivo: executa a página de novo quando um delta é aplicado às visões
+if live_updates:
+    if hasattr(st, "fragment"):
+        @st.fragment(run_every=1)
+        def watch_updates():
+            if live.version != live_version:
+                st.rerun()
+        watch_updates()
+    else:
+        # Streamlit sem fragmentos: a execução espera o próximo delta; cada
+        # atualização do status permite que cliques interrompam a espera
+        status = st.sidebar.empty()
+        while live.wait(live_version, timeout=1.0) == live_version:
+            status.caption("🟢 Ao vivo" if live.connected else "⚪ Sem conexão de eventos (atualiza a cada minuto)")
+        st.rerun()
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Dados do dashboard compartilhados entre sessões e corrigidos pelos eventos da API
+
+Uma thread por URL da API assina GET /api/v1/events (Server-Sent Events) e
+aplica cada delta às visões já carregadas: soma o acréscimo de cada dia ao
+ponto da série que o contém, troca os totais das categorias alteradas, os
+KPIs da janela da visão e as estatísticas. Visões que o delta não cobre (um
+dia fora da série de todo o período, uma tabela de vendas ainda incompleta)
+só são marcadas para recarregar, e cada visão é recarregada por uma única
+sessão: as demais esperam o resultado em vez de repetir as consultas.
+
+Sem conexão com os eventos, as visões expiram em TTL_SECONDS, como antes.
+"""
+
+import bisect
+import copy
+import json
+import threading
+import time
+
+import requests
+import streamlit as st
+
+# Validade das visões sem a conexão de eventos
+TTL_SECONDS = 60
+
+# Recarrega mesmo com eventos (virada do dia nas janelas "últimos N dias")
+MAX_AGE_SECONDS = 600
+
+RECONNECT_SECONDS = 2
+
+# Linhas da tabela de vendas da análise detalhada (primeira página de /api/v1/sales)
+SALES_TABLE_ROWS = 1000
+
+
+def parse_events(lines):
+    """(evento, id, dados) de um fluxo SSE já dividido em linhas"""
+    event, event_id, data = "message", None, []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, event_id, "\n".join(data)
+            event, data = "message", []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+        elif field == "id":
+            event_id = value
+
+
+def patch_dashboard(bundle, delta, all_time):
+    """Aplica um delta ao pacote de /api/v1/dashboard; False se a visão precisa ser recarregada"""
+    kpis = delta["kpis"].get(str(bundle["kpis"]["period_days"]))
+    if kpis is None:
+        return False
+    series = bundle["series"]
+    points = series["points"]
+    starts = [point["date"] for point in points]
+    for day in delta["days"]:
+        if day["date"] < series["start"] or day["date"] > series["end"]:
+            # Todo o período termina no último dia com vendas: dias novos ampliam a série
+            if all_time:
+                return False
+            continue
+        index = bisect.bisect_right(starts, day["date"]) - 1
+        if index < 0:
+            return False
+        points[index]["revenue"] = round(points[index]["revenue"] + day["revenue"], 2)
+        points[index]["orders"] += day["orders"]
+
+    bundle["kpis"] = kpis
+    bundle["detail"] = delta["detail"]
+    changed = {row["category"]: row for row in delta["categories"]}
+    categories = [changed.pop(row["category"], row) for row in bundle["by_category"]]
+    bundle["by_category"] = categories + list(changed.values())
+    return True
+
+
+class View:
+    """Pacote do dashboard e primeira página de vendas de um período"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None
+        self.loaded_at = 0.0
+        self.stale = False
+        self.all_time = False
+
+
+class LiveData:
+    """Visões do dashboard de uma URL da API, atualizadas pelos eventos"""
+
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.connected = False
+        self.version = 0
+        self._views = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._listen, name="dashboard-events", daemon=True)
+        self._thread.start()
+
+    def get(self, key, load, all_time=False):
+        """Dados da visão `key`, carregados com `load()` se ausentes, vencidos ou marcados"""
+        with self._lock:
+            view = self._views.setdefault(key, View())
+            view.all_time = all_time
+        with view.lock:
+            age = time.monotonic() - view.loaded_at
+            expired = age > (MAX_AGE_SECONDS if self.connected else TTL_SECONDS)
+            if view.data is None or view.stale or expired:
+                version = self.version
+                data = load()
+                with self._lock:
+                    view.data, view.loaded_at = data, time.monotonic()
+                    # Evento recebido durante a carga: não dá para saber se ela já o incluía
+                    view.stale = self.version != version
+            with self._lock:
+                return copy.deepcopy(view.data)
+
+    def invalidate(self):
+        """Marca todas as visões para recarregar"""
+        with self._lock:
+            for view in self._views.values():
+                view.stale = True
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version, timeout):
+        """Espera a versão mudar (delta aplicado); retorna a versão atual"""
+        with self._lock:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _apply(self, delta):
+        with self._lock:
+            for view in self._views.values():
+                if view.data is None or view.stale:
+                    continue
+                (bundle, bundle_error), (rows, rows_error) = view.data
+                if bundle is None or rows is None or len(rows) < SALES_TABLE_ROWS:
+                    # Erro na última carga ou tabela com espaço para as vendas novas
+                    view.stale = True
+                elif not patch_dashboard(bundle, delta, view.all_time):
+                    view.stale = True
+            self.version += 1
+            self._changed.notify_all()
+
+    def _listen(self):
+        last_event_id = None
+        while True:
+            headers = {"Accept": "text/event-stream"}
+            if last_event_id:
+                headers["Last-Event-ID"] = last_event_id
+            try:
+                # Leitura com folga sobre o intervalo dos comentários de keep-alive da API
+                with requests.get(f"{self.api_url}/api/v1/events", headers=headers, stream=True, timeout=(5, 60)) as response:
+                    response.raise_for_status()
+                    self.connected = True
+                    for event, event_id, data in parse_events(response.iter_lines(decode_unicode=True)):
+                        last_event_id = event_id or last_event_id
+                        if event == "sales":
+                            self._apply(json.loads(data))
+                        elif event == "reset":
+                            self.invalidate()
+            except (requests.RequestException, ValueError):
+                pass
+            self.connected = False
+            time.sleep(RECONNECT_SECONDS)
+
+
+@st.cache_resource
+def get_live_data(api_url):
+    """Uma instância (e uma conexão de eventos) por URL da API, compartilhada entre sessões"""
+    return LiveData(api_url)
@@ -2,8 +2,13 @@ import streamlit as st
 import pandas as pd
 import requests
 import os
+import json
+import time
 from datetime import datetime
-import io
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from live import get_live_data
 
 st.set_page_config(page_title="Importar Dados", page_icon="📦", layout="wide")
 
@@ -13,74 +18,147 @@ st.markdown("---")
 # URL da API (mesma lógica do app.py)
 API_URL = os.getenv("API_URL", "http://api:8000")
 
+# Intervalo entre consultas ao estado da importação (segundos)
+POLL_SECONDS = 0.5
+
+# Content-Type enviado por extensão do arquivo
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "ndjson": "application/x-ndjson",
+    "jsonl": "application/x-ndjson",
+}
+
+
+@st.cache_resource
+def get_session():
+    """Sessão HTTP compartilhada, com pool de conexões e novas tentativas com backoff"""
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def extensao(arquivo):
+    return arquivo.name.rsplit(".", 1)[-1].lower()
+
+
+def ler_previa(arquivo, linhas=10):
+    """Primeiras linhas do arquivo, sem ler o resto (o arquivo inteiro é lido pela API)"""
+    tipo = extensao(arquivo)
+    if tipo == "csv":
+        previa = pd.read_csv(arquivo, nrows=linhas)
+    elif tipo == "xlsx":
+        previa = pd.read_excel(arquivo, nrows=linhas)
+    elif tipo == "parquet":
+        import pyarrow.parquet as pq
+        previa = next(pq.ParquetFile(arquivo).iter_batches(batch_size=linhas)).to_pandas()
+    else:
+        previa = pd.read_json(arquivo, lines=True, nrows=linhas)
+    arquivo.seek(0)
+    return previa
+
+
+def formatar_segundos(segundos):
+    if segundos is None:
+        return "calculando..."
+    minutos, segundos = divmod(int(segundos), 60)
+    return f"{minutos}min {segundos:02d}s" if minutos else f"{segundos}s"
+
+
+def importar_arquivo(arquivo, mapeamento, progresso):
+    """Envia o arquivo para a importação em segundo plano e acompanha o estado até terminar"""
+    params = {"mapping": json.dumps(mapeamento)} if mapeamento else None
+    # Sem novas tentativas: o corpo é o próprio arquivo, lido uma única vez
+    response = requests.post(
+        f"{API_URL}/api/v1/imports",
+        data=arquivo,
+        params=params,
+        headers={"Content-Type": CONTENT_TYPES[extensao(arquivo)]},
+        timeout=(5, 600),
+    )
+    response.raise_for_status()
+    job = response.json()
+    session = get_session()
+    while job["status"] not in ("done", "failed"):
+        time.sleep(POLL_SECONDS)
+        response = session.get(f"{API_URL}/api/v1/imports/{job['id']}", timeout=10)
+        response.raise_for_status()
+        job = response.json()
+        vazao = f"{job['rows_per_second']:,} linhas/s" if job["rows_per_second"] else "iniciando"
+        progresso.progress(
+            min(job["progress"], 1.0),
+            text=f"{job['rows']:,} linhas processadas · {vazao} · restante: {formatar_segundos(job['eta_seconds'])}",
+        )
+    return job
+
+
 tab1, tab2, tab3, tab4 = st.tabs(["📁 Upload Arquivo", "✍️ Inserir Manual", "🔌 Integração", "🌐 Webhook"])
 
 with tab1:
-    st.subheader("Upload de Arquivo CSV ou Excel")
+    st.subheader("Upload de Arquivo CSV, Excel, Parquet ou NDJSON")
     arquivo = st.file_uploader(
         "Escolha um arquivo",
-        type=["csv", "xlsx", "xls"],
-        help="Formatos aceitos: CSV, Excel. O arquivo deve conter as colunas: date, product, category, quantity, amount, customer (opcional)"
+        type=list(CONTENT_TYPES),
+        help="Formatos aceitos: CSV, Excel (.xlsx), Parquet, NDJSON. O arquivo deve conter as colunas: date, product, category, quantity, amount, customer (opcional)"
     )
     
     if arquivo is not None:
         try:
-            # Ler arquivo
-            if arquivo.name.endswith(".csv"):
-                df = pd.read_csv(arquivo)
-            else:
-                df = pd.read_excel(arquivo)
+            # Só a prévia é lida aqui; a API lê e valida o arquivo em segundo plano
+            df = ler_previa(arquivo)
             
             st.write("### Prévia dos Dados")
-            st.dataframe(df.head(10))
+            st.dataframe(df)
             
-            # Verificar colunas obrigatórias
-            colunas_obrigatorias = ['date', 'product', 'category', 'quantity', 'amount']
-            colunas_faltando = [col for col in colunas_obrigatorias if col not in df.columns]
+            # Mapeamento de colunas (opcional)
+            with st.expander("Mapear colunas (caso os nomes sejam diferentes)"):
+                col_date = st.selectbox("Coluna de Data", df.columns, index=list(df.columns).index('date') if 'date' in df.columns else 0)
+                col_product = st.selectbox("Coluna de Produto", df.columns, index=list(df.columns).index('product') if 'product' in df.columns else 0)
+                col_category = st.selectbox("Coluna de Categoria", df.columns, index=list(df.columns).index('category') if 'category' in df.columns else 0)
+                col_quantity = st.selectbox("Coluna de Quantidade", df.columns, index=list(df.columns).index('quantity') if 'quantity' in df.columns else 0)
+                col_amount = st.selectbox("Coluna de Valor Unitário", df.columns, index=list(df.columns).index('amount') if 'amount' in df.columns else 0)
+                colunas = ['Nenhum'] + list(df.columns)
+                col_customer = st.selectbox("Coluna de Cliente (opcional)", colunas, index=colunas.index('customer') if 'customer' in colunas else 0)
             
-            if colunas_faltando:
-                st.error(f"Colunas obrigatórias ausentes: {colunas_faltando}")
-            else:
-                # Mapeamento de colunas (opcional)
-                with st.expander("Mapear colunas (caso os nomes sejam diferentes)"):
-                    col_date = st.selectbox("Coluna de Data", df.columns, index=list(df.columns).index('date') if 'date' in df.columns else 0)
-                    col_product = st.selectbox("Coluna de Produto", df.columns, index=list(df.columns).index('product') if 'product' in df.columns else 0)
-                    col_category = st.selectbox("Coluna de Categoria", df.columns, index=list(df.columns).index('category') if 'category' in df.columns else 0)
-                    col_quantity = st.selectbox("Coluna de Quantidade", df.columns, index=list(df.columns).index('quantity') if 'quantity' in df.columns else 0)
-                    col_amount = st.selectbox("Coluna de Valor Unitário", df.columns, index=list(df.columns).index('amount') if 'amount' in df.columns else 0)
-                    col_customer = st.selectbox("Coluna de Cliente (opcional)", ['Nenhum'] + list(df.columns))
-                
-                if st.button("📥 Importar Dados", type="primary"):
-                    registros = []
-                    for _, row in df.iterrows():
-                        registro = {
-                            "date": str(row[col_date]),
-                            "product": str(row[col_product]),
-                            "category": str(row[col_category]),
-                            "quantity": int(row[col_quantity]),
-                            "amount": float(row[col_amount])
-                        }
-                        if col_customer != 'Nenhum':
-                            registro["customer"] = str(row[col_customer])
-                        registros.append(registro)
-                    
-                    with st.spinner("Importando..."):
-                        try:
-                            response = requests.post(
-                                f"{API_URL}/api/v1/sales/batch",
-                                json=registros,
-                                timeout=30
-                            )
-                            if response.status_code == 200:
-                                st.success(f"✅ {len(registros)} registros importados!")
-                                st.balloons()
-                                # Limpar cache do dashboard e recarregar para mostrar dados atualizados
-                                st.cache_data.clear()
-                                st.rerun()
-                            else:
-                                st.error(f"Erro na API: {response.text}")
-                        except Exception as e:
-                            st.error(f"Erro de conexão: {e}")
+            mapeamento = {
+                "date": col_date, "product": col_product, "category": col_category,
+                "quantity": col_quantity, "amount": col_amount,
+            }
+            if col_customer != 'Nenhum':
+                mapeamento["customer"] = col_customer
+            # Só as colunas com nome diferente vão para a API
+            mapeamento = {destino: str(origem) for destino, origem in mapeamento.items() if destino != origem}
+            
+            if st.button("📥 Importar Dados", type="primary"):
+                progresso = st.progress(0.0, text="Enviando arquivo...")
+                try:
+                    job = importar_arquivo(arquivo, mapeamento, progresso)
+                    if job["status"] == "failed":
+                        st.error(f"Importação interrompida: {job['error']}")
+                        if job["accepted"]:
+                            st.info(f"{job['accepted']:,} registros foram gravados antes da falha.")
+                    else:
+                        st.success(
+                            f"✅ {job['accepted']:,} registros importados em {formatar_segundos(job['seconds'])}!"
+                        )
+                        if job["rejected"]:
+                            st.warning(f"{job['rejected']:,} registros rejeitados. Exemplos:")
+                            st.dataframe(pd.DataFrame(job["errors"]))
+                        else:
+                            st.balloons()
+                    # O dashboard recebe as vendas novas pelos eventos da API;
+                    # sem a conexão de eventos, as visões são recarregadas
+                    live = get_live_data(API_URL)
+                    if not live.connected:
+                        live.invalidate()
+                except requests.HTTPError as e:
+                    st.error(f"Erro na API: {e.response.text}")
+                except Exception as e:
+                    st.error(f"Erro de conexão: {e}")
         except Exception as e:
             st.error(f"Erro ao ler arquivo: {e}")
 
@@ -116,8 +194,9 @@ with tab2:
                     response = requests.post(f"{API_URL}/api/v1/sales", json=registro, timeout=5)
                     if response.status_code == 200:
                         st.success("✅ Venda adicionada!")
-                        # Limpar cache e recarregar
-                        st.cache_data.clear()
+                        live = get_live_data(API_URL)
+                        if not live.connected:
+                            live.invalidate()
                         st.rerun()
                     else:
                         st.error(f"Erro: {response.text}")
@@ -0,0 +1,398 @@
+"""
+Benchmark de carga da API com verificação de regressão
+
+Para cada tamanho de dataset (vendas sintéticas) e modo, sobe a API com os
+dados, dispara requisições concorrentes em cada rota e mede latência
+(p50/p95/p99), vazão e pico de memória (RSS):
+
+    asgi     app FastAPI no mesmo processo, via httpx.ASGITransport
+    uvicorn  servidor uvicorn em outro processo, via HTTP local
+
+Cada combinação roda em um processo novo, para que o pico de memória seja só
+daquele tamanho. Com --workers N (N > 1), o modo uvicorn sobe N workers sobre
+um store compartilhado (SHARED_STORE_DIR em um diretório temporário) e
+registra também a memória proporcional (PSS) somada de todos os processos. O resultado vai para JSON; com --compare, cada rota é
+comparada com uma execução anterior e o script sai com código 1 se p95 ou
+vazão piorarem além de --threshold (para barrar merges no CI).
+
+Uso:
+    python scripts/bench_api.py --rows 1000 100000 1000000 10000000 --output bench_api.json
+    python scripts/bench_api.py --rows 100000 --modes asgi --output new.json --compare bench_api.json
+    python scripts/bench_api.py --rows 1000000 --modes uvicorn --workers 4 --output workers.json
+    python scripts/bench_api.py --compare-only bench_api.json new.json --threshold 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.store import day_to_iso  # noqa: E402
+from bench_store import synthetic_columns  # noqa: E402
+
+# Linhas geradas por vez ao popular a API
+SEED_CHUNK_ROWS = 1_000_000
+
+# Vendas por requisição em /api/v1/sales/batch
+BATCH_ROWS = 100
+
+# Intervalo de /sales/daily: últimos 30 dias do período gerado por synthetic_columns (19700 + 0..729)
+DAILY_START, DAILY_END = day_to_iso([19_700 + 700, 19_700 + 729]).tolist()
+
+
+def batch_payload(rows=BATCH_ROWS):
+    columns = synthetic_columns(rows, seed=7)
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+
+
+def endpoint_specs(rows):
+    """Rotas medidas: nome -> função(i) que devolve (método, caminho, params, corpo)"""
+    payload = batch_payload()
+    return {
+        "kpis": lambda i: ("GET", "/api/v1/kpis", None, None),
+        "sales": lambda i: ("GET", "/api/v1/sales", {"cursor": (i * 7919) % max(rows, 1), "limit": 1000}, None),
+        "sales_daily": lambda i: ("GET", "/api/v1/sales/daily", {"start": DAILY_START, "end": DAILY_END}, None),
+        "sales_by_category": lambda i: ("GET", "/api/v1/sales/by-category", None, None),
+        # Por último: grava vendas e invalida o cache das demais
+        "sales_batch": lambda i: ("POST", "/api/v1/sales/batch", None, payload),
+    }
+
+
+def peak_rss_mb(pid=None):
+    """Pico de memória residente (MB) deste processo ou de `pid` (Linux: VmHWM)"""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def tree_pss_mb(pid):
+    """Memória proporcional (MB) de `pid` e dos seus filhos: páginas compartilhadas contam uma vez no total"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as smaps:
+                total += sum(int(line.split()[1]) for line in smaps if line.startswith("Pss:"))
+            with open(f"/proc/{current}/task/{current}/children") as children:
+                pending.extend(int(child) for child in children.read().split())
+        except OSError:
+            if current == pid:
+                return None
+    return total / 1024
+
+
+def seed(rows):
+    """Importa a API e grava `rows` vendas sintéticas; retorna o módulo"""
+    from app.api import main
+
+    # Logs INFO (da API e do httpx) a cada requisição distorceriam a medição
+    logging.getLogger().setLevel(logging.WARNING)
+    for start in range(0, rows, SEED_CHUNK_ROWS):
+        main.ingest_columns(synthetic_columns(min(SEED_CHUNK_ROWS, rows - start), seed=start))
+    return main
+
+
+# Geração de carga
+
+async def drive(client, spec, requests, concurrency, warmup):
+    """Executa `requests` chamadas com `concurrency` em paralelo; latências em ms"""
+    for i in range(warmup):
+        method, path, params, body = spec(i)
+        await client.request(method, path, params=params, json=body)
+
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, path, params, body = spec(warmup + i)
+            started = time.perf_counter()
+            response = await client.request(method, path, params=params, json=body)
+            await response.aread()
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return np.array(latencies), errors, elapsed
+
+
+def summarize(mode, rows, endpoint, latencies, errors, elapsed, concurrency, rss):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "mode": mode,
+        "rows": rows,
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "peak_rss_mb": None if rss is None else round(rss, 1),
+    }
+
+
+async def run_endpoints(client, mode, rows, args, rss):
+    results = []
+    for name, spec in endpoint_specs(rows).items():
+        if args.endpoints and name not in args.endpoints:
+            continue
+        latencies, errors, elapsed = await drive(client, spec, args.requests, args.concurrency, args.warmup)
+        result = summarize(mode, rows, name, latencies, errors, elapsed, args.concurrency, rss())
+        print(
+            f"  {mode:8s} {rows:>10,} {name:18s} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:9.1f} req/s  erros {errors}",
+            file=sys.stderr, flush=True,
+        )
+        results.append(result)
+    return results
+
+
+def run_asgi(rows, args):
+    import httpx
+
+    started = time.perf_counter()
+    main = seed(rows)
+    seconds = time.perf_counter() - started
+
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            return await run_endpoints(client, "asgi", rows, args, peak_rss_mb)
+
+    results = asyncio.run(go())
+    for result in results:
+        result["seed_seconds"] = round(seconds, 2)
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_uvicorn(rows, args):
+    import httpx
+
+    port = free_port()
+    mode = "uvicorn" if args.workers <= 1 else f"uvicorn-{args.workers}w"
+    env = dict(os.environ)
+    shared = None
+    if args.workers > 1:
+        # Workers compartilham as colunas mapeadas; o processo do servidor grava as vendas antes de subi-los
+        tmpfs = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        shared = env["SHARED_STORE_DIR"] = tempfile.mkdtemp(prefix="bench_api_shared_", dir=tmpfs)
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--rows", str(rows),
+         "--workers", str(args.workers)],
+        stdout=subprocess.DEVNULL, env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("servidor uvicorn encerrou durante a inicialização")
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        seconds = time.perf_counter() - started
+
+        async def go():
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+                return await run_endpoints(client, mode, rows, args, lambda: peak_rss_mb(server.pid))
+
+        results = asyncio.run(go())
+        pss = tree_pss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        if shared:
+            shutil.rmtree(shared, ignore_errors=True)
+    for result in results:
+        result["seed_seconds"] = round(seconds, 2)
+        result["workers"] = args.workers
+        result["pss_mb"] = None if pss is None else round(pss, 1)
+    return results
+
+
+def serve(rows, port, workers=1):
+    import uvicorn
+
+    main = seed(rows)
+    if workers > 1:
+        # Cada worker importa a API de novo e mapeia o store já populado
+        uvicorn.run("app.api.main:app", host="127.0.0.1", port=port, workers=workers, log_level="warning")
+    else:
+        uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+# Comparação
+
+def compare(baseline, current, threshold, min_delta_ms):
+    """Lista de regressões de `current` em relação a `baseline` (mesmo modo, tamanho e rota)"""
+    previous = {(r["mode"], r["rows"], r["endpoint"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = (result["mode"], result["rows"], result["endpoint"])
+        label = f"{key[0]} {key[1]:,} {key[2]}"
+        if result["errors"]:
+            regressions.append(f"{label}: {result['errors']} respostas com erro")
+        base = previous.get(key)
+        if base is None:
+            continue
+        limit = base["p95_ms"] * (1 + threshold) + min_delta_ms
+        if result["p95_ms"] > limit:
+            regressions.append(f"{label}: p95 {result['p95_ms']:.2f} ms > {base['p95_ms']:.2f} ms (limite {limit:.2f})")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{label}: vazão {result['throughput_rps']:.1f} req/s < {base['throughput_rps']:.1f} req/s"
+            )
+    return regressions
+
+
+def report_regressions(baseline_path, current, args):
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    regressions = compare(baseline, current, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"❌ {len(regressions)} regressões contra {baseline_path}:", file=sys.stderr)
+        for line in regressions:
+            print(f"  - {line}", file=sys.stderr)
+        return 1
+    print(f"✅ Sem regressões contra {baseline_path} (limite {args.threshold:.0%})", file=sys.stderr)
+    return 0
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--modes", nargs="+", choices=["asgi", "uvicorn"], default=["asgi", "uvicorn"])
+    parser.add_argument("--endpoints", nargs="+", help="rotas medidas (padrão: todas)")
+    parser.add_argument("--requests", type=int, default=500, help="requisições medidas por rota")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn (> 1 usa o store compartilhado)")
+    parser.add_argument("--no-cache", action="store_true", help="desliga o cache de respostas (mede o cálculo)")
+    parser.add_argument("--output", help="arquivo JSON com os resultados")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON de uma execução anterior para checar regressões")
+    parser.add_argument("--compare-only", nargs=2, metavar=("BASELINE", "ATUAL"), help="só compara dois JSON")
+    parser.add_argument("--threshold", type=float, default=0.2, help="piora relativa tolerada (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="folga absoluta no p95 (ruído em rotas rápidas)")
+    # Uso interno: um processo por (modo, tamanho) e o servidor uvicorn
+    parser.add_argument("--child", choices=["asgi", "uvicorn"], help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.no_cache:
+        # Entradas maiores que CACHE_MAX_BYTES não são guardadas
+        os.environ["CACHE_MAX_BYTES"] = "0"
+
+    if args.serve:
+        serve(args.rows[0], args.port, args.workers)
+        return
+    if args.child:
+        results = (run_asgi if args.child == "asgi" else run_uvicorn)(args.rows[0], args)
+        with open(args.child_output, "w") as file:
+            json.dump(results, file)
+        return
+    if args.compare_only:
+        with open(args.compare_only[1]) as file:
+            sys.exit(report_regressions(args.compare_only[0], json.load(file), args))
+
+    child_args = [
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+    ]
+    if args.endpoints:
+        child_args += ["--endpoints", *args.endpoints]
+    if args.no_cache:
+        child_args.append("--no-cache")
+    if args.workers > 1:
+        child_args += ["--workers", str(args.workers)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            for mode in args.modes:
+                output = os.path.join(tmp, f"{mode}_{rows}.json")
+                subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, "--rows", str(rows),
+                     "--child-output", output, *child_args],
+                    check=True,
+                )
+                with open(output) as file:
+                    results.extend(json.load(file))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": not args.no_cache,
+            "workers": args.workers,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Resultados em {args.output}", file=sys.stderr)
+    if args.compare:
+        sys.exit(report_regressions(args.compare, report, args))
+
+
+if __name__ == "__main__":
+    main()
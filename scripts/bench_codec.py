@@ -0,0 +1,170 @@
+"""
+Benchmark: serialização das respostas e leitura dos lotes, json vs orjson
+
+Para cada rota compara o caminho atual (JSON_CODEC=json: um dict por venda,
+json da biblioteca padrão e SaleItem do pydantic nos lotes) com o rápido
+(JSON_CODEC=orjson: vendas montadas das colunas, lotes direto para colunas):
+
+- /api/v1/sales: página JSON de `--page-rows` vendas;
+- /api/v1/sales NDJSON: `--stream-rows` vendas em blocos;
+- /api/v1/sales/batch: leitura e validação de um lote de `--batch-rows` vendas;
+- /api/v1/sales/timeseries: corpo das rotas com cache (série diária de 3 anos).
+
+Mede vendas/s e o pico de memória alocada por requisição (tracemalloc). Com
+`--http`, repete as rotas pela API inteira (TestClient, um processo por codec).
+
+Uso:
+    python scripts/bench_codec.py --rows 1000000 --http
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import List
+
+import numpy as np
+from pydantic import parse_obj_as
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api import codec, streaming, timeseries  # noqa: E402
+from app.api import main as api  # noqa: E402
+from app.api.rollups import SalesRollups  # noqa: E402
+from app.api.storage import MemoryBackend  # noqa: E402
+from app.api.store import SalesStore, records_to_columns  # noqa: E402
+from bench_query import batches  # noqa: E402
+
+
+def measure(func, repeat: int):
+    """(menor tempo em s, pico de memória alocada em bytes) de `func()`"""
+    func()
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def pydantic_batch(body: bytes) -> dict:
+    """Caminho atual de /sales/batch: um SaleItem por venda, .dict() e colunas"""
+    return records_to_columns(item.dict() for item in parse_obj_as(List[api.SaleItem], json.loads(body)))
+
+
+def build_backend(rows: int) -> MemoryBackend:
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    for columns in batches(rows, 1095, 250_000):
+        backend.append_columns(columns)
+    return backend
+
+
+def batch_body(rows: int) -> bytes:
+    columns = next(batches(rows, 30, rows, seed=11))
+    records = [dict(zip(columns, values)) for values in zip(*(np.asarray(v).tolist() for v in columns.values()))]
+    return json.dumps(records).encode("utf-8")
+
+
+def cases(args, backend: MemoryBackend):
+    """(rota, vendas por requisição, requisição com o codec configurado)"""
+    store, rollups = backend.snapshot()
+    body = batch_body(args.batch_rows)
+    first, last = rollups.day_bounds()
+    revenue, orders = rollups.daily(first, last)
+    series = timeseries.build_series(first, revenue, orders, "day")
+
+    def stream():
+        for _ in streaming.iter_ndjson(store, 0, min(args.stream_rows, len(store))):
+            pass
+
+    return [
+        ("/api/v1/sales (JSON)", args.page_rows, lambda: codec.encode_records(store, 0, args.page_rows)),
+        ("/api/v1/sales (NDJSON)", min(args.stream_rows, len(store)), stream),
+        ("/api/v1/sales/batch", args.batch_rows, lambda: pydantic_batch(body) if not codec.fast() else codec.decode_sales(body)),
+        ("/api/v1/sales/timeseries", len(series["points"]), lambda: codec.dumps(series)),
+    ]
+
+
+def in_process(args, backend: MemoryBackend):
+    print(f"{'rota':<26} {'vendas':>8} {'json':>12} {'orjson':>12} {'ganho':>6} {'pico json':>10} {'pico orjson':>11}")
+    results = {}
+    for kind in codec.CODECS:
+        codec.configure(kind)
+        for label, rows, func in cases(args, backend):
+            results[label, kind] = (rows,) + measure(func, args.repeat)
+    codec.configure("json")
+    for label, _, _ in cases(args, backend):
+        rows, slow, slow_peak = results[label, "json"]
+        _, fast, fast_peak = results[label, "orjson"]
+        print(f"{label:<26} {rows:>8,} {rows / slow:>10,.0f}/s {rows / fast:>10,.0f}/s {slow / fast:>5.1f}x "
+              f"{slow_peak / 1e6:>8.1f}MB {fast_peak / 1e6:>9.1f}MB")
+
+
+def http_child(args):
+    """Mede as rotas pela API (TestClient) com o codec de JSON_CODEC; imprime JSON"""
+    from fastapi.testclient import TestClient
+    for columns in batches(args.rows, 1095, 250_000):
+        api.MEMORY.append_columns(columns)
+    client = TestClient(api.app)
+    body = batch_body(args.batch_rows)
+    requests = {
+        "/api/v1/sales (JSON)": (args.page_rows, lambda: client.get(f"/api/v1/sales?limit={args.page_rows}")),
+        "/api/v1/sales (NDJSON)": (args.stream_rows, lambda: client.get(
+            f"/api/v1/sales?limit={args.stream_rows}", headers={"accept": streaming.NDJSON_MEDIA_TYPE})),
+        "/api/v1/sales/batch": (args.batch_rows, lambda: client.post(
+            "/api/v1/sales/batch", content=body, headers={"content-type": "application/json"})),
+    }
+    result = {}
+    for label, (rows, func) in requests.items():
+        assert func().status_code == 200, label
+        seconds, peak = measure(func, args.repeat)
+        result[label] = [rows, seconds, peak]
+    print(json.dumps(result))
+
+
+def over_http(args):
+    print(f"\nPela API (TestClient, {args.rows:,} vendas no store)")
+    results = {}
+    for kind in codec.CODECS:
+        command = [sys.executable, __file__, "--http-child", "--rows", str(args.rows), "--page-rows", str(args.page_rows),
+                   "--stream-rows", str(args.stream_rows), "--batch-rows", str(args.batch_rows), "--repeat", str(args.repeat)]
+        output = subprocess.run(command, env=dict(os.environ, JSON_CODEC=kind), capture_output=True, text=True, check=True)
+        results[kind] = json.loads(output.stdout.strip().splitlines()[-1])
+    print(f"{'rota':<26} {'vendas':>8} {'json':>12} {'orjson':>12} {'ganho':>6} {'pico json':>10} {'pico orjson':>11}")
+    for label, (rows, slow, slow_peak) in results["json"].items():
+        _, fast, fast_peak = results["orjson"][label]
+        print(f"{label:<26} {rows:>8,} {rows / slow:>10,.0f}/s {rows / fast:>10,.0f}/s {slow / fast:>5.1f}x "
+              f"{slow_peak / 1e6:>8.1f}MB {fast_peak / 1e6:>9.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page-rows", type=int, default=10_000)
+    parser.add_argument("--stream-rows", type=int, default=200_000)
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--http", action="store_true", help="mede também pela API (TestClient)")
+    parser.add_argument("--http-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if codec.orjson is None:
+        sys.exit("orjson não instalado (pip install orjson)")
+    if args.http_child:
+        return http_child(args)
+
+    backend = build_backend(args.rows)
+    print(f"{args.rows:,} vendas no store\n")
+    in_process(args, backend)
+    if args.http:
+        over_http(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark da ingestão em massa (CSV, NDJSON e Parquet)
+
+Mede linhas/s de leitura + validação vetorizada + append no SalesStore,
+em um único núcleo, e compara com o caminho JSON linha a linha (SaleItem).
+
+Uso:
+    python scripts/bench_ingest.py --rows 1000000
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api import ingest  # noqa: E402
+from app.api.main import SaleItem  # noqa: E402
+from app.api.store import SalesStore  # noqa: E402
+from bench_store import synthetic_columns  # noqa: E402
+
+
+def encode(df, fmt):
+    """Serializa o DataFrame no formato do corpo da requisição"""
+    buffer = io.BytesIO()
+    if fmt == "csv":
+        df.to_csv(buffer, index=False)
+        return buffer.getvalue(), "text/csv"
+    if fmt == "ndjson":
+        df.to_json(buffer, orient="records", lines=True, force_ascii=False)
+        return buffer.getvalue(), "application/x-ndjson"
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue(), "application/vnd.apache.parquet"
+
+
+def bench_bulk(body, content_type):
+    """Tempo (s) para ler, validar e adicionar o corpo inteiro ao store"""
+    store = SalesStore()
+    start = time.perf_counter()
+    columns, summary = ingest.parse_bulk(io.BytesIO(body), content_type)
+    store.append_columns(**columns)
+    elapsed = time.perf_counter() - start
+    assert summary["accepted"] == len(store)
+    return elapsed
+
+
+def bench_json_items(df, sample):
+    """Tempo (s) por linha do caminho atual: SaleItem por linha + .dict() + append"""
+    records = df.head(sample).to_dict("records")
+    store = SalesStore()
+    start = time.perf_counter()
+    store.append(SaleItem(**record).dict() for record in records)
+    return (time.perf_counter() - start) / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--formats", nargs="+", default=["csv", "ndjson", "parquet"])
+    parser.add_argument("--json-sample", type=int, default=100_000)
+    parser.add_argument("--target", type=float, default=500_000, help="meta de linhas/s para CSV")
+    args = parser.parse_args()
+
+    df = pd.DataFrame(synthetic_columns(args.rows))
+    print(f"{'formato':>10} {'MB':>8} {'segundos':>10} {'linhas/s':>12}")
+
+    per_row = bench_json_items(df, min(args.json_sample, args.rows))
+    print(f"{'json/item':>10} {'-':>8} {per_row * args.rows:>10.2f} {1 / per_row:>12,.0f}")
+
+    csv_rate = None
+    for fmt in args.formats:
+        body, content_type = encode(df, fmt)
+        elapsed = bench_bulk(body, content_type)
+        rate = args.rows / elapsed
+        if fmt == "csv":
+            csv_rate = rate
+        print(f"{fmt:>10} {len(body) / 1e6:>8.1f} {elapsed:>10.2f} {rate:>12,.0f}")
+
+    if csv_rate is not None:
+        status = "OK" if csv_rate >= args.target else "ABAIXO DA META"
+        print(f"CSV: {csv_rate:,.0f} linhas/s (meta {args.target:,.0f}) -> {status}")
+
+
+if __name__ == "__main__":
+    main()
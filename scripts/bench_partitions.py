@@ -0,0 +1,139 @@
+"""
+Benchmark: partições mensais Parquet com poda por data vs store em memória
+
+Grava vendas sintéticas em ordem cronológica (--days dias de histórico) num
+diretório temporário e, com o backend reaberto (cache vazio), mede:
+
+- consultas só com o manifesto (KPIs totais);
+- /sales/daily dos últimos 30 dias e do período inteiro, frio (colunas lidas
+  do disco) e quente (cache), com 1 e N threads, e arquivos lidos;
+- agrupamento por categoria (todas as partições);
+- memória residente do processo antes e depois das consultas, comparada ao
+  tamanho do SalesStore com as mesmas vendas.
+
+Os resultados são conferidos contra o MemoryBackend.
+
+Uso:
+    python scripts/bench_partitions.py --rows 5000000 --days 1095 --threads 1 4
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.partitions import PartitionedBackend  # noqa: E402
+from app.api.rollups import SalesRollups  # noqa: E402
+from app.api.storage import MemoryBackend  # noqa: E402
+from app.api.store import SalesStore, day_to_iso  # noqa: E402
+from bench_store import synthetic_columns  # noqa: E402
+
+FIRST_DAY = 19_000
+
+
+def rss_mb():
+    """Memória residente atual (MB) deste processo (Linux)"""
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def batches(rows, days, batch_days):
+    """Lotes em ordem cronológica, cada um com `batch_days` dias"""
+    per_day = rows / days
+    for start in range(0, days, batch_days):
+        span = min(batch_days, days - start)
+        count = int(round(per_day * (start + span))) - int(round(per_day * start))
+        columns = synthetic_columns(count, seed=start)
+        offsets = np.sort(np.random.default_rng(start).integers(0, span, count))
+        columns["date"] = day_to_iso(FIRST_DAY + start + offsets).astype(object)
+        yield columns
+
+
+def timed(func, repeat=1):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best * 1000
+
+
+def touched(backend, start_day, end_day):
+    return sum(part.overlaps(start_day, end_day) for part in backend.snapshot().partitions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=1095, help="dias de histórico")
+    parser.add_argument("--batch-days", type=int, default=7, help="dias por lote gravado")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--cache-mb", type=int, default=256, help="cache de colunas do backend")
+    parser.add_argument("--dir", help="diretório das partições (padrão: temporário, apagado no fim)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="bench_partitions_")
+    try:
+        writer = PartitionedBackend(directory)
+        started = time.perf_counter()
+        for columns in batches(args.rows, args.days, args.batch_days):
+            writer.append_columns(columns)
+        seconds = time.perf_counter() - started
+        writer.close()
+        files = len(writer.snapshot().partitions)
+        size = sum(os.path.getsize(os.path.join(directory, part.path)) for part in writer.snapshot().partitions)
+        print(f"{args.rows:,} vendas em {args.days} dias: {files} arquivos, {size / 1024 / 1024:.1f} MB em disco, "
+              f"gravação {args.rows / seconds:,.0f} vendas/s")
+
+        last = FIRST_DAY + args.days - 1
+        ranges = {"30 dias": (last - 29, last), "período inteiro": (FIRST_DAY, last)}
+        reference = {}
+
+        print(f"\n{'consulta':<28} {'threads':>7} {'arquivos':>8} {'frio (ms)':>10} {'quente (ms)':>12}")
+        for threads in args.threads:
+            backend = PartitionedBackend(directory, threads=threads, cache_bytes=args.cache_mb * 1024 * 1024)
+            before = rss_mb()
+            _, ms = timed(backend.kpis, repeat=5)
+            print(f"{'kpis (manifesto)':<28} {threads:>7} {0:>8} {ms:>10.2f} {ms:>12.2f}")
+            for label, (start_day, end_day) in ranges.items():
+                result, cold = timed(lambda: backend.daily(start_day, end_day))
+                _, warm = timed(lambda: backend.daily(start_day, end_day), repeat=5)
+                reference[label] = result
+                print(f"{'daily ' + label:<28} {threads:>7} {touched(backend, start_day, end_day):>8} "
+                      f"{cold:>10.2f} {warm:>12.2f}")
+                if label == "30 dias":
+                    after_recent = rss_mb()
+            backend.cache.clear()
+            categories, cold = timed(backend.by_category)
+            _, warm = timed(backend.by_category, repeat=3)
+            print(f"{'by_category':<28} {threads:>7} {files:>8} {cold:>10.2f} {warm:>12.2f}")
+            print(f"  memória residente: {before:.0f} MB ao abrir, +{after_recent - before:.0f} MB após 30 dias, "
+                  f"cache de colunas {backend.cache.nbytes / 1024 / 1024:.0f} MB no fim")
+            backend.close()
+
+        # Conferência e tamanho equivalente em memória
+        memory = MemoryBackend(SalesStore(), SalesRollups())
+        for columns in PartitionedBackend(directory).iter_columns():
+            memory.append_columns(columns)
+        for label, (start_day, end_day) in ranges.items():
+            revenue, orders = memory.daily(start_day, end_day)
+            if not np.allclose(reference[label][0], revenue) or not np.array_equal(reference[label][1], orders):
+                sys.exit(f"❌ daily {label} diferente do MemoryBackend")
+        expected = {row["category"]: row["revenue"] for row in memory.by_category()}
+        if any(not np.isclose(row["revenue"], expected[row["category"]]) for row in categories):
+            sys.exit("❌ by_category diferente do MemoryBackend")
+        print(f"\n✅ Resultados iguais ao MemoryBackend; SalesStore com as mesmas vendas: "
+              f"{memory.store.nbytes / 1024 / 1024:.0f} MB sempre em memória")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
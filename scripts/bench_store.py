@@ -0,0 +1,130 @@
+"""
+Benchmark: lista de dicts (SALES_DATA antigo) vs SalesStore colunar
+
+Mede memória por linha e latência dos KPIs / agrupamento por categoria.
+
+Uso:
+    python scripts/bench_store.py --rows 1000000 10000000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.store import SalesStore, day_to_iso  # noqa: E402
+
+
+def synthetic_columns(rows, seed=42):
+    """Gera colunas sintéticas com cardinalidades realistas"""
+    rng = np.random.default_rng(seed)
+    products = np.array([f"Produto {i}" for i in range(500)], dtype=object)
+    categories = np.array([f"Categoria {i}" for i in range(20)], dtype=object)
+    customers = np.array([f"Cliente {i}" for i in range(50_000)], dtype=object)
+    product_idx = rng.integers(0, len(products), rows)
+    return {
+        "date": day_to_iso(19_700 + rng.integers(0, 730, rows)).astype(object),
+        "product": products[product_idx],
+        "category": categories[product_idx % len(categories)],
+        "amount": np.round(rng.uniform(5, 5000, rows), 2),
+        "quantity": rng.integers(1, 10, rows),
+        "customer": customers[rng.integers(0, len(customers), rows)],
+    }
+
+
+def build_list(columns):
+    """Monta a lista de dicts no formato antigo"""
+    names = list(columns)
+    values = [columns[n].tolist() for n in names]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def list_kpis(data):
+    total_revenue = sum(item["amount"] * item["quantity"] for item in data)
+    return total_revenue, len(data)
+
+
+def list_by_category(data):
+    categories = {}
+    for sale in data:
+        cat = sale["category"]
+        if cat not in categories:
+            categories[cat] = {"category": cat, "revenue": 0, "quantity": 0}
+        categories[cat]["revenue"] += sale["amount"] * sale["quantity"]
+        categories[cat]["quantity"] += sale["quantity"]
+    return list(categories.values())
+
+
+def best_of(func, repeat):
+    """Menor tempo (ms) entre `repeat` execuções"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def bench_list(columns, rows, list_max_rows, repeat):
+    """Mede o caminho antigo; acima de list_max_rows extrapola linearmente"""
+    sample = min(rows, list_max_rows)
+    sample_columns = {name: values[:sample] for name, values in columns.items()}
+
+    tracemalloc.start()
+    data = build_list(sample_columns)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    scale = rows / sample
+    result = {
+        "bytes_per_row": current / sample,
+        "kpis_ms": best_of(lambda: list_kpis(data), repeat) * scale,
+        "by_category_ms": best_of(lambda: list_by_category(data), repeat) * scale,
+        "extrapolated": sample < rows,
+    }
+    del data
+    return result
+
+
+def bench_store(columns, rows, repeat):
+    """Mede o SalesStore colunar"""
+    store = SalesStore()
+    start = time.perf_counter()
+    store.append_columns(**columns)
+    append_ms = (time.perf_counter() - start) * 1000
+    return {
+        "bytes_per_row": store.nbytes / rows,
+        "append_ms": append_ms,
+        "kpis_ms": best_of(lambda: (store.total_revenue(), len(store)), repeat),
+        "by_category_ms": best_of(store.by_category, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--list-max-rows", type=int, default=1_000_000,
+                        help="acima disso a lista de dicts é medida numa amostra e extrapolada")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>12} {'caminho':>8} {'bytes/linha':>12} {'kpis (ms)':>12} {'categoria (ms)':>15}")
+    for rows in args.rows:
+        columns = synthetic_columns(rows)
+        old = bench_list(columns, rows, args.list_max_rows, args.repeat)
+        new = bench_store(columns, rows, args.repeat)
+        mark = "*" if old["extrapolated"] else ""
+        print(f"{rows:>12,} {'lista':>8} {old['bytes_per_row']:>12.1f} "
+              f"{old['kpis_ms']:>11.1f}{mark:1} {old['by_category_ms']:>14.1f}{mark:1}")
+        print(f"{rows:>12,} {'colunar':>8} {new['bytes_per_row']:>12.1f} "
+              f"{new['kpis_ms']:>12.2f} {new['by_category_ms']:>15.2f}   (append {new['append_ms']:.0f} ms)")
+    print("* extrapolado linearmente a partir de --list-max-rows linhas")
+
+
+if __name__ == "__main__":
+    main()
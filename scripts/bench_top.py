@@ -0,0 +1,120 @@
+"""
+Benchmark: ranking de /api/v1/sales/top, exato vs Space-Saving
+
+Grava vendas sintéticas em lotes num MemoryBackend, com clientes em
+distribuição de Zipf (poucos clientes grandes, cauda longa de milhões), e mede:
+
+- produtos de todo o período (vetores dos agregados);
+- clientes exatos de todo o período e dos últimos 30 dias (soma por cliente
+  nas vendas);
+- clientes aproximados (Space-Saving mantido na ingestão);
+- custo do Space-Saving por lote, memória do sketch vs totais exatos por
+  cliente, e a qualidade do aproximado: quantos dos `n` maiores reais ele
+  traz, o maior erro relativo e se o ranking saiu garantido.
+
+Uso:
+    python scripts/bench_top.py --rows 5000000 --customers 2000000 --n 10 100
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.rollups import SalesRollups  # noqa: E402
+from app.api.sketches import SpaceSaving  # noqa: E402
+from app.api.storage import MemoryBackend  # noqa: E402
+from app.api.store import SalesStore, day_to_iso  # noqa: E402
+
+FIRST_DAY = 19_000
+
+
+def timed(func, repeat=1):
+    """(resultado, menor tempo em ms)"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best * 1000
+
+
+def batches(rows, customers, days, batch_rows, zipf, seed=7):
+    """Lotes em ordem cronológica com clientes Zipf (o cliente 0 é o maior)"""
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Cliente {i}" for i in range(customers)], dtype=object)
+    products = np.array([f"Produto {i}" for i in range(1000)], dtype=object)
+    for start in range(0, rows, batch_rows):
+        count = min(batch_rows, rows - start)
+        product = rng.integers(0, len(products), count)
+        day = FIRST_DAY + np.sort(rng.integers(start * days // rows, (start + count) * days // rows + 1, count))
+        yield {
+            "date": day_to_iso(day).astype(object),
+            "product": products[product],
+            "category": np.array([f"Categoria {i}" for i in range(20)], dtype=object)[product % 20],
+            "amount": np.round(rng.uniform(5, 500, count), 2),
+            "quantity": rng.integers(1, 10, count),
+            "customer": names[(rng.zipf(zipf, count) - 1) % customers],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--customers", type=int, default=2_000_000, help="clientes possíveis")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    parser.add_argument("--zipf", type=float, default=1.2, help="expoente da distribuição dos clientes")
+    parser.add_argument("--n", type=int, nargs="+", default=[10, 100])
+    args = parser.parse_args()
+
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    # Cópia do sketch de receita atualizada à parte: custo isolado (já incluído na gravação)
+    probe = SpaceSaving()
+    sketch_seconds = 0.0
+    for columns in batches(args.rows, args.customers, args.days, args.batch_rows, args.zipf):
+        backend.append_columns(columns)
+        codes = backend.store.customers.encode(columns["customer"])
+        started = time.perf_counter()
+        probe.update(codes, columns["amount"] * columns["quantity"])
+        sketch_seconds += time.perf_counter() - started
+    store, rollups = backend.snapshot()
+    customers = len(store.customers)
+    sketch = rollups.sketches.top_customers["revenue"]
+    exact_bytes = customers * 3 * 8
+    print(f"{args.rows:,} vendas, {customers:,} clientes distintos; Space-Saving: "
+          f"{sketch_seconds / (args.rows / args.batch_rows) * 1000:.1f} ms por lote de {args.batch_rows:,}, "
+          f"{sketch.nbytes / 1024:.0f} KB por métrica vs {exact_bytes / 1024 / 1024:.0f} MB de totais exatos por cliente")
+
+    last = rollups.day_bounds()[1]
+    print(f"\n{'consulta':<34} {'n':>5} {'ms':>9}")
+    for n in args.n:
+        for label, func in (
+            ("produtos (agregados)", lambda: backend.top("product", "revenue", n)),
+            ("clientes exatos", lambda: backend.top("customer", "revenue", n)),
+            ("clientes exatos, 30 dias", lambda: backend.top("customer", "revenue", n, last - 29, last)),
+            ("clientes aproximados", lambda: backend.top_customers("revenue", n)),
+        ):
+            _, ms = timed(func, repeat=3)
+            print(f"{label:<34} {n:>5} {ms:>9.2f}")
+
+    print(f"\n{'n':>5} {'encontrados':>12} {'erro relativo máx.':>19} {'garantido':>10}")
+    for n in args.n:
+        exact = backend.top("customer", "revenue", n)
+        approximate = backend.top_customers("revenue", n)
+        truth = {row["customer"]: row["revenue"] for row in exact}
+        totals = {row["customer"]: row["revenue"] for row in backend.top("customer", "revenue", sketch.capacity)}
+        found = sum(row["customer"] in truth for row in approximate["items"])
+        error = max(
+            abs(row["revenue"] - totals[row["customer"]]) / totals[row["customer"]] if row["customer"] in totals else 1.0
+            for row in approximate["items"]
+        )
+        print(f"{n:>5} {found:>8}/{n:<3} {error:>18.2%} {str(approximate['guaranteed']):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Teste de recuperação do store em memória com WAL e snapshots (DATA_DIR)
+
+Um processo filho grava lotes (com threads concorrentes, produtos e clientes
+novos a cada lote) e avisa cada lote confirmado; o processo é morto com
+SIGKILL num instante aleatório, no meio das gravações. Depois de cada morte,
+a recuperação confere:
+
+- só lotes inteiros no store (nenhum lote pela metade);
+- todos os lotes confirmados ao filho estão presentes;
+- agregados recuperados = agregados recalculados a partir das colunas.
+
+Snapshots pequenos (`--snapshot-bytes`) fazem a morte cair também durante
+snapshots e trocas de segmento. Em seguida corta o fim do último segmento e
+troca um byte de um registro (escrita interrompida e corrompida) e confere
+que só o último lote é descartado. Por fim mede o tempo de reinício com
+`--restart-rows` vendas: só snapshot e snapshot mais WAL.
+
+Sai com código 1 se alguma conferência falhar.
+
+Uso:
+    python scripts/stress_recovery.py --kills 20 --restart-rows 10000000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.storage import MemoryBackend  # noqa: E402
+from app.api.store import day_to_iso  # noqa: E402
+from app.api.wal import Journal  # noqa: E402
+
+FIRST_DAY = 19_000
+
+
+def batch(number: int, rows: int) -> dict:
+    """Lote identificável pela quantidade (= número do lote), com produtos e clientes novos"""
+    rng = np.random.default_rng(number)
+    product = rng.integers(0, 50, rows) + number * 10
+    return {
+        "date": day_to_iso(FIRST_DAY + rng.integers(0, 365, rows)).astype(object),
+        "product": np.array([f"Produto {i}" for i in product], dtype=object),
+        "category": np.array([f"Categoria {i % 20}" for i in product], dtype=object),
+        "amount": np.round(rng.uniform(5, 500, rows), 2),
+        "quantity": np.full(rows, number, dtype=np.int64),
+        "customer": np.array([f"Cliente {number}-{i}" for i in rng.integers(0, 100, rows)], dtype=object),
+    }
+
+
+def open_backend(directory: str, snapshot_bytes: int, sync: bool = True):
+    journal = Journal(directory, sync=sync, snapshot_bytes=snapshot_bytes)
+    store, rollups = journal.recover()
+    backend = MemoryBackend(store, rollups, journal=journal)
+    journal.attach(backend)
+    return journal, backend
+
+
+def child(args):
+    """Grava lotes a partir de `--first` até ser morto; escreve 'ack <lote>' após cada confirmação"""
+    _, backend = open_backend(args.child, args.snapshot_bytes)
+    lock = threading.Lock()
+    numbers = iter(range(args.first, 1 << 30))
+
+    def write():
+        while True:
+            with lock:
+                number = next(numbers)
+            backend.append_columns(batch(number, args.batch_rows))
+            with lock:
+                sys.stdout.write(f"ack {number}\n")
+                sys.stdout.flush()
+
+    threads = [threading.Thread(target=write, daemon=True) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check(directory: str, batch_rows: int, acked: set):
+    """Recupera o diretório e confere lotes inteiros, confirmados presentes e agregados; (erros, último lote, journal)"""
+    journal = Journal(directory)
+    store, rollups = journal.recover()
+    errors = []
+    numbers, counts = np.unique(store.column("quantity"), return_counts=True)
+    partial = numbers[counts != batch_rows]
+    if len(partial):
+        errors.append(f"lotes pela metade: {partial.tolist()[:10]}")
+    missing = acked - set(numbers.tolist())
+    if missing:
+        errors.append(f"lotes confirmados ausentes: {sorted(missing)[:10]}")
+    differences = MemoryBackend(store, rollups).rebuild()
+    if differences:
+        errors.append(f"agregados divergentes: {differences}")
+    journal.close(snapshot=False)
+    return errors, (int(numbers.max()) if len(numbers) else 0), journal
+
+
+def kill_rounds(args, directory: str) -> bool:
+    ok = True
+    acked, first = set(), 1
+    for round_number in range(1, args.kills + 1):
+        process = subprocess.Popen(
+            [sys.executable, __file__, "--child", directory, "--first", str(first),
+             "--batch-rows", str(args.batch_rows), "--writers", str(args.writers),
+             "--snapshot-bytes", str(args.snapshot_bytes)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        time.sleep(random.uniform(0.5, 2.0))
+        process.send_signal(signal.SIGKILL)
+        output, _ = process.communicate()
+        confirmed = {int(line.split()[1]) for line in output.splitlines() if line.startswith("ack ")}
+        acked |= confirmed
+        errors, last, journal = check(directory, args.batch_rows, acked)
+        files = sorted(os.listdir(directory))
+        print(f"morte {round_number:>2}: {len(confirmed):>4} lotes confirmados, até o lote {last}, "
+              f"{journal.snapshot_rows:,} vendas do snapshot + {journal.replayed_rows:,} do WAL "
+              f"em {journal.recovery_seconds * 1000:.0f}ms ({len(files)} arquivos)")
+        for error in errors:
+            ok = False
+            print(f"  ERRO: {error}")
+        first = last + 1
+    return ok
+
+
+def torn_tail(args, directory: str) -> bool:
+    """Corta o último registro no meio e depois corrompe um byte: só o último lote some"""
+    ok = True
+    journal, backend = open_backend(directory, 1 << 40)
+    for number in (900_001, 900_002):
+        backend.append_columns(batch(number, args.batch_rows))
+    journal.close(snapshot=False)
+    segment = os.path.join(directory, sorted(name for name in os.listdir(directory) if name.startswith("wal-"))[-1])
+    size = os.path.getsize(segment)
+    for case in ("cortado", "corrompido"):
+        scratch = directory + f"-{case}"
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.copytree(directory, scratch)
+        path = os.path.join(scratch, os.path.basename(segment))
+        with open(path, "r+b") as file:
+            if case == "cortado":
+                file.truncate(size - random.randint(1, args.batch_rows))
+            else:
+                file.seek(size - random.randint(1, args.batch_rows))
+                byte = file.read(1)
+                file.seek(-1, os.SEEK_CUR)
+                file.write(bytes([byte[0] ^ 0xFF]))
+        errors, last, _ = check(scratch, args.batch_rows, {900_001})
+        if last != 900_001:
+            errors.append(f"último lote recuperado {last}, esperado 900001")
+        # Depois de descartar o fim, o WAL continua gravando normalmente
+        journal, backend = open_backend(scratch, 1 << 40)
+        backend.append_columns(batch(900_003, args.batch_rows))
+        journal.close(snapshot=False)
+        more, last, _ = check(scratch, args.batch_rows, {900_001, 900_003})
+        errors += more
+        print(f"registro {case}: {'ok' if not errors else 'ERRO'}")
+        for error in errors:
+            ok = False
+            print(f"  ERRO: {error}")
+        shutil.rmtree(scratch, ignore_errors=True)
+    return ok
+
+
+def restart_time(args, directory: str):
+    """Tempo de reinício com `--restart-rows` vendas: só snapshot e snapshot + 10% no WAL"""
+    tail = args.restart_rows // 10
+    journal, backend = open_backend(directory, 1 << 40, sync=False)
+    chunk = 500_000
+    for start in range(0, args.restart_rows - tail, chunk):
+        backend.append_columns(batch(start // chunk + 1, min(chunk, args.restart_rows - tail - start)))
+    started = time.perf_counter()
+    journal.close()
+    print(f"\nsnapshot de {len(backend.store):,} vendas gravado em {time.perf_counter() - started:.2f}s "
+          f"({sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names) / 1e6:.0f} MB)")
+
+    journal = Journal(directory)
+    store, rollups = journal.recover()
+    print(f"reinício só com snapshot: {journal.recovery_seconds:.2f}s ({len(store):,} vendas)")
+    backend = MemoryBackend(store, rollups, journal=journal)
+    journal.attach(backend)
+    offset = args.restart_rows // chunk + 10
+    for start in range(0, tail, chunk):
+        backend.append_columns(batch(offset + start // chunk, min(chunk, tail - start)))
+    journal.close(snapshot=False)
+
+    journal = Journal(directory)
+    store, rollups = journal.recover()
+    print(f"reinício com snapshot + WAL: {journal.recovery_seconds:.2f}s "
+          f"({journal.snapshot_rows:,} do snapshot, {journal.replayed_rows:,} reaplicadas)")
+    started = time.perf_counter()
+    kpis = MemoryBackend(store, rollups).kpis()
+    print(f"primeira leitura de KPIs após o reinício: {(time.perf_counter() - started) * 1000:.1f}ms "
+          f"({kpis['total_orders']:,} pedidos)")
+    journal.close(snapshot=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kills", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch-rows", type=int, default=2_000)
+    parser.add_argument("--snapshot-bytes", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--restart-rows", type=int, default=10_000_000, help="0 = não mede o reinício")
+    parser.add_argument("--dir", help="diretório de trabalho (padrão: temporário, apagado no fim)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--first", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    base = args.dir or tempfile.mkdtemp(prefix="stress_recovery_")
+    try:
+        ok = kill_rounds(args, os.path.join(base, "kills"))
+        ok = torn_tail(args, os.path.join(base, "torn")) and ok
+        if args.restart_rows:
+            restart_time(args, os.path.join(base, "restart"))
+    finally:
+        if not args.dir:
+            shutil.rmtree(base, ignore_errors=True)
+    print("\nOK" if ok else "\nFALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Teste de estresse do store em memória: lotes gravados enquanto leitores consultam
+
+Escritores gravam repetidamente o mesmo lote (receita, quantidade e pedidos
+conhecidos) no MemoryBackend enquanto leitores pegam snapshots e conferem:
+
+- pedidos = iniciais + k lotes inteiros (nenhum lote pela metade);
+- receita e quantidade batem com k lotes;
+- soma por dia, por categoria e pelas somas acumuladas = totais;
+- tamanho do store do snapshot = pedidos dos agregados;
+- de tempos em tempos, uma varredura do store confere a receita.
+
+Também mede a vazão de leitura sem escritas e durante a ingestão. Sai com
+código 1 se alguma leitura ficar inconsistente.
+
+Uso:
+    python scripts/stress_store.py --seconds 10 --writers 2 --readers 4 --batch-rows 1000
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.rollups import SalesRollups  # noqa: E402
+from app.api.storage import MemoryBackend  # noqa: E402
+from app.api.store import SalesStore  # noqa: E402
+from bench_store import synthetic_columns  # noqa: E402
+
+
+class Expected:
+    """Totais esperados após k lotes sobre o estado inicial"""
+
+    def __init__(self, backend: MemoryBackend, batch: dict):
+        totals = backend.kpis()
+        self.orders = totals["total_orders"]
+        self.revenue = totals["total_revenue"]
+        self.quantity = totals["total_quantity"]
+        self.batch_rows = len(batch["amount"])
+        self.batch_revenue = float(np.dot(batch["amount"], batch["quantity"]))
+        self.batch_quantity = int(batch["quantity"].sum())
+
+
+def check_snapshot(snapshot, expected: Expected, scan: bool) -> list:
+    """Divergências de um snapshot em relação a um número inteiro de lotes"""
+    rollups, store = snapshot.rollups, snapshot.store
+    errors = []
+    added, partial = divmod(rollups.orders - expected.orders, expected.batch_rows)
+    if partial:
+        errors.append(f"lote pela metade: {rollups.orders} pedidos")
+    revenue = expected.revenue + added * expected.batch_revenue
+    if not np.isclose(rollups.revenue, revenue, rtol=1e-9):
+        errors.append(f"receita {rollups.revenue} != {revenue} ({added} lotes)")
+    if rollups.quantity != expected.quantity + added * expected.batch_quantity:
+        errors.append(f"quantidade {rollups.quantity} inconsistente com {added} lotes")
+    if len(store) != rollups.orders:
+        errors.append(f"store com {len(store)} linhas e agregados com {rollups.orders} pedidos")
+
+    first, last = rollups.day_bounds()
+    daily_revenue, daily_orders = rollups.daily(first, last)
+    if int(daily_orders.sum()) != rollups.orders or not np.isclose(daily_revenue.sum(), rollups.revenue, rtol=1e-9):
+        errors.append("soma por dia diferente dos totais")
+    window_revenue, window_orders = rollups.window(first, last)
+    if window_orders != rollups.orders or not np.isclose(window_revenue, rollups.revenue, rtol=1e-9):
+        errors.append("somas acumuladas diferentes dos totais")
+    categories = rollups.by_category(store)
+    if not np.isclose(sum(row["revenue"] for row in categories), rollups.revenue, rtol=1e-9):
+        errors.append("soma por categoria diferente dos totais")
+    if scan and not np.isclose(store.total_revenue(), rollups.revenue, rtol=1e-9):
+        errors.append("varredura do store diferente dos agregados")
+    return errors
+
+
+def reader(backend, expected, stop, counts, errors, scan_every):
+    reads = 0
+    while not stop.is_set():
+        found = check_snapshot(backend.snapshot(), expected, scan=scan_every and reads % scan_every == 0)
+        # Leituras pela API do backend (cada chamada usa o snapshot mais recente)
+        backend.kpis()
+        backend.by_category()
+        if found:
+            errors.extend(found)
+        reads += 1
+    counts.append(reads)
+
+
+def writer(backend, batch, stop, counts):
+    batches = 0
+    while not stop.is_set():
+        backend.append_columns(batch)
+        batches += 1
+    counts.append(batches)
+
+
+def run_phase(backend, expected, batch, seconds, readers, writers, scan_every):
+    stop = threading.Event()
+    reads, batches, errors = [], [], []
+    threads = [
+        threading.Thread(target=reader, args=(backend, expected, stop, reads, errors, scan_every))
+        for _ in range(readers)
+    ] + [threading.Thread(target=writer, args=(backend, batch, stop, batches)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads), sum(batches), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed-rows", type=int, default=200_000, help="vendas gravadas antes do teste")
+    parser.add_argument("--batch-rows", type=int, default=1_000)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0, help="duração da fase com escritas")
+    parser.add_argument("--scan-every", type=int, default=50, help="varredura completa a cada N leituras (0 desliga)")
+    args = parser.parse_args()
+
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    backend.append_columns(synthetic_columns(args.seed_rows, seed=1))
+    batch = synthetic_columns(args.batch_rows, seed=2)
+    expected = Expected(backend, batch)
+
+    print(f"Store com {args.seed_rows:,} vendas; lotes de {args.batch_rows:,}")
+    idle_reads, _, idle_errors = run_phase(backend, expected, batch, args.seconds / 2, args.readers, 0, args.scan_every)
+    idle_rate = idle_reads / (args.seconds / 2)
+    print(f"  Só leituras:       {idle_rate:10,.0f} leituras/s ({args.readers} leitores)")
+
+    reads, batches, errors = run_phase(backend, expected, batch, args.seconds, args.readers, args.writers, args.scan_every)
+    read_rate = reads / args.seconds
+    print(f"  Durante ingestão:  {read_rate:10,.0f} leituras/s ({read_rate / idle_rate:.0%} da vazão sem escritas)")
+    print(f"  Ingestão:          {batches * args.batch_rows / args.seconds:10,.0f} vendas/s ({args.writers} escritores, {batches} lotes)")
+
+    errors = idle_errors + errors
+    final = backend.snapshot().rollups.orders
+    if final != expected.orders + batches * args.batch_rows:
+        errors.append(f"pedidos finais {final} != {expected.orders + batches * args.batch_rows}")
+    errors += backend.rebuild()
+    if errors:
+        print(f"❌ {len(errors)} inconsistências; primeiras:")
+        for error in errors[:10]:
+            print(f"  - {error}")
+        sys.exit(1)
+    print(f"✅ {idle_reads + reads:,} leituras consistentes; agregados conferidos contra o store")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Testes importam o pacote app a partir da raiz do repositório
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
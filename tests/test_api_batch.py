@@ -0,0 +1,50 @@
+"""POST /api/v1/sales/batch com os dois codecs: mesma resposta para o mesmo lote"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from app.api import codec
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SALE = {"date": "2024-01-01", "product": "Mouse", "category": "Eletrônicos", "amount": 150.0, "quantity": 2, "customer": None}
+
+# As rotas dependem do codec escolhido na importação da API: um processo por codec
+CLIENT = textwrap.dedent("""
+    import json, sys
+    sys.path.insert(0, sys.argv[1])
+    from fastapi.testclient import TestClient
+    from app.api.main import app, BACKEND
+    client = TestClient(app)
+    before = BACKEND.count()
+    response = client.post("/api/v1/sales/batch", content=sys.argv[2], headers={"Content-Type": "application/json"})
+    print(json.dumps({"status": response.status_code, "body": response.json(), "added": BACKEND.count() - before}))
+""")
+
+
+def post(kind: str, sales: list) -> dict:
+    env = dict(os.environ, JSON_CODEC=kind, SALES_BACKEND="memory")
+    for name in ("DATABASE_URL", "DATA_DIR", "SHARED_STORE_DIR", "PARTITION_DIR"):
+        env.pop(name, None)
+    result = subprocess.run(
+        [sys.executable, "-c", CLIENT, ROOT, json.dumps(sales)],
+        env=env, capture_output=True, text=True, timeout=120, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("quantity", [2 ** 31, -2 ** 31 - 1, 2 ** 63])
+def test_quantity_out_of_range_is_422_with_both_codecs(quantity):
+    if codec.orjson is None:
+        pytest.skip("orjson não instalado")
+    sales = [SALE, dict(SALE, quantity=quantity)]
+    responses = {kind: post(kind, sales) for kind in codec.CODECS}
+    for response in responses.values():
+        assert response["status"] == 422
+        assert "quantity" in json.dumps(response["body"])
+        assert response["added"] == 0
@@ -0,0 +1,42 @@
+"""ETag e 304 das rotas com cache"""
+
+from starlette.requests import Request
+
+from app.api.cache import MemoryCache, cached_json
+
+
+def request(etag: str = None) -> Request:
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def get(cache, data, etag=None):
+    return cached_json(cache, request(etag), "kpis", {"days": 30}, lambda: data)
+
+
+def test_not_modified_with_same_data():
+    cache = MemoryCache()
+    first = get(cache, {"total": 1})
+    assert first.status_code == 200
+    assert get(cache, {"total": 1}, first.headers["etag"]).status_code == 304
+    cache.bump_version()
+    assert get(cache, {"total": 2}, first.headers["etag"]).status_code == 200
+
+
+def test_worker_versions_do_not_share_etags():
+    """Dois workers com cache em memória na mesma versão, dados diferentes: sem 304 entre eles"""
+    worker_a, worker_b = MemoryCache(), MemoryCache()
+    etag = get(worker_a, {"total": 1}).headers["etag"]
+    assert get(worker_b, {"total": 2}, etag).status_code == 200
+
+
+def test_shared_identity_etags():
+    """Com identidade dos dados (store compartilhado), o ETag vale em todos os workers e muda com os dados"""
+    rows = {"count": 10}
+    worker_a = MemoryCache(identity=lambda: f"store:{rows['count']}")
+    worker_b = MemoryCache(identity=lambda: f"store:{rows['count']}")
+    worker_b.bump_version()
+    etag = get(worker_a, {"total": 1}).headers["etag"]
+    assert get(worker_b, {"total": 1}, etag).status_code == 304
+    rows["count"] = 11
+    assert get(worker_b, {"total": 2}, etag).status_code == 200
@@ -0,0 +1,42 @@
+"""Leitura de lotes direto para colunas (JSON_CODEC=orjson)"""
+
+import json
+
+import numpy as np
+import pytest
+
+from app.api import codec
+
+SALE = {"date": "2024-01-01", "product": "Mouse", "category": "Eletrônicos", "amount": 150.0, "quantity": 2, "customer": None}
+
+
+@pytest.fixture(params=codec.CODECS)
+def configured(request):
+    if request.param == "orjson" and codec.orjson is None:
+        pytest.skip("orjson não instalado")
+    codec.configure(request.param)
+    yield request.param
+    codec.configure("json")
+
+
+def body(*sales) -> bytes:
+    return json.dumps(list(sales)).encode("utf-8")
+
+
+def test_decode_sales_columns(configured):
+    columns = codec.decode_sales(body(SALE, dict(SALE, quantity="3", amount="9.5", customer="Ana")))
+    assert columns["quantity"].tolist() == [2, 3]
+    assert columns["amount"].tolist() == [150.0, 9.5]
+    assert columns["customer"] == [None, "Ana"]
+
+
+@pytest.mark.parametrize("quantity", [2 ** 31, -2 ** 31 - 1, 2 ** 63])
+def test_decode_sales_quantity_out_of_range(configured, quantity):
+    with pytest.raises(ValueError, match="Campo 'quantity' fora do intervalo"):
+        codec.decode_sales(body(SALE, dict(SALE, quantity=quantity)))
+
+
+def test_decode_sales_quantity_limits(configured):
+    limits = np.iinfo(np.int32)
+    columns = codec.decode_sales(body(dict(SALE, quantity=int(limits.max)), dict(SALE, quantity=int(limits.min))))
+    assert columns["quantity"].tolist() == [limits.max, limits.min]
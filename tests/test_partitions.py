@@ -0,0 +1,126 @@
+"""Partições Parquet gravadas por vários processos no mesmo diretório"""
+
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.api import partitions  # noqa: E402
+from app.api.partitions import PartitionedBackend, stats_path  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+WRITER = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import numpy as np
+    from app.api import partitions
+    partitions.COMPACT_FILES = 4
+    backend = partitions.PartitionedBackend(sys.argv[2])
+    worker, batches = int(sys.argv[3]), int(sys.argv[4])
+    for number in range(batches):
+        rows = 50
+        backend.append_columns({
+            "date": np.array(["2024-01-15", "2024-02-10"] * (rows // 2)),
+            "product": [f"Produto {worker}"] * rows,
+            "category": ["Categoria"] * rows,
+            "amount": np.full(rows, 10.0),
+            "quantity": np.full(rows, worker + 1),
+            "customer": [f"Cliente {worker}-{number}"] * rows,
+        })
+""")
+
+
+def test_concurrent_writers(tmp_path):
+    directory = str(tmp_path)
+    reader = PartitionedBackend(directory)
+    workers, batches = 4, 15
+    processes = [
+        subprocess.Popen([sys.executable, "-c", WRITER, ROOT, directory, str(worker), str(batches)])
+        for worker in range(workers)
+    ]
+    assert all(process.wait(timeout=120) == 0 for process in processes)
+
+    # Leitor aberto antes das gravações passa a ver todas
+    expected_rows = workers * batches * 50
+    assert reader.count() == expected_rows
+    quantities = np.concatenate([columns["quantity"] for columns in reader.iter_columns()])
+    assert len(quantities) == expected_rows
+    assert np.bincount(quantities).tolist()[1:] == [batches * 50] * workers
+    assert reader.kpis()["total_revenue"] == pytest.approx(10.0 * quantities.sum())
+
+    # Nenhum arquivo do manifesto foi sobrescrito ou apagado; um processo novo não apaga nada
+    view = PartitionedBackend(directory).snapshot()
+    assert all(os.path.exists(view.path(part)) for part in view.partitions)
+    assert sum(part.rows for part in view.partitions) == expected_rows
+    assert reader.count() == expected_rows
+
+
+def sales(rows: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "date": np.datetime_as_string(np.datetime64("2024-01-01") + rng.integers(0, 90, rows), unit="D").astype(object),
+        "product": np.array([f"Produto {i}" for i in rng.integers(0, 300, rows)], dtype=object),
+        "category": np.array([f"Categoria {i}" for i in rng.integers(0, 5, rows)], dtype=object),
+        "amount": np.round(rng.uniform(1, 500, rows), 2),
+        "quantity": rng.integers(1, 5, rows),
+        "customer": np.array([f"Cliente {i}" if i else None for i in rng.integers(0, 2000, rows)], dtype=object),
+    }
+
+
+def exact_answers(batches) -> tuple:
+    frame = pd.concat([pd.DataFrame(batch) for batch in batches])
+    frame["revenue"] = frame["amount"] * frame["quantity"]
+    categories = frame.groupby("category", sort=False).agg(
+        revenue=("revenue", "sum"), quantity=("quantity", "sum"), customers=("customer", "nunique"))
+    return categories, frame["product"].nunique(), frame["revenue"].to_numpy()
+
+
+def test_reads_merge_manifest_and_sketches_without_columns(tmp_path, monkeypatch):
+    """by_category, detail e percentis sem ler colunas; compactação e manifesto antigo"""
+    monkeypatch.setattr(partitions, "COMPACT_FILES", 4)
+    directory = str(tmp_path)
+    writer = PartitionedBackend(directory)
+    batches = [sales(300, seed) for seed in range(6)]
+    for batch in batches:
+        writer.append_columns(batch)
+    categories, products, tickets = exact_answers(batches)
+
+    def check(backend):
+        rows = {row["category"]: row for row in backend.by_category()}
+        assert set(rows) == set(categories.index)
+        for name, expected in categories.iterrows():
+            assert rows[name]["revenue"] == pytest.approx(expected["revenue"])
+            assert rows[name]["quantity"] == expected["quantity"]
+            assert abs(rows[name]["customers"] - expected["customers"]) <= 0.05 * expected["customers"]
+        assert abs(backend.detail()["unique_products"] - products) <= 0.05 * products
+        found = backend.ticket_percentiles((50, 90, 99))
+        ordered = np.sort(tickets)
+        for p, value in zip((50, 90, 99), found.values()):
+            rank = np.searchsorted(ordered, value) / (len(ordered) - 1)
+            assert abs(rank - p / 100) < 0.01
+        assert backend.cache.nbytes == 0
+
+    reader = PartitionedBackend(directory)
+    check(reader)
+    assert any(name.endswith(".stats.npz") for month in os.listdir(directory)
+               if os.path.isdir(tmp_path / month) for name in os.listdir(tmp_path / month))
+
+    # Diretório gravado antes dos sketches: totais e sketches calculados a partir das partições
+    with open(tmp_path / "manifest.json") as file:
+        manifest = json.load(file)
+    for entry in manifest["partitions"]:
+        del entry["categories"]
+        os.remove(stats_path(os.path.join(directory, entry["path"])))
+    with open(tmp_path / "manifest.json", "w") as file:
+        json.dump(manifest, file)
+    old = PartitionedBackend(directory)
+    old.cache.clear()
+    check(old)
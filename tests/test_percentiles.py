@@ -0,0 +1,73 @@
+"""Percentis do valor dos pedidos: mesma definição (interpolação linear) em todos os backends"""
+
+import numpy as np
+import pytest
+
+from app.api.database import SqlBackend
+from app.api.rollups import SalesRollups
+from app.api.sketches import TDigest
+from app.api.storage import MemoryBackend
+from app.api.store import SalesStore
+
+PERCENTILES = (0, 10, 25, 50, 90, 99, 100)
+
+
+def columns(rows: int, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "date": np.array(["2024-01-01", "2024-01-02"] * (rows // 2) + ["2024-01-03"] * (rows % 2), dtype=object),
+        "product": np.array([f"Produto {i % 5}" for i in range(rows)], dtype=object),
+        "category": np.array([f"Categoria {i % 3}" for i in range(rows)], dtype=object),
+        "amount": np.round(rng.uniform(1, 1000, rows), 2),
+        "quantity": np.ones(rows, dtype=np.int64),
+        "customer": np.array([f"Cliente {i}" for i in range(rows)], dtype=object),
+    }
+
+
+def memory_backend(tmp_path):
+    return MemoryBackend(SalesStore(), SalesRollups())
+
+
+def sql_backend(tmp_path):
+    return SqlBackend(f"sqlite:///{tmp_path / 'sales.db'}")
+
+
+def partitioned_backend(tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.api.partitions import PartitionedBackend
+    return PartitionedBackend(str(tmp_path / "partitions"))
+
+
+@pytest.mark.parametrize("factory", [memory_backend, sql_backend, partitioned_backend])
+@pytest.mark.parametrize("rows", [1, 2, 37, 150])
+def test_small_samples_match_numpy(tmp_path, factory, rows):
+    """Poucos pedidos: o t-digest, o SQLite e as partições dão exatamente o np.percentile"""
+    backend = factory(tmp_path)
+    batch = columns(rows)
+    backend.append_columns(batch)
+    expected = np.percentile(batch["amount"], PERCENTILES)
+    found = backend.ticket_percentiles(PERCENTILES)
+    # Arredondados a centavos: a ordem das contas pode mudar o último centavo
+    assert list(found) == [f"p{p}" for p in PERCENTILES]
+    assert list(found.values()) == pytest.approx(expected, abs=0.011)
+    backend.close()
+
+
+def test_empty_backend(tmp_path):
+    for factory in (memory_backend, sql_backend):
+        backend = factory(tmp_path)
+        assert backend.ticket_percentiles() == {"p50": None, "p90": None, "p99": None}
+        backend.close()
+
+
+def test_tdigest_rank_error_on_large_samples():
+    """Com muitos pontos (centróides agrupados), o posto do valor estimado fica a menos de 0,5% do pedido"""
+    values = np.random.default_rng(3).lognormal(4, 1, 200_000)
+    digest = TDigest()
+    for batch in np.array_split(values, 100):
+        digest.update(batch)
+    assert len(digest) < len(values) / 100
+    ordered = np.sort(values)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        rank = np.searchsorted(ordered, digest.quantile(q)) / (len(values) - 1)
+        assert abs(rank - q) < 0.005
@@ -0,0 +1,106 @@
+"""Store compartilhado entre processos (SHARED_STORE_DIR)"""
+
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from app.api import shared_store
+from app.api.shared_store import SEQ, SIZE, SHADOW, SharedSalesStore
+from app.api.store import records_to_columns
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SALES = [
+    {"date": "2024-01-01", "product": "Mouse", "category": "Eletrônicos", "amount": 150.0, "quantity": 2, "customer": "Ana"},
+    {"date": "2024-01-02", "product": "Cadeira", "category": "Móveis", "amount": 800.0, "quantity": 1, "customer": None},
+]
+
+
+@pytest.fixture(autouse=True)
+def quick_repair(monkeypatch):
+    monkeypatch.setattr(shared_store, "REPAIR_AFTER", 0.05)
+
+
+def test_other_store_sees_published_rows(tmp_path):
+    writer = SharedSalesStore(str(tmp_path), capacity=4)
+    writer.append_columns(**records_to_columns(SALES[:1]))
+    reader = SharedSalesStore(str(tmp_path), capacity=4)
+    writer.append_columns(**records_to_columns(SALES[1:]))
+    assert reader.changed()
+    assert reader.refresh() == 2
+    assert reader.records() == SALES
+
+
+def test_header_repaired_after_writer_dies_mid_publish(tmp_path):
+    store = SharedSalesStore(str(tmp_path), capacity=4)
+    store.append_columns(**records_to_columns(SALES))
+    # Escritor morto entre os dois incrementos do seq, com os campos pela metade
+    header = store._header
+    header[SEQ] += 1
+    header[SIZE] = 12345
+
+    reader = SharedSalesStore(str(tmp_path), capacity=4)
+    assert int(header[SEQ]) % 2 == 0
+    assert header[SIZE:SHADOW].tolist() == header[SHADOW:].tolist()
+    assert reader.records() == SALES
+    store.append_columns(**records_to_columns(SALES[:1]))
+    assert reader.refresh() == 3
+
+
+def test_header_repaired_after_killed_writer(tmp_path):
+    """Processo morto com SIGKILL segurando o flock e o seq ímpar"""
+    SharedSalesStore(str(tmp_path), capacity=4).append_columns(**records_to_columns(SALES))
+    script = textwrap.dedent(f"""
+        import os, signal, sys
+        sys.path.insert(0, {ROOT!r})
+        from app.api.shared_store import SEQ, SharedSalesStore
+        store = SharedSalesStore({str(tmp_path)!r})
+        with store.lock():
+            store._header[SEQ] += 1
+            os.kill(os.getpid(), signal.SIGKILL)
+    """)
+    process = subprocess.run([sys.executable, "-c", script])
+    assert process.returncode == -signal.SIGKILL
+
+    reader = SharedSalesStore(str(tmp_path), capacity=4)
+    assert reader.records() == SALES
+
+
+def test_dictionary_lines_of_killed_writer_are_discarded(tmp_path):
+    """Escritor morto depois de gravar textos novos e antes de publicar o cabeçalho"""
+    SharedSalesStore(str(tmp_path), capacity=4).append_columns(**records_to_columns(SALES))
+    script = textwrap.dedent(f"""
+        import os, signal, sys
+        sys.path.insert(0, {ROOT!r})
+        from app.api.shared_store import SharedSalesStore
+        from app.api.store import records_to_columns
+
+        # Morre na primeira escrita no cabeçalho, logo depois de gravar os dicionários
+        class Header:
+            def __init__(self, array):
+                self.array = array
+            def __getitem__(self, key):
+                return self.array[key]
+            def __setitem__(self, key, value):
+                os.kill(os.getpid(), signal.SIGKILL)
+
+        store = SharedSalesStore({str(tmp_path)!r})
+        store._header = Header(store._header)
+        store.append_columns(**records_to_columns([dict({SALES[0]!r}, product="Órfão", customer="Órfã")]))
+    """)
+    process = subprocess.run([sys.executable, "-c", script])
+    assert process.returncode == -signal.SIGKILL
+    with open(tmp_path / "products.jsonl", encoding="utf-8") as file:
+        assert "Órfão" in file.read()
+
+    reader = SharedSalesStore(str(tmp_path), capacity=4)
+    writer = SharedSalesStore(str(tmp_path), capacity=4)
+    added = [dict(SALES[0], product="Teclado", customer="Bruno")]
+    writer.append_columns(**records_to_columns(added))
+    assert reader.refresh() == 3
+    assert reader.records() == SALES + added
+    assert SharedSalesStore(str(tmp_path), capacity=4).records() == SALES + added
@@ -0,0 +1,51 @@
+"""Sketches por dia: memória só para dias com vendas; datas implausíveis recusadas na ingestão"""
+
+import numpy as np
+import pytest
+
+from app.api.rollups import SalesRollups
+from app.api.sketches import HLL_REGISTERS
+from app.api.storage import MemoryBackend
+from app.api.store import SalesStore, coerce_days, day_number, parse_days
+
+
+def sales(dates, customers) -> dict:
+    rows = len(dates)
+    return {
+        "date": np.array(dates, dtype=object),
+        "product": np.array(["Produto"] * rows, dtype=object),
+        "category": np.array(["Categoria"] * rows, dtype=object),
+        "amount": np.full(rows, 10.0),
+        "quantity": np.ones(rows, dtype=np.int64),
+        "customer": np.array(customers, dtype=object),
+    }
+
+
+def test_distant_days_only_use_registers_for_days_with_sales():
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    backend.append_columns(sales(["2024-06-01", "2024-06-01", "2024-06-03"], ["Ana", "Bruno", "Ana"]))
+    backend.append_columns(sales(["1970-01-02", "2100-12-30"], ["Carla", "Davi"]))
+    sketches = backend.snapshot().rollups.sketches
+    assert len(sketches.days) == 4
+    assert sketches.day_customers.nbytes <= 2 * 4 * HLL_REGISTERS
+
+    assert sketches.distinct_customers() == 4
+    assert sketches.distinct_customers(day_number("2024-06-01"), day_number("2024-06-03")) == 2
+    assert sketches.distinct_customers(day_number("2024-06-02"), day_number("2024-06-03")) == 1
+    assert sketches.distinct_customers(day_number("2024-06-02"), day_number("2024-06-02")) == 0
+    assert sketches.distinct_customers(None, day_number("2000-01-01")) == 1
+    assert backend.rebuild() == []
+
+
+@pytest.mark.parametrize("date", ["1900-01-01", "0001-01-01", "2101-01-01", "9999-12-31"])
+def test_implausible_dates_are_rejected(date):
+    with pytest.raises(ValueError, match="fora de"):
+        parse_days(["2024-01-01", date])
+    _, valid = coerce_days(["2024-01-01", date])
+    assert valid.tolist() == [True, False]
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    with pytest.raises(ValueError):
+        backend.append_columns(sales([date], ["Ana"]))
+    assert backend.count() == 0
+    # Filtros de consulta aceitam qualquer data válida
+    assert day_number(date) == parse_days([date], bounded=False)[0]
@@ -0,0 +1,82 @@
+"""SqlBackend em SQLite: gravação em lote e leitura de volta para o store"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from app.api.database import SqlBackend, insert_sales_frame
+from app.api.store import SalesStore, records_to_columns
+
+RECORDS = [
+    {"date": "2024-01-01", "product": "Notebook", "category": "Eletrônicos", "amount": 10.005, "quantity": 3, "customer": "Ana"},
+    {"date": "2024-01-01", "product": "Mouse", "category": "Eletrônicos", "amount": 0.1, "quantity": 7, "customer": None},
+    {"date": "2024-01-02", "product": "Cadeira", "category": "Móveis", "amount": 799.99, "quantity": 1, "customer": "Ana"},
+    {"date": "2024-01-03", "product": "Notebook", "category": "Eletrônicos", "amount": 3500.0, "quantity": 2, "customer": "Bruno"},
+]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SqlBackend(f"sqlite:///{tmp_path / 'sales.db'}")
+    yield backend
+    backend.close()
+
+
+def reload(backend) -> SalesStore:
+    store = SalesStore()
+    for columns in backend.iter_columns(chunk_rows=3):
+        store.append_columns(**columns)
+    return store
+
+
+def test_round_trip_keeps_unit_amount(backend):
+    assert backend.append_columns(records_to_columns(RECORDS)) == len(RECORDS)
+    assert backend.count() == len(RECORDS)
+    assert reload(backend).records(0, len(RECORDS)) == RECORDS
+
+
+def test_aggregates_match_memory_store(backend):
+    backend.append_columns(records_to_columns(RECORDS))
+    store = reload(backend)
+    kpis = backend.kpis()
+    assert kpis["total_orders"] == len(RECORDS)
+    assert kpis["total_quantity"] == int(store.column("quantity").sum())
+    totals = np.round(store.column("amount") * store.column("quantity"), 2)
+    assert kpis["total_revenue"] == pytest.approx(totals.sum())
+    assert backend.detail()["average_amount"] == pytest.approx(np.mean([r["amount"] for r in RECORDS]))
+
+
+def test_rows_without_amount_use_total(tmp_path):
+    """Vendas gravadas antes da coluna amount: a coluna é criada e o valor vem de total / quantidade"""
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(100), category VARCHAR(50), "
+                             "price NUMERIC(10, 2), created_at DATETIME)")
+        conn.exec_driver_sql("CREATE TABLE sales (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER, "
+                             "total_amount NUMERIC(12, 2), sale_date DATE, customer_id INTEGER, created_at DATETIME)")
+        conn.exec_driver_sql("INSERT INTO products (id, name, category, price) VALUES (1, 'Mouse', 'Eletrônicos', 150)")
+        conn.exec_driver_sql("INSERT INTO sales (product_id, quantity, total_amount, sale_date) VALUES (1, 4, 600, '2024-01-01')")
+    engine.dispose()
+
+    backend = SqlBackend(url)
+    try:
+        backend.append_columns(records_to_columns(RECORDS[:1]))
+        rows = reload(backend).records(0, 2)
+        assert [row["amount"] for row in rows] == [150.0, 10.005]
+        assert backend.detail()["average_amount"] == pytest.approx((150.0 + 10.005) / 2)
+    finally:
+        backend.close()
+
+
+def test_insert_sales_frame_executemany(backend):
+    backend.append_columns(records_to_columns(RECORDS))
+    extra = pd.DataFrame({
+        "product_id": [1], "quantity": [2], "amount": [1.005], "total_amount": [2.01],
+        "sale_date": ["2024-01-04"], "customer_id": pd.Series([None], dtype="Int64"),
+    })
+    with backend.engine.begin() as conn:
+        insert_sales_frame(conn, extra)
+    rows = reload(backend).records(0, len(RECORDS) + 1)
+    assert rows[-1]["amount"] == 1.005 and rows[-1]["customer"] is None
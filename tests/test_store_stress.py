@@ -0,0 +1,38 @@
+"""Leitores e escritores simultâneos no MemoryBackend (versão curta de scripts/stress_store.py)"""
+
+import os
+import sys
+
+from app.api.rollups import SalesRollups
+from app.api.storage import MemoryBackend
+from app.api.store import SalesStore
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
+
+from bench_store import synthetic_columns  # noqa: E402
+from stress_store import Expected, run_phase  # noqa: E402
+
+BATCH_ROWS = 500
+SECONDS = 2.0
+
+
+def test_reads_stay_consistent_during_ingest():
+    """Nenhuma leitura vê lote pela metade; a vazão de leitura durante a ingestão é informada (-s)"""
+    backend = MemoryBackend(SalesStore(), SalesRollups())
+    backend.append_columns(synthetic_columns(50_000, seed=1))
+    batch = synthetic_columns(BATCH_ROWS, seed=2)
+    expected = Expected(backend, batch)
+
+    idle_reads, _, errors = run_phase(backend, expected, batch, SECONDS / 2, readers=4, writers=0, scan_every=10)
+    reads, batches, found = run_phase(backend, expected, batch, SECONDS, readers=4, writers=2, scan_every=10)
+    errors += found
+    assert errors == []
+    assert batches > 0
+    assert backend.snapshot().rollups.orders == expected.orders + batches * BATCH_ROWS
+    assert backend.rebuild() == []
+
+    idle_rate, read_rate = idle_reads / (SECONDS / 2), reads / SECONDS
+    print(f"\nleituras/s: {idle_rate:,.0f} sem escritas, {read_rate:,.0f} durante a ingestão "
+          f"({read_rate / idle_rate:.0%}); {batches * BATCH_ROWS / SECONDS:,.0f} vendas/s")
+    # Leitores não esperam os escritores (sem lock na leitura): só dividem a CPU com eles
+    assert read_rate > 0.25 * idle_rate
@@ -0,0 +1,252 @@
+"""WAL e snapshots do store em memória (DATA_DIR): recuperação depois de processos mortos"""
+
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.api.rollups import SalesRollups
+from app.api.shared_store import SharedSalesStore
+from app.api.storage import MemoryBackend
+from app.api.wal import Journal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BATCH_ROWS = 500
+
+# Processo que grava lotes até ser morto e escreve "ack <lote>" depois de cada confirmação.
+# O lote é identificável pela quantidade (= número do lote) e traz produtos e clientes novos.
+WRITER = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, sys.argv[1])
+    import numpy as np
+    from app.api.rollups import SalesRollups
+    from app.api.shared_store import SharedSalesStore
+    from app.api.storage import MemoryBackend
+    from app.api.store import day_to_iso
+    from app.api.wal import Journal
+
+    data_dir, shared_dir, first, rows, snapshot_bytes = sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]), int(sys.argv[6])
+    journal = Journal(data_dir, snapshot_bytes=snapshot_bytes)
+    if shared_dir:
+        store = SharedSalesStore(shared_dir)
+        with store.lock():
+            store.refresh()
+            rollups = journal.recover_shared(store)
+    else:
+        store, rollups = journal.recover()
+    backend = MemoryBackend(store, rollups or SalesRollups(), journal=journal)
+    if rollups is None:
+        backend.rebuild()
+    journal.attach(backend)
+    for number in range(first, 1 << 30):
+        rng = np.random.default_rng(number)
+        product = rng.integers(0, 50, rows) + number * 10
+        backend.append_columns({
+            "date": day_to_iso(19_000 + rng.integers(0, 365, rows)).astype(object),
+            "product": np.array([f"Produto {i}" for i in product], dtype=object),
+            "category": np.array([f"Categoria {i % 20}" for i in product], dtype=object),
+            "amount": np.round(rng.uniform(5, 500, rows), 2),
+            "quantity": np.full(rows, number, dtype=np.int64),
+            "customer": np.array([f"Cliente {number}-{i}" for i in rng.integers(0, 100, rows)], dtype=object),
+        })
+        sys.stdout.write(f"ack {number}\\n")
+        sys.stdout.flush()
+""")
+
+
+def start_writer(data_dir, first: int, shared_dir: str = "", snapshot_bytes: int = 256 * 1024):
+    process = subprocess.Popen(
+        [sys.executable, "-c", WRITER, ROOT, str(data_dir), str(shared_dir), str(first), str(BATCH_ROWS), str(snapshot_bytes)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    # Confirmações lidas numa thread enquanto o processo grava
+    process.acked = []
+    process.reader = threading.Thread(target=read_acks, args=(process,), daemon=True)
+    process.reader.start()
+    return process
+
+
+def read_acks(process):
+    for line in process.stdout:
+        if line.startswith("ack "):
+            process.acked.append(int(line.split()[1]))
+
+
+def wait_acks(process, count: int, timeout: float = 60.0):
+    """Espera o processo confirmar `count` lotes desde o início (a importação pode demorar num início a frio)"""
+    deadline = time.monotonic() + timeout
+    while len(process.acked) < count:
+        if process.poll() is not None:
+            pytest.fail(f"escritor terminou com código {process.returncode} após {len(process.acked)} lotes")
+        if time.monotonic() > deadline:
+            pytest.fail(f"escritor confirmou {len(process.acked)} de {count} lotes em {timeout:.0f}s")
+        time.sleep(0.01)
+
+
+def kill(process) -> set:
+    """Mata com SIGKILL; lotes confirmados antes da morte"""
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+    process.reader.join()
+    process.stdout.close()
+    return set(process.acked)
+
+
+def batches(store) -> dict:
+    numbers, counts = np.unique(store.column("quantity"), return_counts=True)
+    return dict(zip(numbers.tolist(), counts.tolist()))
+
+
+def assert_consistent(store, rollups: SalesRollups, acked: set):
+    """Só lotes inteiros, todos os confirmados presentes e agregados iguais aos recalculados"""
+    found = batches(store)
+    assert all(count == BATCH_ROWS for count in found.values()), "lote pela metade"
+    assert acked <= set(found), f"lotes confirmados ausentes: {sorted(acked - set(found))[:10]}"
+    assert rollups.verify(store) == []
+
+
+def recover(data_dir):
+    journal = Journal(str(data_dir))
+    store, rollups = journal.recover()
+    return journal, store, rollups
+
+
+def test_recovers_after_kill(tmp_path):
+    """Processo morto com SIGKILL várias vezes no meio das gravações, snapshots e trocas de segmento"""
+    data_dir = tmp_path / "data"
+    acked, first = set(), 1
+    for _ in range(3):
+        writer = start_writer(data_dir, first)
+        # Lotes suficientes para passar de snapshot_bytes (snapshot e troca de segmento)
+        wait_acks(writer, 25)
+        acked |= kill(writer)
+        journal, store, rollups = recover(data_dir)
+        assert_consistent(store, rollups, acked)
+        journal.close(snapshot=False)
+        first = max(batches(store)) + 1
+    assert len(acked) > 10
+    assert any(name.startswith("snapshot-") for name in os.listdir(data_dir))
+
+
+def write_batches(data_dir, numbers):
+    """Grava lotes num processo (sem morte) e fecha sem snapshot: tudo fica no WAL"""
+    journal = Journal(str(data_dir))
+    store, rollups = journal.recover()
+    backend = MemoryBackend(store, rollups, journal=journal)
+    journal.attach(backend)
+    for number in numbers:
+        rng = np.random.default_rng(number)
+        backend.append_columns({
+            "date": np.array(["2024-01-01", "2024-03-15"] * (BATCH_ROWS // 2), dtype=object),
+            "product": np.array([f"Produto {number}-{i % 7}" for i in range(BATCH_ROWS)], dtype=object),
+            "category": np.array(["Categoria"] * BATCH_ROWS, dtype=object),
+            "amount": np.round(rng.uniform(5, 500, BATCH_ROWS), 2),
+            "quantity": np.full(BATCH_ROWS, number, dtype=np.int64),
+            "customer": np.array([f"Cliente {number}"] * BATCH_ROWS, dtype=object),
+        })
+    journal.close(snapshot=False)
+
+
+@pytest.mark.parametrize("damage", ["cut", "corrupt"])
+def test_damaged_tail_record_is_dropped(tmp_path, damage):
+    """Último registro cortado (escrita interrompida) ou com um byte trocado: só o último lote some"""
+    data_dir = tmp_path / "data"
+    write_batches(data_dir, [1, 2])
+    segment = data_dir / max(name for name in os.listdir(data_dir) if name.startswith("wal-"))
+    size = segment.stat().st_size
+    with open(segment, "r+b") as file:
+        if damage == "cut":
+            file.truncate(size - 100)
+        else:
+            file.seek(size - 100)
+            byte = file.read(1)
+            file.seek(-1, os.SEEK_CUR)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+    journal, store, rollups = recover(data_dir)
+    assert batches(store) == {1: BATCH_ROWS}
+    assert rollups.verify(store) == []
+    assert segment.stat().st_size < size - 100
+    journal.close(snapshot=False)
+
+    # Depois de descartar o fim, o WAL continua gravando normalmente
+    write_batches(data_dir, [3])
+    journal, store, rollups = recover(data_dir)
+    assert batches(store) == {1: BATCH_ROWS, 3: BATCH_ROWS}
+    assert store.records(BATCH_ROWS, BATCH_ROWS + 1)[0]["product"] == "Produto 3-0"
+    assert rollups.verify(store) == []
+    journal.close(snapshot=False)
+
+
+def test_shared_store_recovers_from_wal(tmp_path):
+    """Vários workers no store compartilhado, mortos no meio das gravações; o store (tmpfs) some no reinício"""
+    data_dir, shared_dir = tmp_path / "data", tmp_path / "shm"
+    writers = [start_writer(data_dir, first, shared_dir) for first in (1, 1_000_001, 2_000_001)]
+    for writer in writers:
+        wait_acks(writer, 5)
+    # Um worker morre enquanto os outros continuam gravando depois dele
+    acked = kill(writers[0])
+    for writer in writers[1:]:
+        wait_acks(writer, len(writer.acked) + 5)
+        acked |= kill(writer)
+    assert len(acked) > 10
+
+    shared = SharedSalesStore(str(shared_dir))
+    published = batches(shared)
+    assert all(count == BATCH_ROWS for count in published.values())
+    assert acked <= set(published)
+
+    # Reinício: store compartilhado vazio, recuperado do DATA_DIR pelo primeiro worker
+    shutil.rmtree(shared_dir)
+    journal = Journal(str(data_dir))
+    store = SharedSalesStore(str(shared_dir))
+    with store.lock():
+        store.refresh()
+        rollups = journal.recover_shared(store)
+    assert_consistent(store, rollups, acked)
+    assert set(published) <= set(batches(store))
+
+    # Um segundo worker só retoma o WAL; o que ele grava também é recuperável
+    writer = start_writer(data_dir, 3_000_001, shared_dir)
+    wait_acks(writer, 10)
+    acked |= kill(writer)
+    journal.close(snapshot=False)
+    shutil.rmtree(shared_dir)
+    store = SharedSalesStore(str(shared_dir))
+    journal = Journal(str(data_dir))
+    with store.lock():
+        store.refresh()
+        rollups = journal.recover_shared(store)
+    assert_consistent(store, rollups, acked)
+    assert any(number > 3_000_000 for number in batches(store))
+    journal.close(snapshot=False)
+
+
+def test_shared_store_without_wal_history_takes_snapshot(tmp_path):
+    """DATA_DIR novo para um store compartilhado que já tem vendas: o WAL começa com um snapshot"""
+    shared_dir = str(tmp_path / "shm")
+    writer = start_writer(tmp_path / "old", 1, shared_dir)
+    wait_acks(writer, 10)
+    acked = kill(writer)
+
+    store = SharedSalesStore(shared_dir)
+    journal = Journal(str(tmp_path / "data"))
+    with store.lock():
+        store.refresh()
+        assert journal.recover_shared(store) is None
+    backend = MemoryBackend(store, SalesRollups(), journal=journal)
+    backend.rebuild()
+    journal.attach(backend)
+    assert journal.snapshot_rows == len(store)
+    journal.close(snapshot=False)
+
+    restored, rollups = Journal(str(tmp_path / "data")).recover()
+    assert_consistent(restored, rollups, acked)
+    assert len(restored) == len(store)